@@ -5,6 +5,10 @@ import shell from 'shelljs'
 shell.mkdir('-p', './ui/lib/generated/generator');
 shell.cp('-fr', './src/generator/ui/types.ts', './ui/lib/generated/generator/types.ts');
 
+// Timeline solver, shared with the language server
+shell.mkdir('-p', './ui/lib/generated/lib');
+shell.cp('-fr', './src/lib/timeline-solver.ts', './ui/lib/generated/lib/timeline-solver.ts');
+
 // Special validator
 shell.mkdir('-p', './ui/lib/generated/validators');
 shell.cp('-fr', './src/language-server/validators/special-validators.ts', './ui/lib/generated/validators/special-validators.ts');
@@ -0,0 +1,94 @@
+import { Reference } from 'langium';
+import {
+    AudioElement,
+    AudioOption,
+    Element,
+    GroupOption,
+    isAudioElement,
+    isTextualElement,
+    isVideoElement,
+    isVideoTransition,
+    TextOption,
+    TextualElement,
+    VideoElement,
+    VideoOption,
+    VideoProject,
+} from '../language-server/generated/ast.js';
+
+type ElementOption = VideoOption | TextOption | AudioOption;
+
+/**
+ * Options of every element, merged with the group options applying to it. Built in one pass over the group
+ * options, without modifying the AST: the options declared with the element are prioritized, then those of
+ * the groups in their order in the document, one option of each kind.
+ */
+export class ElementOptionsIndex {
+    private readonly options = new Map<Element, readonly ElementOption[]>();
+
+    constructor(videoProject: VideoProject) {
+        // Group options applying to each element, by kind of group and element name
+        const groupOptions = new Map<string, GroupOption[]>();
+        videoProject.groupOptions.forEach((groupOption) => {
+            (groupOption.elements as Reference<Element>[]).forEach((element) => {
+                const name = element.ref?.name;
+                if (!name) return;
+                const key = `${groupOption.$type}:${name}`;
+                const elementGroupOptions = groupOptions.get(key) ?? [];
+                // An element listed twice in a group gets its options once
+                if (elementGroupOptions[elementGroupOptions.length - 1] !== groupOption) {
+                    elementGroupOptions.push(groupOption);
+                }
+                groupOptions.set(key, elementGroupOptions);
+            });
+        });
+
+        videoProject.elements.forEach((element) => {
+            const mergedOptions: ElementOption[] = [
+                ...(element.options || []), // Element options
+                ...(groupOptions.get(`${getGroupOptionType(element)}:${element.name}`) ?? []).flatMap((groupOption) => groupOption.options as ElementOption[]), // Group options
+            ];
+            this.options.set(element, Object.freeze(mergeOptions(element, mergedOptions)));
+        });
+    }
+
+    video(video: VideoElement): readonly VideoOption[] {
+        return (this.options.get(video) ?? video.options) as readonly VideoOption[];
+    }
+
+    text(text: TextualElement): readonly TextOption[] {
+        return (this.options.get(text) ?? text.options) as readonly TextOption[];
+    }
+
+    audio(audio: AudioElement): readonly AudioOption[] {
+        return (this.options.get(audio) ?? audio.options) as readonly AudioOption[];
+    }
+
+    get(element: Element): readonly ElementOption[] {
+        return this.options.get(element) ?? element.options;
+    }
+}
+
+function getGroupOptionType(element: Element): GroupOption['$type'] | undefined {
+    if (isVideoElement(element)) return 'GroupOptionVideo';
+    if (isTextualElement(element)) return 'GroupOptionText';
+    if (isAudioElement(element)) return 'GroupOptionAudio';
+    return undefined;
+}
+
+function mergeOptions(element: Element, options: ElementOption[]): ElementOption[] {
+    // Filters the duplicates, the first option of each kind is kept (a fade in and a fade out are different kinds)
+    const uniqueOptionMap = new Map<string, ElementOption>();
+    options.forEach((option) => {
+        const kind = isVideoElement(element) && isVideoTransition(option) ? option.type : option.$type;
+        if (!uniqueOptionMap.has(kind)) {
+            uniqueOptionMap.set(kind, option);
+        }
+    });
+
+    // Map to array and sort for some special cases
+    const order = isVideoElement(element) ? ['VideoResolution', 'VisualElementSize', 'VisualElementPosition']
+        : isTextualElement(element) ? ['VisualElementSize', 'VisualElementPosition']
+        : isAudioElement(element) ? ['AudioVolume', 'AudioFadeIn', 'AudioFadeOut', 'AudioStereoVolume']
+        : [];
+    return Array.from(uniqueOptionMap.values()).sort((a, b) => order.indexOf(a.$type) - order.indexOf(b.$type));
+}
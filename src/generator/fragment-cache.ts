@@ -0,0 +1,52 @@
+import { AstNode } from 'langium';
+import { Element, isAudioExtract, isVideoExtract } from '../language-server/generated/ast.js';
+import { ElementOptionsIndex } from './element-options.js';
+
+/**
+ * Fragments generated for the previous version of the document, by key. An edit only generates again the
+ * fragments whose key changed, the others are reused. The fragments not used by a generation are dropped
+ * at its end.
+ */
+export class FragmentCache<T> {
+    private previous = new Map<string, T>();
+    private current = new Map<string, T>();
+
+    get(key: string | undefined, generate: () => T): T {
+        if (key === undefined) return generate();
+
+        let fragment = this.current.get(key) ?? this.previous.get(key);
+        if (fragment === undefined) {
+            fragment = generate();
+        }
+        this.current.set(key, fragment);
+        return fragment;
+    }
+
+    endGeneration() {
+        this.previous = this.current;
+        this.current = new Map();
+    }
+}
+
+/**
+ * Key of everything the code of an element depends on: its text, its merged options (which hold the group
+ * options applying to it, when an index is given) and the key of its source. Undefined for nodes without
+ * text (built in code).
+ */
+export function getElementKey(element: Element | undefined, keys = new Map<Element, string | undefined>(), elementOptions?: ElementOptionsIndex): string | undefined {
+    if (!element) return '';
+    if (keys.has(element)) return keys.get(element);
+
+    const options = elementOptions?.get(element) ?? element.options;
+    const texts = [element.$type, getNodeText(element), ...(options as readonly AstNode[]).map(getNodeText)];
+    if (isVideoExtract(element) || isAudioExtract(element)) {
+        texts.push(getElementKey(element.source.ref, keys, elementOptions));
+    }
+    const key = texts.some((text) => text === undefined) ? undefined : texts.join('\n');
+    keys.set(element, key);
+    return key;
+}
+
+export function getNodeText(node: AstNode | undefined): string | undefined {
+    return node?.$cstNode?.text;
+}
@@ -1,15 +1,10 @@
+import { AstNode } from 'langium';
 import { CompositeGeneratorNode, NL, toString } from 'langium/generate';
 import {
     VideoProject,
     isVideoElement,
-    GroupOptionVideo,
-    isGroupOptionVideo,
     isTextualElement,
-    GroupOptionText,
-    isGroupOptionText,
     isAudioElement,
-    GroupOptionAudio,
-    isGroupOptionAudio,
     FixedTimelineElement,
     RelativeTimelineElement,
     TimelineElement,
@@ -17,58 +12,125 @@ import {
     isRelativeTimelineElement,
     isVideoExtract,
     isVideoOriginal,
+    isAudioExtract,
+    VideoElement,
+    Element,
 } from '../language-server/generated/ast.js';
-import { compileVideo, populateVideoElements } from './video-generator.js';
-import { compileTextualElement, populateTextualElements } from './text-generator.js';
-import { compileAudio, populateAudioElements } from './audio-generator.js';
-import { helperTimeToSeconds, getLayer, getTimelineElementTextualDuration } from '../lib/helper.js';
+import { compileVideo, getUntouchedSource } from './video-generator.js';
+import { FragmentCache, getElementKey, getNodeText } from './fragment-cache.js';
+import { compileTextualElement } from './text-generator.js';
+import { compileAudio } from './audio-generator.js';
+import { ElementOptionsIndex } from './element-options.js';
+import { FINAL_RENDER, getFrameSize, RenderSettings } from './render-settings.js';
+import { helperTimeToSeconds, getTimelineElementTextualDuration, getTimelinePlacement } from '../lib/helper.js';
+import { solveTimeline } from '../lib/timeline-solver.js';
 
 function formatTimelineElementName(name: string | undefined): string {
     if (!name) throw new Error('Timeline element name is missing');
     return `timeline_element_${name.slice(1)}`;
 }
 
-export function generatePythonProgram(videoProject: VideoProject): string {
+// Code of the elements and timeline elements of the previous generation, reused when they didn't change,
+// by render settings (the final and preview programs are generated after every edit)
+const pythonFragmentsBySettings = new Map<string, FragmentCache<string>>();
+
+export function generatePythonProgram(videoProject: VideoProject, settings: RenderSettings = FINAL_RENDER): string {
+    let pythonFragments = pythonFragmentsBySettings.get(settings.name);
+    if (!pythonFragments) {
+        pythonFragments = new FragmentCache<string>();
+        pythonFragmentsBySettings.set(settings.name, pythonFragments);
+    }
     const fileNode = new CompositeGeneratorNode();
-    compile(videoProject, fileNode)
+    compile(videoProject, settings, pythonFragments, fileNode)
+    pythonFragments.endGeneration();
     return toString(fileNode);
 }
 
+function appendFragment(fileNode: CompositeGeneratorNode, pythonFragments: FragmentCache<string>, key: string | undefined, compileFragment: (fragmentNode: CompositeGeneratorNode) => void) {
+    fileNode.append(pythonFragments.get(key, () => {
+        const fragmentNode = new CompositeGeneratorNode();
+        compileFragment(fragmentNode);
+        return toString(fragmentNode);
+    }));
+}
+
 
-function compile(videoProject:VideoProject, fileNode:CompositeGeneratorNode){
+function compile(videoProject:VideoProject, settings: RenderSettings, pythonFragments: FragmentCache<string>, fileNode:CompositeGeneratorNode){
     fileNode.append(
 `import moviepy
+from videoml_runtime import ColorCorrection, TimelineCompositeVideoClip, animated_text_clip, open_audio, open_video, render_audio, render_video, text_clip
+from videoml_runtime import audio_delay, audio_extract, audio_fade_in, audio_fade_out, audio_normalize, audio_volume, mix_audio
 `, NL);
 
-    const videoElements = videoProject.elements.filter(isVideoElement);
-    const groupVideoOptions: GroupOptionVideo[] = videoProject.groupOptions.filter(isGroupOptionVideo);
-    const populatedVideoElements = populateVideoElements(videoElements, groupVideoOptions);
-    populatedVideoElements.forEach((video) => compileVideo(video, fileNode));
+    // Merge the group options first, they decide which sources the extracts read
+    const elementOptions = new ElementOptionsIndex(videoProject);
 
-    const textualElements = videoProject.elements.filter(isTextualElement);
-    const groupTextOptions: GroupOptionText[] = videoProject.groupOptions.filter(isGroupOptionText);
-    const populatedTextualElements = populateTextualElements(textualElements, groupTextOptions);
-    populatedTextualElements.forEach((text) => compileTextualElement(text, fileNode));
+    // Only compile the elements the timeline needs, the others would open their sources for nothing
+    // Elements and timeline elements whose text didn't change since the previous generation reuse its code
+    const reachableElements = getReachableElements(videoProject, elementOptions);
+    const elementKeys = new Map<Element, string | undefined>();
+    videoProject.elements.filter(isVideoElement).filter((video) => reachableElements.has(video))
+        .forEach((video) => appendFragment(fileNode, pythonFragments, getElementKey(video, elementKeys, elementOptions), (node) => compileVideo(video, elementOptions, settings, node)));
+    videoProject.elements.filter(isTextualElement).filter((text) => reachableElements.has(text))
+        .forEach((text) => appendFragment(fileNode, pythonFragments, getElementKey(text, elementKeys, elementOptions), (node) => compileTextualElement(text, elementOptions, settings, node)));
+    videoProject.elements.filter(isAudioElement).filter((audio) => reachableElements.has(audio))
+        .forEach((audio) => appendFragment(fileNode, pythonFragments, getElementKey(audio, elementKeys, elementOptions), (node) => compileAudio(audio, elementOptions, node)));
 
-    const audioElements = videoProject.elements.filter(isAudioElement);
-    const groupAudioOptions: GroupOptionAudio[] = videoProject.groupOptions.filter(isGroupOptionAudio);
-    const populatedAudioElements = populateAudioElements(audioElements, groupAudioOptions);
-    populatedAudioElements.forEach((audio) => compileAudio(audio, fileNode));
-    
 
     // Compile timeline elements (placement, duration)
-    videoProject.timelineElements.forEach((te) => compileTimelineElement(te, fileNode, videoProject));
+    videoProject.timelineElements.forEach((te) => appendFragment(fileNode, pythonFragments, getTimelineElementKey(te, videoProject), (node) => compileTimelineElement(te, node, videoProject)));
 
-    // Compile the final video (concatenation)
-    compileTimelineElementsOrdered(videoProject, fileNode);
+    // Compile the final video (concatenation), or only the final audio of the projects without visual elements
+    if (!compileTimelineElementsOrdered(videoProject, settings, fileNode)) {
+        fileNode.append(
+`# Export the final audio, there is no frame to render
+render_audio(final_audio, "${videoProject.outputName}${settings.outputSuffix}.mp3")`, NL);
+        return;
+    }
     
-    // Export the final video
+    // List the timeline elements that can be copied from their source file (the sources of a preview have
+    // another size and frame rate)
+    const hasPassthrough = settings.scale === 1 && settings.fps === undefined && compilePassthroughTimelineElements(videoProject, elementOptions, fileNode);
+
+    // Describe the inputs of the visual timeline elements, to reuse the parts rendered by previous runs
+    compileRenderInputs(videoProject, elementOptions, pythonFragments, fileNode);
+
+    // Export the final video (split across worker processes when VIDEOML_WORKERS > 1)
+    const encoding = `${settings.fps ? `, fps=${settings.fps}` : ''}${settings.preset ? `, preset="${settings.preset}"` : ''}`;
     fileNode.append(
 `# Export the final video
-final_video.write_videofile("${videoProject.outputName}.mp4")`, NL);
+render_video(final_video, "${videoProject.outputName}${settings.outputSuffix}.mp4", program=__file__${hasPassthrough ? ', passthrough=passthrough' : ''}, render_inputs=render_inputs${encoding})`, NL);
 }
 
 
+/**
+ * Elements placed on the timeline, and the elements their program reads from: the source of an extract,
+ * unless the extract is read from the source file directly.
+ */
+function getReachableElements(videoProject: VideoProject, elementOptions: ElementOptionsIndex): Set<Element> {
+    const reachable = new Set<Element>();
+    const visit = (element: Element | undefined) => {
+        if (!element || reachable.has(element)) return;
+        reachable.add(element);
+        if (isVideoExtract(element) && !getUntouchedSource(element.source.ref, elementOptions)) {
+            visit(element.source.ref);
+        } else if (isAudioExtract(element)) {
+            visit(element.source.ref);
+        }
+    };
+    videoProject.timelineElements.forEach((te) => visit(te.element.ref));
+    return reachable;
+}
+
+
+// Everything the code of a timeline element depends on, see compileTimelineElement
+function getTimelineElementKey(te: TimelineElement, videoProject: VideoProject): string | undefined {
+    const text = getNodeText(te);
+    if (text === undefined) return undefined;
+    const previousElement = te.$containerIndex ? videoProject.timelineElements[te.$containerIndex - 1] : undefined;
+    return ['TimelineElement', text, te.$containerIndex, previousElement?.name, te.element.ref?.$type].join('\n');
+}
+
 function compileTimelineElement(te: TimelineElement, fileNode: CompositeGeneratorNode, videoProject: VideoProject) {
     fileNode.append(`${formatTimelineElementName(te.name)} = `);
     if (isRelativeTimelineElement(te)) {
@@ -119,9 +181,14 @@ function compileTimelineElementTextualDuration(duration: string | undefined, fil
     fileNode.append(`.with_duration(${helperTimeToSeconds(getTimelineElementTextualDuration(duration))})`);
 }
 
-function compileTimelineElementsOrdered(videoProject: VideoProject, fileNode: CompositeGeneratorNode) {
+/**
+ * Compiles the final video, or only the final audio when no timeline element is visual.
+ * Returns whether there is a final video.
+ */
+function compileTimelineElementsOrdered(videoProject: VideoProject, settings: RenderSettings, fileNode: CompositeGeneratorNode): boolean {
     // Calculate layer for each timeline element
-    const layeredTimelineElements = videoProject.timelineElements.map((te) => ({ te, layer: getLayer(te) }));
+    const placements = solveTimeline(videoProject.timelineElements.map((te) => getTimelinePlacement(te)));
+    const layeredTimelineElements = videoProject.timelineElements.map((te, index) => ({ te, layer: placements[index].layer }));
 
     // Sort by layer
     const orderedTimelineElements = layeredTimelineElements.sort((a, b) => a.layer - b.layer);
@@ -137,21 +204,97 @@ function compileTimelineElementsOrdered(videoProject: VideoProject, fileNode: Co
         .join(', ');
     
 
+    const hasAudioElements = videoProject.timelineElements.some(te => isAudioElement(te.element.ref));
+    if (hasAudioElements) {
+        fileNode.append(
+`# Mix all audios, each source is decoded once
+final_audio = mix_audio([${timelineElementsAudioJoined}])
+`, NL);
+    }
+
+    // Audio only project (podcast...): no black frames to render and encode
+    if (!timelineElementsVideoJoined && hasAudioElements) return false;
+
+    const frameSize = getFrameSize(settings);
     fileNode.append(
 `# Concatenate all clips
-final_video = moviepy.CompositeVideoClip([${timelineElementsVideoJoined}], size=(1920, 1080))
+final_video = TimelineCompositeVideoClip([${timelineElementsVideoJoined}], size=(${frameSize.width}, ${frameSize.height}))
 `, NL);
 
-    if (videoProject.timelineElements.some(te => isAudioElement(te.element.ref))) {
-        fileNode.append(
-`# Concatenate all audios
-final_audio = moviepy.CompositeAudioClip([${timelineElementsAudioJoined}])
-`, NL);
-    
+    if (hasAudioElements) {
         fileNode.append(
 `# Assign audio's concatenation to the final video
 final_video.audio = final_audio
 `, NL);  
     } 
+    return true;
+}
+
+
+function compilePassthroughTimelineElements(videoProject: VideoProject, elementOptions: ElementOptionsIndex, fileNode: CompositeGeneratorNode): boolean {
+    const passthroughTimelineElements = videoProject.timelineElements
+        .filter((te) => isVideoElement(te.element.ref))
+        .map((te) => ({ te, source: getUntouchedSource(te.element.ref as VideoElement, elementOptions) }))
+        .filter(({ source }) => source);
+
+    if (passthroughTimelineElements.length === 0) return false;
+
+    fileNode.append(
+`# Timeline elements showing their source file untouched, copied without re-encoding when possible
+passthrough = [
+${passthroughTimelineElements.map(({ te, source }) => `    (${formatTimelineElementName(te.name)}, "${source?.filePath}", ${source?.offset}),`).join('\n')}
+]
+`, NL);
+    return true;
+}
+
+/**
+ * Everything the frames of an element depend on: its kind, its merged options and its sources.
+ * Source files are listed apart, the renderer adds their modification time.
+ */
+function getElementInputs(element: Element | undefined, elementOptions: ElementOptionsIndex, files: string[]): object | undefined {
+    if (!element) return undefined;
+    const options = (elementOptions.get(element) as readonly AstNode[]).map(getNodeProperties);
+    if (isVideoOriginal(element)) {
+        files.push(element.filePath);
+        return { type: element.$type, filePath: element.filePath, options };
+    }
+    if (isVideoExtract(element)) {
+        const source = getElementInputs(element.source.ref, elementOptions, files);
+        return { type: element.$type, source, start: helperTimeToSeconds(element.start), end: helperTimeToSeconds(element.end), options };
+    }
+    if (isTextualElement(element)) {
+        return { type: element.$type, text: element.text, options };
+    }
+    return undefined;
+}
+
+function getNodeProperties(node: AstNode): object {
+    // Option nodes only hold primitive values, their type tells them apart
+    return Object.fromEntries([
+        ['type', node.$type],
+        ...Object.entries(node).filter(([key]) => !key.startsWith('$')),
+    ]);
 }
 
+function compileRenderInputs(videoProject: VideoProject, elementOptions: ElementOptionsIndex, pythonFragments: FragmentCache<string>, fileNode: CompositeGeneratorNode) {
+    const elementKeys = new Map<Element, string | undefined>();
+    const renderInputs = videoProject.timelineElements
+        .filter((te) => isVideoElement(te.element.ref) || isTextualElement(te.element.ref))
+        .map((te) => {
+            const elementKey = getElementKey(te.element.ref, elementKeys, elementOptions);
+            return pythonFragments.get(elementKey === undefined ? undefined : `RenderInputs\n${te.name}\n${elementKey}`, () => {
+                const files: string[] = [];
+                const element = getElementInputs(te.element.ref, elementOptions, files);
+                // Stringified twice: a JSON string is also a valid Python string
+                return `    (${formatTimelineElementName(te.name)}, ${JSON.stringify(JSON.stringify({ element, files }))}),`;
+            });
+        });
+
+    fileNode.append(
+`# Inputs of the visual timeline elements, to reuse the parts rendered by previous runs
+render_inputs = [
+${renderInputs.join('\n')}
+]
+`, NL);
+}
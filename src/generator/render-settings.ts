@@ -0,0 +1,51 @@
+/**
+ * Resolution and encoding of the generated program. The project is written for a 1920x1080 frame: a preview
+ * scales every pixel value of the program (frame, sizes, positions, font sizes) by the same factor, renders
+ * fewer frames per second with a faster encoder preset, and reads low resolution proxies of the source videos.
+ */
+export interface RenderSettings {
+    name: string; // Tells the fragments of the programs apart
+    scale: number;
+    fps?: number; // Frame rate of the sources when undefined
+    preset?: string; // x264 preset, the default one when undefined
+    proxies: boolean;
+    outputSuffix: string;
+}
+
+export const FRAME_WIDTH = 1920;
+export const FRAME_HEIGHT = 1080;
+
+export const FINAL_RENDER: RenderSettings = {
+    name: 'final',
+    scale: 1,
+    proxies: false,
+    outputSuffix: '',
+};
+
+// 640x360 at 12 frames per second
+export const PREVIEW_RENDER: RenderSettings = {
+    name: 'preview',
+    scale: 1 / 3,
+    fps: 12,
+    preset: 'ultrafast',
+    proxies: true,
+    outputSuffix: '.preview',
+};
+
+// Pixel value of the project (position, font size...) in the program
+export function scalePixels(value: number, settings: RenderSettings): number {
+    if (settings.scale === 1) return value;
+    return Math.round(value * settings.scale);
+}
+
+export function scaleSize(size: { width: number, height: number }, settings: RenderSettings): { width: number, height: number } {
+    return { width: Math.max(1, scalePixels(size.width, settings)), height: Math.max(1, scalePixels(size.height, settings)) };
+}
+
+// Size of the final video, rounded to even numbers of pixels for the encoder
+export function getFrameSize(settings: RenderSettings): { width: number, height: number } {
+    return {
+        width: Math.round(FRAME_WIDTH * settings.scale / 2) * 2,
+        height: Math.round(FRAME_HEIGHT * settings.scale / 2) * 2,
+    };
+}
@@ -1,50 +1,29 @@
 import { CompositeGeneratorNode, NL } from "langium/generate";
-import { TextualElement, GroupOptionText, TextOption, isTextFont, isTextFontColor, isTextFontSize, isVisualElementBackground, isVisualElementPosition, isVisualElementSizePixels, isText, isVisualElementPositionCoordinates, isVisualElementPositionAlignment, isSubtitle } from "../language-server/generated/ast.js";
+import { TextualElement, TextOption, isTextFont, isTextFontColor, isTextFontSize, isVisualElementBackground, isVisualElementPosition, isVisualElementSizePixels, isText, isVisualElementPositionCoordinates, isVisualElementPositionAlignment, isSubtitle, isTextAnimation } from "../language-server/generated/ast.js";
+import { ElementOptionsIndex } from "./element-options.js";
+import { FRAME_HEIGHT, FRAME_WIDTH, getFrameSize, RenderSettings, scalePixels, scaleSize } from "./render-settings.js";
 
-export function populateTextualElements(textualElements: TextualElement[], groupTextOptions: GroupOptionText[]): TextualElement[] {
-    return textualElements.map((text) => {
-        const relatedGroupOptions = groupTextOptions.filter((groupOption) => groupOption.elements.some((element) => element.ref?.name === text.name));
+// Distance (in pixels of the project) the letters of an animated text come from
+const TEXT_ANIMATION_DISTANCE = 400;
 
-        // This list can have duplicates
-        const mergedOptions = [
-            ...(text.options || []), // Video options
-            ...relatedGroupOptions.map((groupOption) => groupOption.options).flat(), // Group options
-        ];
-
-        // This map filters the duplicates (video option applied when declaring the video are prioritized)
-        const uniqueOptionMap = mergedOptions.reduce((acc, option) => {
-            // Check if the option is already in the list
-            if (acc.has(option.$type)) {
-                return acc;
-            }
-
-            // Add the option to the list
-            acc.set(option.$type, option);
-            return acc;
-        }, new Map<string, TextOption>());
-
-        // Map to array and sort for some special cases
-        text.options = Array.from(uniqueOptionMap.values()).sort((a, b) => {
-            const order = ['VisualElementSize', 'VisualElementPosition'];
-            return order.indexOf(a.$type) - order.indexOf(b.$type);
-        });
-
-        return text;
-    });
-}
-
-export function compileTextualElement(text: TextualElement, fileNode: CompositeGeneratorNode) {
+export function compileTextualElement(text: TextualElement, elementOptions: ElementOptionsIndex, settings: RenderSettings, fileNode: CompositeGeneratorNode) {
+        const options = elementOptions.text(text);
+        const animation = options.find(isTextAnimation);
+        // An animated text moves its letters, see videoml_runtime/text_animation.py
+        const textClip = animation
+            ? `animated_text_clip(${compileOptionsToTextClip(text, options, settings)}, animation="${animation.name}", distance=${scalePixels(TEXT_ANIMATION_DISTANCE, settings)})`
+            : `text_clip(${compileOptionsToTextClip(text, options, settings)})`;
         fileNode.append(
             `
-# Load the text clip, to apply new effects
-${text.name} = moviepy.TextClip(${compileOptionsToTextClip(text)})
+# Load the text clip (rasterized once, see videoml_runtime/text.py), to apply new effects
+${text.name} = ${textClip}
             `, NL);
 }
 
-function compileOptionsToTextClip(text: TextualElement): string {
+function compileOptionsToTextClip(text: TextualElement, options: readonly TextOption[], settings: RenderSettings): string {
     let bgColor = 'no';
-    let bgSizeX = 1920;
-    let bgSizeY = 1080;
+    let bgSizeX = FRAME_WIDTH;
+    let bgSizeY = FRAME_HEIGHT;
 
     let font = fontDependingOnOS();
     
@@ -75,52 +54,57 @@ function compileOptionsToTextClip(text: TextualElement): string {
                 if(option.y)
                     posY = option.y;
             } else if (isVisualElementPositionAlignment(option)) {
-                // Rmove \" from alignmentX and alignmentY
-                option.alignmentX = option.alignmentX?.replace(/"/g, '');
-                option.alignmentY = option.alignmentY?.replace(/"/g, '');
-                if(option.alignmentX){
-                    if(option.alignmentX === 'center'){
+                // Rmove \" from alignmentX and alignmentY (the option is left untouched, its fragment may be reused)
+                const alignmentX = option.alignmentX?.replace(/"/g, '');
+                const alignmentY = option.alignmentY?.replace(/"/g, '');
+                if(alignmentX){
+                    if(alignmentX === 'center'){
                         posX = `"center"`;
                     }
-                    if(option.alignmentX === 'left'){
+                    if(alignmentX === 'left'){
                         posX = 0;
                     }
-                    if(option.alignmentX === 'right'){
-                        posX = 1920 - bgSizeX;
+                    if(alignmentX === 'right'){
+                        posX = FRAME_WIDTH - bgSizeX;
                     }
                 }
-                if(option.alignmentY){
-                    if(option.alignmentY === 'center'){
+                if(alignmentY){
+                    if(alignmentY === 'center'){
                         posY = `"center"`;
                     }
-                    if(option.alignmentY === 'top'){
+                    if(alignmentY === 'top'){
                         posY = 0;
                     }
-                    if(option.alignmentY === 'bottom'){
-                        posY = 1080 - bgSizeY;
+                    if(alignmentY === 'bottom'){
+                        posY = FRAME_HEIGHT - bgSizeY;
                     }
                 }
             }
         }
     };
     
-    text.options.forEach(applyOption);
+    options.forEach(applyOption);
     
     if (isSubtitle(text)) {
         posY = 400;
         posX = `"center"`
     }
     
-    const optionsString = `
+    // The values above are pixels of the 1920x1080 frame of the project
+    const frameSize = getFrameSize(settings);
+    const bgSize = bgSizeX === FRAME_WIDTH && bgSizeY === FRAME_HEIGHT ? frameSize : scaleSize({ width: bgSizeX, height: bgSizeY }, settings);
+    const x = typeof posX === 'number' ? scalePixels(posX, settings) : posX;
+    const y = typeof posY === 'number' ? scalePixels(posY, settings) : posY;
+    return `
         text="${text.text}",
         ${bgColor !== 'no' ? `bg_color="${bgColor}",` : ''}
         font="${font}",
-        font_size=${fontSize},
+        font_size=${Math.max(1, scalePixels(fontSize, settings))},
         color="${fontColor}",
-        size=(${bgSizeX}, ${bgSizeY}))
+        size=(${bgSize.width}, ${bgSize.height}),
+        position=(${x}, ${y}),
+        frame_size=(${frameSize.width}, ${frameSize.height})
     `.trim().replace(/\s+/g, ' ');
-    
-    return `${optionsString}.with_position((${posX}, ${posY})`;
 }
     
 function fontDependingOnOS(font?: string) {
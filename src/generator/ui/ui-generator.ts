@@ -1,10 +1,7 @@
 import {
     VideoProject,
-    isRelativeTimelineElement,
-    RelativeTimelineElement,
-    FixedTimelineElement,
-    isFixedTimelineElement,
     TimelineElement,
+    Element,
     isVideoOriginal,
     isVideoExtract,
     isAudioOriginal,
@@ -12,14 +9,36 @@ import {
     isTextualElement,
     isSubtitle,
 } from '../../language-server/generated/ast.js';
-import { helperTimeToSeconds, getLayer, getTimelineElementTextualDuration, helperOffsetTimeToSeconds } from '../../lib/helper.js';
+import { helperTimeToSeconds, getTimelineElementTextualDuration, getTimelinePlacement } from '../../lib/helper.js';
+import { solveTimeline, TimelinePlacement } from '../../lib/timeline-solver.js';
 import { TimelineElementInfo } from './types.js';
+import { FragmentCache, getElementKey, getNodeText } from '../fragment-cache.js';
+
+// Infos of the previous generation, reused for the timeline elements that didn't change
+const infoFragments = new FragmentCache<TimelineElementInfo>();
 
 export function generateTimelineElementInfos(videoProject: VideoProject): TimelineElementInfo[] {
-    return videoProject.timelineElements.map(compileTimelineElement);
+    // The layers are solved here, the start of the elements once the UI knows the duration of their files
+    const placements = videoProject.timelineElements.map((te) => getTimelinePlacement(te));
+    const solvedPlacements = solveTimeline(placements);
+    const elementKeys = new Map<Element, string | undefined>();
+    const infos = videoProject.timelineElements.map((te, index) => {
+        const layer = solvedPlacements[index].layer;
+        return infoFragments.get(getTimelineElementInfoKey(te, layer, elementKeys), () => compileTimelineElement(te, placements[index], layer));
+    });
+    infoFragments.endGeneration();
+    return infos;
+}
+
+// Everything the info of a timeline element depends on, see compileTimelineElement
+function getTimelineElementInfoKey(te: TimelineElement, layer: number, elementKeys: Map<Element, string | undefined>): string | undefined {
+    const text = getNodeText(te);
+    const elementKey = getElementKey(te.element.ref, elementKeys);
+    if (text === undefined || elementKey === undefined) return undefined;
+    return [text, te.$containerIndex === 0, layer, elementKey].join('\n');
 }
 
-function compileTimelineElement(te: TimelineElement): TimelineElementInfo {
+function compileTimelineElement(te: TimelineElement, placement: TimelinePlacement, layer: number): TimelineElementInfo {
     if (!te.element.ref) throw new Error('Element reference is missing');
     let info: TimelineElementInfo
 
@@ -30,8 +49,8 @@ function compileTimelineElement(te: TimelineElement): TimelineElementInfo {
                 name: te.element.ref.name,
                 filePath: te.element.ref.filePath,
             },
-            layer: getLayer(te),
-            ...(compileTimelineElementPlacement(te)),
+            layer,
+            ...(compileTimelineElementPlacement(placement)),
         };
     } else if (isVideoExtract(te.element.ref)) {
         info = {
@@ -41,8 +60,8 @@ function compileTimelineElement(te: TimelineElement): TimelineElementInfo {
                 name: te.element.ref.name,
                 //source: te.element.ref.source (TODO: add source correctly, or delete it, as we are not using it atm.)
             },
-            layer: getLayer(te),
-            ...(compileTimelineElementPlacement(te)),
+            layer,
+            ...(compileTimelineElementPlacement(placement)),
         };
     } else if (isAudioOriginal(te.element.ref)) {
         info = {
@@ -51,8 +70,8 @@ function compileTimelineElement(te: TimelineElement): TimelineElementInfo {
                 name: te.element.ref.name,
                 filePath: te.element.ref.filePath,
             },
-            layer: getLayer(te),
-            ...(compileTimelineElementPlacement(te)),
+            layer,
+            ...(compileTimelineElementPlacement(placement)),
         };
     } else if (isAudioExtract(te.element.ref)) {
         info = {
@@ -62,8 +81,8 @@ function compileTimelineElement(te: TimelineElement): TimelineElementInfo {
                 name: te.element.ref.name,
                 //source: te.element.ref.source (TODO: add source correctly, or delete it, as we are not using it atm.)
             },
-            layer: getLayer(te),
-            ...(compileTimelineElementPlacement(te)),
+            layer,
+            ...(compileTimelineElementPlacement(placement)),
         };
     } else if (isTextualElement(te.element.ref)) { 
         info = {
@@ -73,8 +92,8 @@ function compileTimelineElement(te: TimelineElement): TimelineElementInfo {
                 name: te.element.ref.name,
                 isSubtitle: isSubtitle(te.element.ref),
             },
-            layer: getLayer(te),
-            ...(compileTimelineElementPlacement(te)),
+            layer,
+            ...(compileTimelineElementPlacement(placement)),
         };
     }else {
         throw new Error('Unknown element type');
@@ -83,40 +102,15 @@ function compileTimelineElement(te: TimelineElement): TimelineElementInfo {
     return info;
 }
 
-function compileTimelineElementPlacement(te: TimelineElement): Partial<TimelineElementInfo> {
-    return isRelativeTimelineElement(te)
-        ? compileRelativeTimelineElement(te)
-        : isFixedTimelineElement(te)
-            ? compileFixedTimelineElement(te)
-            : compileImpliciteTimelineElement(te);
-}
-
-function compileRelativeTimelineElement(rte: RelativeTimelineElement): Partial<TimelineElementInfo> {
-    if (!rte.relativeTo.ref) throw new Error('Relative to reference is missing');
-
-    return {
-        relativePlacement: {
-            offset: helperOffsetTimeToSeconds(rte.offset),
-            place: rte.place === 'start' ? 'START' : 'END',
-            relativeTo: rte.relativeTo.ref?.name,
-        }
+function compileTimelineElementPlacement(placement: TimelinePlacement): Partial<TimelineElementInfo> {
+    const { relativePlacement } = placement;
+    if (!relativePlacement) {
+        return placement.startAfterPrevious ? { startAfterPrevious: true } : { startAt: placement.startAt };
     }
-}
 
-function compileFixedTimelineElement(fte: FixedTimelineElement): Partial<TimelineElementInfo> {
+    const { relativeTo } = relativePlacement;
+    if (!relativeTo) throw new Error('Relative to reference is missing');
     return {
-        startAt: helperTimeToSeconds(fte.startAt)
-    }
-}
-
-function compileImpliciteTimelineElement(te: TimelineElement): Partial<TimelineElementInfo> {
-    if (te.$containerIndex === 0) {
-        return {
-            startAt: 0
-        }
-    } else {
-        return {
-            startAfterPrevious: true
-        }
+        relativePlacement: { ...relativePlacement, relativeTo },
     }
 }
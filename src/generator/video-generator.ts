@@ -1,102 +1,168 @@
 import { CompositeGeneratorNode, NL } from "langium/generate";
-import { GroupOptionVideo, isVideoBrightness, isVideoContrast, isVideoExtract, isVideoOpacity, isVideoOriginal, isVideoRotation, isVideoSaturation, isVideoScale, isVideoTransition, isVisualElementOption, isVisualElementPosition, isVisualElementPositionAlignment, isVisualElementPositionCoordinates, isVisualElementSize, isVisualElementSizePixels, isVisualElementSizeResolution, VideoElement, VideoExtract, VideoOption, VideoOriginal, VisualElementOption } from "../language-server/generated/ast.js";
+import { isVideoBrightness, isVideoContrast, isVideoExtract, isVideoOpacity, isVideoOriginal, isVideoRotation, isVideoSaturation, isVideoScale, isVideoTransition, isVisualElementOption, isVisualElementPosition, isVisualElementPositionAlignment, isVisualElementPositionCoordinates, isVisualElementSize, isVisualElementSizePixels, isVisualElementSizeResolution, VideoElement, VideoExtract, VideoOption, VideoOriginal, VisualElementOption } from "../language-server/generated/ast.js";
 import { helperTimeToSeconds } from "../lib/helper.js";
+import { ElementOptionsIndex } from "./element-options.js";
+import { FRAME_HEIGHT, FRAME_WIDTH, getFrameSize, RenderSettings, scalePixels, scaleSize } from "./render-settings.js";
 
-export function populateVideoElements(videoElements: VideoElement[], groupVideoOptions: GroupOptionVideo[]): VideoElement[] {
-    return videoElements.map((video) => {
-        const relatedGroupOptions = groupVideoOptions.filter((groupOption) => groupOption.elements.some((element) => element.ref?.name === video.name));
-
-        // This list can have duplicates
-        const mergedOptions = [
-            ...(video.options || []), // Video options
-            ...relatedGroupOptions.map((groupOption) => groupOption.options).flat(), // Group options
-        ];
-
-        // This map filters the duplicates (video option applied when declaring the video are prioritized)
-        const uniqueOptionMap = mergedOptions.reduce((acc, option) => {
-            // Check if the option is already in the list
-            if (acc.has(option.$type)) {
-                return acc;
-            }
+export function compileVideo(video: VideoElement, elementOptions: ElementOptionsIndex, settings: RenderSettings, fileNode: CompositeGeneratorNode) {
+    const videoOptions = elementOptions.video(video);
+    let options = orderVideoOptions(videoOptions);
 
-            if(isVideoTransition(option)){
-                if(acc.has(option.type)){
-                    return acc;
-                }
-                acc.set(option.type, option);
-            } else{
-                // Add the option to the list
-                acc.set(option.$type, option);
-            }
+    // Videos read from their file are decoded at their final size, the size option is then applied by the decoder
+    const isDecodedFromFile = isVideoOriginal(video) || (isVideoExtract(video) && getUntouchedSource(video.source.ref, elementOptions) !== undefined);
+    const decodedSize = isDecodedFromFile ? getDecodedSize(options) : undefined;
+    if (decodedSize) {
+        const sizeIndex = options.indexOf(decodedSize.option);
+        options = options.filter((option, index) => index > sizeIndex || (index < sizeIndex && !isVideoScale(option)));
+    }
 
-            return acc;
-        }, new Map<string, VideoOption>());
+    if (isVideoOriginal(video)) {
+        compileVideoOriginal(video, decodedSize, settings, fileNode);
+    } else if (isVideoExtract(video)) {
+        compileVideoExtract(video, decodedSize, elementOptions, settings, fileNode);
+    }
+    // Add the video options, consecutive colour options are applied in one pass
+    let colorOptions: VideoOption[] = [];
+    options.forEach((option) => {
+        if (isVideoColorOption(option)) {
+            colorOptions.push(option);
+            return;
+        }
+        compileVideoColorOptions(colorOptions, video, fileNode);
+        colorOptions = [];
+        compileVideoOption(option, video, videoOptions, settings, fileNode);
+    });
+    compileVideoColorOptions(colorOptions, video, fileNode);
+}
 
-        // Map to array and sort for some special cases
-        video.options = Array.from(uniqueOptionMap.values()).sort((a, b) => {
-            const order = ['VideoResolution', 'VisualElementSize', 'VisualElementPosition'];
-            return order.indexOf(a.$type) - order.indexOf(b.$type);
-        });
+/**
+ * Source file and offset (in seconds) of a video element that shows its source untouched,
+ * i.e. an original or a chain of extracts without any option.
+ */
+export function getUntouchedSource(video: VideoElement | undefined, elementOptions: ElementOptionsIndex): { filePath: string, offset: number } | undefined {
+    if (!video || elementOptions.video(video).length > 0) return undefined;
+    if (isVideoOriginal(video)) return { filePath: video.filePath, offset: 0 };
+    if (isVideoExtract(video)) {
+        const source = getUntouchedSource(video.source.ref, elementOptions);
+        return source && { filePath: source.filePath, offset: addSeconds(source.offset, helperTimeToSeconds(video.start)) };
+    }
+    return undefined;
+}
 
-        return video;
-    });
+function addSeconds(a: number, b: number): number {
+    // Rounded to the millisecond of the TIME terminal, to avoid floating point noise in the program
+    return Math.round((a + b) * 1000) / 1000;
 }
 
+/**
+ * Size option that the decoder can apply instead of a resize of the frames. The options before it must give
+ * the same frames at any size (the scales before it are overridden by it).
+ */
+function getDecodedSize(options: readonly VideoOption[]): { width: number, height: number, option: VideoOption } | undefined {
+    const index = options.findIndex(isVisualElementSize);
+    if (index < 0) return undefined;
+    if (!options.slice(0, index).every((option) => isVideoScale(option) || (isCommutingWithDownscale(option) && !isVideoRotation(option)))) {
+        return undefined;
+    }
 
-export function compileVideo(video: VideoElement, fileNode: CompositeGeneratorNode) {
-    if (isVideoOriginal(video)) {
-        compileVideoOriginal(video, fileNode);
-    } else if (isVideoExtract(video)) {
-        compileVideoExtract(video, fileNode);
+    const option = options[index];
+    if (isVisualElementSizePixels(option) && option.width && option.height) {
+        return { width: option.width, height: option.height, option };
+    }
+    if (isVisualElementSizeResolution(option) && option.resolution) {
+        const resolution = getResolution(option.resolution);
+        return resolution && { width: resolution.width, height: resolution.height, option };
     }
-    // Add the video options
-    video.options?.forEach((option) => {
-        compileVideoOption(option, video, fileNode);
+    return undefined;
+}
+
+/**
+ * Moves the downscales (scale below 1) before the options that give exactly the same frames on a smaller
+ * frame, so that these options process fewer pixels. Only right-angle rotations (which move pixels without
+ * resampling them) and opacity (a constant factor of the mask) are crossed. Brightness and contrast clip the
+ * colours at 0 and 255 and the resample rings around edges, so clipping before or after it gives other pixels;
+ * the fades scale a mask that the resample quantizes; saturation sharpens the frame and other rotations
+ * resample it.
+ */
+function orderVideoOptions(options: readonly VideoOption[]): VideoOption[] {
+    const ordered = [...options];
+    ordered.forEach((option, index) => {
+        if (!isVideoScale(option) || option.scale >= 1) return;
+        let target = index;
+        while (target > 0 && isCommutingWithDownscale(ordered[target - 1])) target--;
+        ordered.splice(index, 1);
+        ordered.splice(target, 0, option);
     });
+    return ordered;
+}
+
+function isCommutingWithDownscale(option: VideoOption): boolean {
+    return isVideoOpacity(option)
+        || (isVideoRotation(option) && option.rotation % 90 === 0);
+}
+
+function isVideoColorOption(option: VideoOption): boolean {
+    return isVideoBrightness(option) || isVideoContrast(option) || isVideoSaturation(option);
 }
 
-function compileVideoOriginal(video: VideoOriginal, fileNode: CompositeGeneratorNode) {
+function compileVideoColorOptions(options: VideoOption[], video: VideoElement, fileNode: CompositeGeneratorNode) {
+    if (options.length === 0) return;
+
+    const steps = options.map((option) => {
+        if (isVideoBrightness(option)) return `("brightness", ${option.brightness})`;
+        if (isVideoContrast(option)) return `("contrast", ${option.contrast})`;
+        if (isVideoSaturation(option)) return `("saturation", ${option.saturation})`;
+        return undefined;
+    }).filter((step) => step);
+
     fileNode.append(
-        `# Load the video clip original
-${video.name} = moviepy.VideoFileClip("${video.filePath}")
+        `# Apply brightness, contrast and saturation effects in one pass
+color_effect = ColorCorrection([${steps.join(', ')}])
+${video.name} = color_effect.apply(${video.name})`, NL);
+}
+
+function compileOpenVideo(filePath: string, size: { width: number, height: number } | undefined, settings: RenderSettings): string {
+    // Decoded to fill the frame (centred if not 16:9), or at the given size
+    const frameSize = getFrameSize(settings);
+    const scaledSize = size && scaleSize(size, settings);
+    return `open_video("${filePath}", fit=(${frameSize.width}, ${frameSize.height})${scaledSize ? `, size=(${scaledSize.width}, ${scaledSize.height})` : ''}${settings.proxies ? ', proxy=True' : ''})`;
+}
+
+function compileVideoOriginal(video: VideoOriginal, size: { width: number, height: number } | undefined, settings: RenderSettings, fileNode: CompositeGeneratorNode) {
+    fileNode.append(
+        `# Load the video clip original, decoded at its size in the final video
+${video.name} = ${compileOpenVideo(video.filePath, size, settings)}
 `, NL);
-fileNode.append(
-    `# Resize the video clip
-if ${video.name}.size[0] / ${video.name}.size[1] == 16/9:
-    ${video.name} = ${video.name}.resized((1920, 1080))
-else:
-    if ${video.name}.size[0] / ${video.name}.size[1] > 1:
-        ${video.name} = ${video.name}.resized(width=1920)
-    else:
-        ${video.name} = ${video.name}.resized(height=1080)
-    ${video.name} = ${video.name}.with_position("center", "center")
-    `
-    , NL);
 }
 
-function compileVideoExtract(video: VideoExtract, fileNode: CompositeGeneratorNode) {
+function compileVideoExtract(video: VideoExtract, size: { width: number, height: number } | undefined, elementOptions: ElementOptionsIndex, settings: RenderSettings, fileNode: CompositeGeneratorNode) {
+    const source = getUntouchedSource(video.source.ref, elementOptions);
+    if (source) {
+        // The source has no option, the extract is read from the file at its own size
+        fileNode.append(
+            `# Extract a subclip from the video file, decoded at its size in the final video
+${video.name} = ${compileOpenVideo(source.filePath, size, settings)}.subclipped(${addSeconds(source.offset, helperTimeToSeconds(video.start))}, ${addSeconds(source.offset, helperTimeToSeconds(video.end))})
+`, NL);
+        return;
+    }
+
     fileNode.append(
         `# Extract a subclip from the video
 ${video.name} = ${(video.source?.ref as VideoOriginal)?.name}.subclipped(${helperTimeToSeconds(video.start)}, ${helperTimeToSeconds(video.end)})
 `, NL);
+    const frameSize = getFrameSize(settings);
     fileNode.append(
         `# Resize the video clip
 if ${video.name}.size[0]/${video.name}.size[1] == 16/9:
-    ${video.name} = ${video.name}.resized((1920, 1080))
+    if tuple(${video.name}.size) != (${frameSize.width}, ${frameSize.height}):
+        ${video.name} = ${video.name}.resized((${frameSize.width}, ${frameSize.height}))
 else:
     ${video.name} = ${video.name}.with_position("center", "center")
 `, NL);
 }
 
-function compileVideoOption(option: VideoOption, video: VideoElement, fileNode: CompositeGeneratorNode) {
+function compileVideoOption(option: VideoOption, video: VideoElement, videoOptions: readonly VideoOption[], settings: RenderSettings, fileNode: CompositeGeneratorNode) {
     const videoName = video.name;
-    if (isVideoBrightness(option)) {
-        fileNode.append(
-            `# Apply brightness effect
-multiply_effect = moviepy.video.fx.MultiplyColor(factor=${option.brightness})
-${videoName} = multiply_effect.apply(${videoName})`, NL);
-    }
-
     if (isVideoScale(option)) {
         const new_value = option.scale;
         fileNode.append(
@@ -111,22 +177,8 @@ ${videoName} = resize_effect.apply(${videoName})`, NL);
 ${videoName} = ${videoName}.with_opacity(${option.opacity})`, NL);
     }
 
-    if (isVideoContrast(option)) {
-        fileNode.append(
-            // Use the colorx effect to adjust the contrast
-            `# Apply contrast effect
-lum_contrast_effect = moviepy.video.fx.LumContrast(lum=20, contrast=${option.contrast}, contrast_threshold=127)
-${videoName} = lum_contrast_effect.apply(${videoName})`, NL);
-    }
-
-    if (isVideoSaturation(option)) {
-        fileNode.append(
-            `# Apply saturation effect
-painting_effect = moviepy.video.fx.Painting(saturation=${option.saturation}, black=0.0)
-${videoName} = painting_effect.apply(${videoName})`, NL);
-    }
-
     if (isVideoRotation(option)) {
+        // With expand=True, Rotate flips or transposes the frame for multiples of 90 degrees instead of resampling it
         fileNode.append(
             `# Apply rotation effect
 rotate_effect = moviepy.video.fx.Rotate(angle=${option.rotation}, unit="deg", resample="bicubic", expand=True)
@@ -149,36 +201,36 @@ ${videoName} = fade_out.apply(${videoName})`, NL);
     }
 
     if (isVisualElementOption(option)) {
-        compileVisualElementOption(option, video, fileNode);
+        compileVisualElementOption(option, video, videoOptions, settings, fileNode);
     }
 
 }
 
-function compileVisualElementOption(option: VisualElementOption, video: VideoElement, fileNode: CompositeGeneratorNode) {
+function compileVisualElementOption(option: VisualElementOption, video: VideoElement, videoOptions: readonly VideoOption[], settings: RenderSettings, fileNode: CompositeGeneratorNode) {
     if (isVisualElementPosition(option)) {
         let x: String | Number = 0;
         let y: String | Number = 0;
         if (isVisualElementPositionCoordinates(option)) {
             if (option.x)
-                x = option.x;
+                x = scalePixels(option.x, settings);
             if (option.y)
-                y = option.y;
+                y = scalePixels(option.y, settings);
         } else if (isVisualElementPositionAlignment(option)) {
-            // Rmove \" from alignmentX and alignmentY
-            option.alignmentX = option.alignmentX?.replace(/"/g, '');
-            option.alignmentY = option.alignmentY?.replace(/"/g, '');
-            if (option.alignmentX === 'center')
+            // Rmove \" from alignmentX and alignmentY (the option is left untouched, its fragment may be reused)
+            const alignmentX = option.alignmentX?.replace(/"/g, '');
+            const alignmentY = option.alignmentY?.replace(/"/g, '');
+            if (alignmentX === 'center')
                 x = `'center'`;
-            if (option.alignmentY === 'center')
+            if (alignmentY === 'center')
                 y = `'center'`;
-            if (option.alignmentX === 'right'){
-                x = 1920 - (getResolution(video.options.find(isVisualElementSizeResolution)?.resolution||'')?.width || video.options.find(isVisualElementSizePixels)?.width || 0);
+            if (alignmentX === 'right'){
+                x = scalePixels(FRAME_WIDTH - (getResolution(videoOptions.find(isVisualElementSizeResolution)?.resolution||'')?.width || videoOptions.find(isVisualElementSizePixels)?.width || 0), settings);
             }
-            if (option.alignmentX === 'left')
+            if (alignmentX === 'left')
                 x = 0;
-            if (option.alignmentY === 'bottom')
-                y = 1080 - (getResolution(video.options.find(isVisualElementSizeResolution)?.resolution||'')?.height || video.options.find(isVisualElementSizePixels)?.height || 0);
-            if (option.alignmentY === 'top')
+            if (alignmentY === 'bottom')
+                y = scalePixels(FRAME_HEIGHT - (getResolution(videoOptions.find(isVisualElementSizeResolution)?.resolution||'')?.height || videoOptions.find(isVisualElementSizePixels)?.height || 0), settings);
+            if (alignmentY === 'top')
                 y = 0;
         }
         fileNode.append(
@@ -187,15 +239,17 @@ ${video.name} = ${video.name}.with_position((${x},${y}))`, NL);
     }
     if (isVisualElementSize(option)) {
         if(isVisualElementSizePixels(option) && option.width && option.height){
+        const size = scaleSize({ width: option.width, height: option.height }, settings);
         fileNode.append(
             `# Apply size effect
-${video.name} = ${video.name}.resized((${option.width},${option.height}))`, NL);
+${video.name} = ${video.name}.resized((${size.width},${size.height}))`, NL);
         }
         if(isVisualElementSizeResolution(option) && option.resolution){
             const resolution = getResolution(option.resolution);
+            const size = resolution && scaleSize(resolution, settings);
             fileNode.append(
                 `# Apply resolution effect
-${video.name} = ${video.name}.resized((${resolution?.width},${resolution?.height}))`, NL);
+${video.name} = ${video.name}.resized((${size?.width},${size?.height}))`, NL);
         }
     }
 }
@@ -5,11 +5,12 @@
  ******************************************************************************/
 
 import { EmptyFileSystem, DocumentState } from 'langium';
-import { BrowserMessageReader, BrowserMessageWriter, Diagnostic, NotificationType, createConnection } from 'vscode-languageserver/browser.js';
+import { BrowserMessageReader, BrowserMessageWriter, Diagnostic, NotificationType, RequestType, createConnection } from 'vscode-languageserver/browser.js';
 import { createVideoMlServices } from './video-ml-module.js';
 import { VideoProject } from './generated/ast.js';
 import { generateTimelineElementInfos } from '../generator/ui/ui-generator.js';
 import { generatePythonProgram } from '../generator/generator.js';
+import { PREVIEW_RENDER } from '../generator/render-settings.js';
 import { TimelineElementInfo } from '../generator/ui/types.js';
 import { startLanguageServer } from 'langium/lsp';
 
@@ -22,35 +23,44 @@ const messageWriter = new BrowserMessageWriter(self);
 const connection = createConnection(messageReader, messageWriter);
 
 // Inject the shared services and language-specific services
-const { shared, VideoMl } = createVideoMlServices({connection, ...EmptyFileSystem });
+const { shared } = createVideoMlServices({connection, ...EmptyFileSystem });
 
 // Start the language server with the shared services
 startLanguageServer(shared);
 
-// Send a notification with the serialized AST after every document change
+// Send a notification with the generated code and timeline after every document change
 type DocumentChange = { uri: string, content: string, diagnostics: Diagnostic[] };
 const documentChangeNotification = new NotificationType<DocumentChange>('browser/DocumentChange');
-const jsonSerializer = VideoMl.serializer.JsonSerializer;
+// Last valid project of each document, the preview program is only generated when the UI asks for it
+const validVideoProjects = new Map<string, VideoProject>();
 shared.workspace.DocumentBuilder.onBuildPhase(DocumentState.Validated, documents => {
     for (const document of documents) {
         const videoProject = document.parseResult.value as VideoProject;
         let timelineJson: TimelineElementInfo[] = [];
         let pythonCode: string = "";
+        let isValid = false;
 
+        // The generators reuse the fragments of the elements that didn't change since the previous edit
         if(document.diagnostics === undefined  || document.diagnostics.filter((i) => i.severity === 1).length === 0) {
             timelineJson = generateTimelineElementInfos(videoProject);
             pythonCode = generatePythonProgram(videoProject);
-            (videoProject as unknown as {$isValid: boolean}).$isValid = true;
-        } else {
-            (videoProject as unknown as {$isValid: boolean}).$isValid = false;
+            validVideoProjects.set(document.uri.toString(), videoProject);
+            isValid = true;
         }
-        
-        (videoProject as unknown as {$timelineElementInfos: TimelineElementInfo[]}).$timelineElementInfos = timelineJson;
-        (videoProject as unknown as {$pythonCode: string}).$pythonCode = pythonCode;
+
+        // Only the fields read by the UI, serializing the whole AST would cost more than the generation itself
         connection.sendNotification(documentChangeNotification, {
             uri: document.uri.toString(),
-            content: jsonSerializer.serialize(videoProject, { sourceText: true, textRegions: true }),
+            content: JSON.stringify({ $isValid: isValid, $timelineElementInfos: timelineJson, $pythonCode: pythonCode }),
             diagnostics: document.diagnostics ?? []
         });
     }
 });
+
+// Program rendering a low resolution preview of the last valid version of a document ("" when there is none)
+type PreviewPythonCodeParams = { uri: string };
+const previewPythonCodeRequest = new RequestType<PreviewPythonCodeParams, string, void>('browser/PreviewPythonCode');
+connection.onRequest(previewPythonCodeRequest, ({ uri }) => {
+    const videoProject = validVideoProjects.get(uri);
+    return videoProject ? generatePythonProgram(videoProject, PREVIEW_RENDER) : "";
+});
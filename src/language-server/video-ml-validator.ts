@@ -60,33 +60,40 @@ import {
 } from './generated/ast.js';
 import type { VideoMlServices } from './video-ml-module.js';
 import { validateFilePath } from './validators/special-validators.js';
-import { getLayer, getTimelineElementTextualDuration, helperOffsetTimeToSeconds, helperTimeToSeconds } from '../lib/helper.js';
+import { getTimelineElementTextualDuration, getTimelinePlacement, helperTimeToSeconds } from '../lib/helper.js';
+import { solveTimeline } from '../lib/timeline-solver.js';
 
 const IS_ELECTRON = process.env.IS_ELECTRON === 'true';
 
 // Used to call renderer process from worker in Electron in a synchronous way
-const asyncRequestMap = new Map();
+const asyncRequestMap = new Map<string, { resolve: (content: any) => void, reject: (error: Error) => void }>();
 if (IS_ELECTRON) {
     self.addEventListener('message', (event) => {
-        const { result } = event.data;
+        const { result, error } = event.data;
         if (result?.content && result?.indexName && asyncRequestMap.has(result.indexName)) {
-            asyncRequestMap.get(result.indexName)(result.content);
+            asyncRequestMap.get(result.indexName)!.resolve(result.content);
             asyncRequestMap.delete(result.indexName);
+        } else if (error?.data?.indexName && asyncRequestMap.has(error.data.indexName)) {
+            // The command failed in Electron (unknown command, error of its handler)
+            asyncRequestMap.get(error.data.indexName)!.reject(new Error(error.message));
+            asyncRequestMap.delete(error.data.indexName);
         }
     });
 } 
 
+// Time (in ms) given to Electron to answer a command, and to probe each media file of a request
+const COMMAND_TIMEOUT = 5000;
+const MEDIA_PROBE_TIMEOUT = 1000;
+
 // Function to simulate synchronous calls from worker to renderer process in Electron
 async function invokeSpecialCommand(
     command: string,
     commandParams: object,
-    executionParams: {
-        needNodeJs: boolean;
-    },
+    timeout: number = COMMAND_TIMEOUT,
 ): Promise<any> {
     return new Promise((resolve, reject) => {
         const id = nanoid();
-        asyncRequestMap.set(id, resolve);
+        asyncRequestMap.set(id, { resolve, reject });
 
         self.postMessage({
             jsonrpc: "2.0",
@@ -95,118 +102,52 @@ async function invokeSpecialCommand(
             params: {
                 commandParams,
                 indexName: id,
-                executionParams,
             },
         });
 
-        // Timeout after 5 seconds
         setTimeout(() => {
             if (asyncRequestMap.has(id)) {
                 asyncRequestMap.delete(id);
                 reject(new Error(`Command ${command} timed out`));
             }
-        }, 5000);
+        }, timeout);
     });
 }
 
-async function getAudioDuration (audioPath: string): Promise<number> {
-    return await invokeSpecialCommand(
-        'get-audio-original-duration',
-        { path: audioPath },
-        { needNodeJs: false },
-    );
-}
-
-async function getVideoDuration (videoPath: string): Promise<number> {
-    return await invokeSpecialCommand(
-        'get-video-original-duration',
-        { path: videoPath },
-        { needNodeJs: false },
-    );
+// Durations of media files (-1 for the files that can't be read), read from the media index of Electron.
+// Every file has its own request, so that a slow probe only fails its own file. Electron probes a few files
+// at a time: the last requests wait for the first ones, their timeout grows with the number of files.
+async function getMediaDurations (paths: string[]): Promise<number[]> {
+    const timeout = COMMAND_TIMEOUT + MEDIA_PROBE_TIMEOUT * paths.length;
+    return Promise.all(paths.map(async (path) => {
+        try {
+            const [info]: ({ duration: number } | undefined)[] = await invokeSpecialCommand(
+                'get-media-infos',
+                { paths: [path] },
+                timeout,
+            );
+            return info ? info.duration : -1;
+        } catch {
+            return -1;
+        }
+    }));
 }
 
-const getTimelineElementPopulated = async (element: TimelineElement, timelineElementList: TimelineElement[]): Promise<{ calculatedStartAt?: number, calculatedDuration?: number, calculatedFinishAt?: number, layer?: number }> => {
-    if (!element.name || !element.element?.ref) return {};
+// Duration of the element of a timeline element, `fileDurations` holds the durations of the originals' files
+function getTimelineElementDuration(element: TimelineElement, fileDurations: Map<string, number>): number | undefined {
+    const ref = element.element?.ref;
+    if (!ref) return undefined;
 
-    // Get layer
-    let layer = undefined;
-    if (element.layerPosition?.relativeTo?.ref) {
-        layer = getLayer(element);
-    }
-    
-    // Calculate duration
-    let duration = 0;
-    if (isTextualElement(element.element.ref)) {
-        duration = helperTimeToSeconds(getTimelineElementTextualDuration(element.duration));
-    }
-    if (isAudioExtract(element.element.ref)) {
-        duration = helperTimeToSeconds(element.element.ref.end) - helperTimeToSeconds(element.element.ref.start);
-    }
-    if (isVideoExtract(element.element.ref)) {
-        duration = helperTimeToSeconds(element.element.ref.end) - helperTimeToSeconds(element.element.ref.start);
+    if (isTextualElement(ref)) {
+        return helperTimeToSeconds(getTimelineElementTextualDuration(element.duration));
     }
-    if (isAudioOriginal(element.element.ref)) {
-        duration = await getAudioDuration(element.element.ref.filePath);
+    if (isAudioExtract(ref) || isVideoExtract(ref)) {
+        return helperTimeToSeconds(ref.end) - helperTimeToSeconds(ref.start);
     }
-    if (isVideoOriginal(element.element.ref)) {
-        duration = await getVideoDuration(element.element.ref.filePath);
+    if (isAudioOriginal(ref) || isVideoOriginal(ref)) {
+        return fileDurations.get(ref.filePath);
     }
-
-    // Calculate start at & finish at
-    if (isFixedTimelineElement(element)) {
-        const startAt = helperTimeToSeconds(element.startAt)
-        return {
-            calculatedStartAt: startAt,
-            calculatedDuration: duration,
-            calculatedFinishAt: startAt + duration,
-            layer,
-        };
-    }
-    if (isRelativeTimelineElement(element)) {
-        const relativeToElement = element.relativeTo?.ref;
-        if (!relativeToElement) {
-            return {
-                calculatedStartAt: 0,
-                calculatedDuration: duration,
-                calculatedFinishAt: duration,
-                layer,
-            };
-        }
-
-        const isRelativeOrderCorrect = parseInt(relativeToElement.name.slice(1)) < parseInt(element.name.slice(1));
-        if (!isRelativeOrderCorrect) return { layer };
-    
-        const { calculatedStartAt: relativeStartAt, calculatedDuration: relativeDuration } = await getTimelineElementPopulated(relativeToElement, timelineElementList);
-    
-        const offset = helperOffsetTimeToSeconds(element.offset);
-    
-        const startAt = (relativeStartAt || 0) + offset + (element.place === 'end' ? (relativeDuration || 0) : 0);
-
-        return {
-            calculatedStartAt: startAt,
-            calculatedDuration: duration,
-            calculatedFinishAt: startAt + duration,
-            layer,
-        };
-    }
-
-    // Implicit timeline element
-    if (element.$containerIndex === 0) {
-        return {
-            calculatedStartAt: 0,
-            calculatedDuration: duration,
-            calculatedFinishAt: duration,
-            layer,
-        }
-    }
-    const previousElement = timelineElementList[(element.$containerIndex || 1) - 1];
-    const previousElementInfo = await getTimelineElementPopulated(previousElement, timelineElementList);
-    return {
-        calculatedStartAt: previousElementInfo.calculatedFinishAt || 0,
-        calculatedDuration: duration,
-        calculatedFinishAt: (previousElementInfo.calculatedFinishAt || 0) + duration,
-        layer,
-    };
+    return 0;
 }
 
 /**
@@ -290,37 +231,57 @@ export class VideoMlValidator {
     }
 
     async checkTimelineElementsTimePlacement(timelineElementList: TimelineElement[], accept: ValidationAcceptor): Promise<void> {
-        // Populate each timeline element with some useful info
-        const populatedTimeTimelineElements = await Promise.all(
-            timelineElementList.map(async (element) => {
-                const info = await getTimelineElementPopulated(element, timelineElementList);
-                return {
-                    ...element,
-                    ...info,
-                };
-            })
-        );
-        
+        // Read the durations of all the files in parallel, then place every timeline element in one pass
+        const filePaths = Array.from(new Set(timelineElementList
+            .map((element) => element.element?.ref)
+            .filter((ref): ref is AudioOriginal | VideoOriginal => isAudioOriginal(ref) || isVideoOriginal(ref))
+            .map((ref) => ref.filePath)));
+        const mediaDurations = await getMediaDurations(filePaths);
+        const fileDurations = new Map(filePaths.map((filePath, index) => [filePath, mediaDurations[index]] as [string, number]));
+        const durations = timelineElementList.map((element) => getTimelineElementDuration(element, fileDurations));
+        const placements = solveTimeline(timelineElementList.map((element, index) => getTimelinePlacement(element, durations[index])));
+        const populatedTimeTimelineElements = timelineElementList
+            .map((element, index) => ({
+                node: element,
+                name: element.name,
+                calculatedStartAt: placements[index].startAt,
+                calculatedFinishAt: placements[index].finishAt,
+                layer: placements[index].layer,
+            }))
+            .filter(({ node }) => node.name && node.element?.ref);
+
         // Check if for all relative timeline elements, the startAt is not negative
         populatedTimeTimelineElements.forEach((element) => {
             if ((element.calculatedStartAt || 0) < 0) {
-                accept('error', 'This timeline element will start before the beginning of the video, which is not allowed', { node: element });
+                accept('error', 'This timeline element will start before the beginning of the video, which is not allowed', { node: element.node });
             }
         });
 
-        // Check if some timeline elements that are on the same layer might overlap
-        populatedTimeTimelineElements.forEach((fromElement) => {
-            populatedTimeTimelineElements.forEach((toElement) => {
-                if (fromElement.name === toElement.name) return;
-                if (fromElement.layer !== toElement.layer) return;
-
-                const isToStartInsideFrom = ((fromElement.calculatedStartAt || 0) < (toElement.calculatedStartAt || 0) && (toElement.calculatedStartAt || 0) < (fromElement.calculatedFinishAt || 0));
-                const isToEndInsideFrom = ((fromElement.calculatedStartAt || 0) < (toElement.calculatedFinishAt || 0) && (toElement.calculatedFinishAt || 0) < (fromElement.calculatedFinishAt || 0));
+        // Check if some timeline elements that are on the same layer might overlap. Sorted by layer and start, an
+        // element is only compared with the next ones of its layer that start before it ends
+        const intervals = populatedTimeTimelineElements
+            .map((element) => {
+                const start = element.calculatedStartAt || 0;
+                const finish = element.calculatedFinishAt || 0;
+                return { element, start, finish, low: Math.min(start, finish), high: Math.max(start, finish) };
+            })
+            .sort((a, b) => a.element.layer - b.element.layer || a.low - b.low);
 
-                if (isToStartInsideFrom || isToEndInsideFrom) {
-                    accept('warning', `This element is overlapping with ${toElement.name} on the same layer`, { node: fromElement });
-                }
-            });
+        const checkOverlap = (from: typeof intervals[number], to: typeof intervals[number]) => {
+            const isToStartInsideFrom = from.start < to.start && to.start < from.finish;
+            const isToEndInsideFrom = from.start < to.finish && to.finish < from.finish;
+            if (isToStartInsideFrom || isToEndInsideFrom) {
+                accept('warning', `This element is overlapping with ${to.element.name} on the same layer`, { node: from.element.node });
+            }
+        };
+        intervals.forEach((interval, i) => {
+            for (let j = i + 1; j < intervals.length; j++) {
+                const other = intervals[j];
+                if (other.element.layer !== interval.element.layer || other.low >= interval.high) break;
+                if (other.element.name === interval.element.name) continue;
+                checkOverlap(interval, other);
+                checkOverlap(other, interval);
+            }
         });
     }
 
@@ -460,7 +421,6 @@ export class VideoMlValidator {
             errors = await invokeSpecialCommand(
                 'validate-file',
                 { path: videoOriginal.filePath },
-                { needNodeJs: true },
             );
         }
 
@@ -480,7 +440,6 @@ export class VideoMlValidator {
             errors = await invokeSpecialCommand(
                 'validate-file',
                 { path: audioOriginal.filePath },
-                { needNodeJs: true },
             );
         }
 
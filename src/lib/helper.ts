@@ -1,4 +1,5 @@
-import { TimelineElement } from "../language-server/generated/ast.js";
+import { isFixedTimelineElement, isRelativeTimelineElement, TimelineElement } from "../language-server/generated/ast.js";
+import { TimelinePlacement } from "./timeline-solver.js";
 
 export function helperTimeToSeconds(time: string): number {
     const minuteSecondArray = time.split(':');
@@ -25,14 +26,33 @@ export function helperOffsetTimeToSeconds(offsetTime: string | undefined): numbe
     return offset;
 }
 
-export function getLayer(te: TimelineElement): number {
-    if (!te.layerPosition) return 0;
-    
-    const diff = te.layerPosition.position === 'above' ? 1 : -1;
-    const timelineElementRef = te.layerPosition.relativeTo.ref;
-    if (!timelineElementRef) return diff;
+/**
+ * Description of the placement of a timeline element, as solved by `solveTimeline`. The duration is only
+ * known to the caller (originals need their file).
+ */
+export function getTimelinePlacement(te: TimelineElement, duration?: number): TimelinePlacement {
+    const placement: TimelinePlacement = { name: te.name, duration };
+    if (isRelativeTimelineElement(te)) {
+        placement.relativePlacement = {
+            offset: helperOffsetTimeToSeconds(te.offset),
+            relativeTo: te.relativeTo?.ref?.name,
+            place: te.place === 'start' ? 'START' : 'END',
+        };
+    } else if (isFixedTimelineElement(te)) {
+        placement.startAt = helperTimeToSeconds(te.startAt);
+    } else if (te.$containerIndex === 0) {
+        placement.startAt = 0;
+    } else {
+        placement.startAfterPrevious = true;
+    }
 
-    return diff + getLayer(timelineElementRef);
+    if (te.layerPosition) {
+        placement.layerPosition = {
+            relativeTo: te.layerPosition.relativeTo?.ref?.name,
+            position: te.layerPosition.position === 'above' ? 'ABOVE' : 'UNDER',
+        };
+    }
+    return placement;
 }
 
 export function getTimelineElementTextualDuration(duration: string | undefined): string {
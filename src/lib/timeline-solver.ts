@@ -0,0 +1,128 @@
+/**
+ * Placement of the timeline elements on the timeline: start, end and layer of every element, solved in a
+ * single pass. Each element depends on at most one other element for its start (the element it is placed
+ * relative to, or the previous one) and at most one for its layer: every element is solved once, after the
+ * element it depends on.
+ *
+ * This file must not import anything: it is copied to the UI (scripts/copy-libs-to-ui.mjs), which places the
+ * elements once the durations of their files are known.
+ */
+
+export interface TimelinePlacement {
+    name: string;
+    duration?: number;
+    startAt?: number;
+    startAfterPrevious?: boolean;
+    relativePlacement?: {
+        offset: number;
+        relativeTo?: string; // Timeline element name, undefined when the reference is not resolved
+        place: 'START' | 'END';
+    }
+    layerPosition?: {
+        relativeTo?: string; // Timeline element name, undefined when the reference is not resolved
+        position: 'ABOVE' | 'UNDER';
+    }
+}
+
+export interface SolvedTimelinePlacement {
+    // Undefined when the start depends on itself (relative placements forming a cycle)
+    startAt?: number;
+    duration: number;
+    finishAt?: number;
+    layer: number;
+}
+
+const UNSOLVED = 0;
+const SOLVING = 1;
+const SOLVED = 2;
+
+export function solveTimeline(elements: TimelinePlacement[]): SolvedTimelinePlacement[] {
+    const indexes = new Map<string, number>();
+    elements.forEach((element, index) => {
+        if (!indexes.has(element.name)) indexes.set(element.name, index);
+    });
+    const getIndex = (name: string | undefined) => name === undefined ? undefined : indexes.get(name);
+
+    const solved: SolvedTimelinePlacement[] = elements.map((element) => ({ duration: element.duration || 0, layer: 0 }));
+
+    // Start and end
+    solveInDependencyOrder(
+        elements.length,
+        (index) => {
+            const element = elements[index];
+            if (element.relativePlacement) return getIndex(element.relativePlacement.relativeTo);
+            if (element.startAfterPrevious && index > 0) return index - 1;
+            return undefined;
+        },
+        (index, isInCycle) => {
+            const element = elements[index];
+            const info = solved[index];
+            if (isInCycle) return;
+
+            if (element.relativePlacement) {
+                const relativeToIndex = getIndex(element.relativePlacement.relativeTo);
+                if (relativeToIndex === undefined) {
+                    info.startAt = 0;
+                } else {
+                    const relativeTo = solved[relativeToIndex];
+                    const placeAtEnd = element.relativePlacement.place === 'END';
+                    info.startAt = relativeTo.startAt === undefined
+                        ? undefined
+                        : relativeTo.startAt + element.relativePlacement.offset + (placeAtEnd ? relativeTo.duration : 0);
+                }
+            } else if (element.startAfterPrevious) {
+                info.startAt = index > 0 ? solved[index - 1].finishAt : 0;
+            } else {
+                info.startAt = element.startAt || 0;
+            }
+
+            if (info.startAt !== undefined) {
+                info.finishAt = info.startAt + info.duration;
+            }
+        },
+    );
+
+    // Layer
+    solveInDependencyOrder(
+        elements.length,
+        (index) => getIndex(elements[index].layerPosition?.relativeTo),
+        (index, isInCycle) => {
+            const layerPosition = elements[index].layerPosition;
+            if (!layerPosition) return;
+
+            const diff = layerPosition.position === 'ABOVE' ? 1 : -1;
+            const relativeToIndex = getIndex(layerPosition.relativeTo);
+            solved[index].layer = diff + (isInCycle || relativeToIndex === undefined ? 0 : solved[relativeToIndex].layer);
+        },
+    );
+
+    return solved;
+}
+
+/**
+ * Calls `solve` on every index after the index it depends on. Each index depends on at most one other, the
+ * dependencies are followed iteratively so that long chains don't grow the call stack.
+ */
+function solveInDependencyOrder(
+    count: number,
+    getDependency: (index: number) => number | undefined,
+    solve: (index: number, isInCycle: boolean) => void,
+) {
+    const states = new Array<number>(count).fill(UNSOLVED);
+    for (let first = 0; first < count; first++) {
+        const path: number[] = [];
+        let index: number | undefined = first;
+        while (index !== undefined && states[index] === UNSOLVED) {
+            states[index] = SOLVING;
+            path.push(index);
+            index = getDependency(index);
+        }
+
+        // The path ends on an index already solved, without dependency, or on itself (cycle)
+        const cycleStart = index !== undefined && states[index] === SOLVING ? path.indexOf(index) : path.length;
+        for (let i = path.length - 1; i >= 0; i--) {
+            solve(path[i], i >= cycleStart);
+            states[path[i]] = SOLVED;
+        }
+    }
+}
@@ -0,0 +1,105 @@
+import { spawn, ChildProcess } from 'node:child_process'
+import http from 'node:http'
+
+// Python process serving the frames of the preview program for the timeline (see
+// videoml_runtime/frame_server.py). It is started in the directory of the project, next to its
+// videoml_runtime package, and answers HTTP requests on a local port: the page shows the frames
+// as images, from `${url}/frame?t=<seconds>`.
+
+// Final video of the loaded program
+export interface FrameServerProgram {
+  url: string;
+  version: number; // Changes with each loaded program, appended to the frame URLs
+  duration: number; // In seconds
+  fps: number;
+  frames: number;
+  size: [number, number];
+}
+
+export class FrameServer {
+  private process: ChildProcess | undefined
+  private cwd: string | undefined
+  private port: Promise<number> | undefined
+
+  constructor(private pythonPath: string) {}
+
+  // Starts the server in `cwd`, unless it already runs there, resolves with its port
+  start(cwd: string): Promise<number> {
+    if (this.port && this.cwd === cwd) return this.port
+    this.stop()
+
+    const server = spawn(this.pythonPath, ['-m', 'videoml_runtime.frame_server'], {
+      cwd,
+      stdio: ['pipe', 'pipe', 'pipe'],
+    })
+    this.process = server
+    this.cwd = cwd
+    this.port = new Promise((resolve, reject) => {
+      let stdout = ''
+      server.stdout?.on('data', (data) => {
+        stdout += data.toString()
+        const lines = stdout.split('\n')
+        stdout = lines.pop() || ''
+        for (const line of lines) {
+          try {
+            const message = JSON.parse(line)
+            if (message?.type === 'ready') resolve(message.port)
+          } catch {
+            // Printed by the loaded programs
+          }
+        }
+      })
+      server.stderr?.on('data', (data) => {
+        console.error('Frame server:', data.toString())
+      })
+      server.on('error', reject)
+      server.on('close', (code) => {
+        if (this.process === server) {
+          this.process = undefined
+          this.cwd = undefined
+          this.port = undefined
+        }
+        reject(new Error(`Frame server exited with code ${code}`))
+      })
+    })
+    return this.port
+  }
+
+  // Loads the program `programPath`, the next frames are the ones of its final video
+  async load(cwd: string, programPath: string): Promise<FrameServerProgram> {
+    const port = await this.start(cwd)
+    const body = JSON.stringify({ program: programPath })
+    const response = await new Promise<{ status: number, data: string }>((resolve, reject) => {
+      const request = http.request({
+        host: '127.0.0.1',
+        port,
+        path: '/load',
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'Content-Length': Buffer.byteLength(body) },
+      }, (res) => {
+        let data = ''
+        res.on('data', (chunk) => data += chunk)
+        res.on('end', () => resolve({ status: res.statusCode ?? 0, data }))
+      })
+      request.on('error', reject)
+      request.end(body)
+    })
+    if (response.status !== 200) {
+      // Traceback of the program
+      throw new Error(response.data)
+    }
+    return { url: `http://127.0.0.1:${port}`, ...JSON.parse(response.data) }
+  }
+
+  stop() {
+    const server = this.process
+    this.process = undefined
+    this.cwd = undefined
+    this.port = undefined
+    if (server) {
+      // Stops at the end of its stdin
+      server.stdin?.end()
+      server.kill()
+    }
+  }
+}
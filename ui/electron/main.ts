@@ -3,9 +3,15 @@ import { createRequire } from 'node:module'
 import { fileURLToPath } from 'node:url'
 import path from 'node:path'
 import fs from 'node:fs'
-import { spawn, ChildProcessWithoutNullStreams } from 'child_process';
+import os from 'node:os'
+import crypto from 'node:crypto'
+import { spawn } from 'child_process';
 
 import { validateFilePath } from '../lib/generated/validators/special-validators'
+import { MediaIndex } from './media-index'
+import { RenderEvent } from './render-daemon'
+import { RenderJob, RenderQueue } from './render-queue'
+import { FrameServer } from './frame-server'
 
 const require = createRequire(import.meta.url)
 const __dirname = path.dirname(fileURLToPath(import.meta.url))
@@ -28,6 +34,109 @@ export const RENDERER_DIST = path.join(process.env.APP_ROOT, 'dist')
 
 const PYTHON_PATH = process.platform === "win32" ? "py" : "python3";
 
+// ffmpeg binary of moviepy (imageio-ffmpeg, installed with the requirements), or the one of the PATH
+let ffmpegPath: Promise<string> | undefined;
+function getFfmpegPath(): Promise<string> {
+  if (!ffmpegPath) {
+    ffmpegPath = new Promise((resolve) => {
+      const ffmpegCheck = spawn(PYTHON_PATH, ["-c", "import imageio_ffmpeg; print(imageio_ffmpeg.get_ffmpeg_exe())"]);
+      let output = '';
+      ffmpegCheck.stdout.on("data", (data) => {
+        output += data.toString();
+      });
+      ffmpegCheck.on("error", () => resolve('ffmpeg'));
+      ffmpegCheck.on("close", (code) => {
+        resolve(code === 0 && output.trim() ? output.trim() : 'ffmpeg');
+      });
+    });
+  }
+  return ffmpegPath;
+}
+
+// Metadata of the media files, kept across sessions
+const mediaIndexPath = path.join(app.getPath('userData'), 'media-index.json');
+const mediaIndex = new MediaIndex(mediaIndexPath, getFfmpegPath);
+// The Python processes started by the app read the metadata and the keyframes listed by the index (see videoml_runtime/sources.py)
+process.env.VIDEOML_MEDIA_INDEX = mediaIndexPath;
+
+// Renders of the Generate button and of the batches, run by Python daemons sharing the CPU cores
+// (one render at a time by default, with one worker per core)
+let interactiveJob: RenderJob | undefined;
+const renderQueue = new RenderQueue(
+  path.join(app.getPath('userData'), 'render-queue.json'),
+  PYTHON_PATH,
+  os.cpus().length,
+  {
+    onChange: (jobs, concurrency) => win?.webContents.send('render-queue-updated', { jobs, concurrency }),
+    onEvent: (job, event) => {
+      if (job === interactiveJob) handleRenderEvent(event);
+    },
+    onStderr: (job, data) => {
+      if (job === interactiveJob) handleRenderStderr(data);
+    },
+    onFinished: (job) => {
+      if (job === interactiveJob) {
+        interactiveJob = undefined;
+        win?.webContents.send('video-generation-finished', job.exitCode);
+      } else if (!job.interactive && job.status !== 'failed') {
+        // The program of a failed job is kept to look at the error
+        fs.promises.rm(job.programPath, { force: true }).catch((err) => console.error(err));
+      }
+    },
+  },
+  1,
+);
+// Programs of the queued jobs, the video.py of the project is overwritten by the next generation
+const INTERACTIVE_PRIORITY = 100;
+const renderQueueProgramsPath = path.join(app.getPath('userData'), 'render-queue');
+
+// Frames of the preview program shown by the timeline, started by the first program loaded
+const frameServer = new FrameServer(PYTHON_PATH);
+const frameServerProgramPath = path.join(app.getPath('userData'), 'frame-server', 'program.py');
+
+// Hash of the requirements installed by the last successful pip run, pip isn't run again while it is the same
+const requirementsStampPath = path.join(app.getPath('userData'), 'requirements-installed.txt');
+
+// mm:ss, as in the progress bars
+function formatDuration(seconds: number): string {
+  const minutes = Math.floor(seconds / 60);
+  return `${String(minutes).padStart(2, '0')}:${String(Math.floor(seconds % 60)).padStart(2, '0')}`;
+}
+
+// The progress comes as events, stderr only holds the errors and warnings of the program
+function handleRenderStderr(errorString: string) {
+  console.error('Python process error:', errorString);
+  if (win) {
+    win.webContents.send('video-generation-error', errorString);
+  }
+}
+
+function handleRenderEvent(event: RenderEvent) {
+  if (event.type === 'done') {
+    console.log('Video generated:', event);
+    return;
+  }
+  if (event.type !== 'progress' || !event.total || !win) return;
+
+  const processedFrames = event.index || 0;
+  const elapsed = event.elapsed || 0;
+  const itPerSecond = elapsed > 0 ? processedFrames / elapsed : 0;
+  win.webContents.send('video-generation-progress', {
+    progress: Math.floor(processedFrames / event.total * 100),
+    processedFrames,
+    totalFrames: event.total,
+    elapsedTime: formatDuration(elapsed),
+    etaTime: itPerSecond > 0 ? formatDuration((event.total - processedFrames) / itPerSecond) : undefined,
+    itPerSecond,
+    stages: event.stages,
+    peakRss: event.peak_rss ?? undefined,
+    partsDone: event.parts_done,
+    partsQueued: event.parts_queued,
+    isChunk: event.bar === 'chunk',
+    isFrameIndex: event.bar === 'frame_index',
+  });
+}
+
 process.env.VITE_PUBLIC = VITE_DEV_SERVER_URL ? path.join(process.env.APP_ROOT, 'public') : RENDERER_DIST
 
 let win: BrowserWindow | null
@@ -62,6 +171,10 @@ function createWindow() {
   ipcMain.handle('validate-file', async (_, { path: videoFilePath }) => {
     return await validateFilePath(videoFilePath);
   });
+  // Metadata of media files (undefined for the files that can't be read), probed in parallel
+  ipcMain.handle('get-media-infos', async (_, { paths }: { paths: string[] }) => {
+    return await mediaIndex.getAll(paths);
+  });
   // END - HANDLERS FOR VALIDATOR
 
   // Get NodeJS process
@@ -82,8 +195,9 @@ function createWindow() {
     shell.showItemInFolder(fullPath);
   });
 
-  ipcMain.handle('generate-python-file', async (_, code, dirPath) => {
-    const fullPath = path.join(dirPath.replace(/\n$/, ''), 'video.py');
+  // `fileName` is preview.py for the program of a preview
+  ipcMain.handle('generate-python-file', async (_, code, dirPath, fileName = 'video.py') => {
+    const fullPath = path.join(dirPath.replace(/\n$/, ''), fileName);
 
     try {
         await fs.promises.writeFile(fullPath, code);
@@ -125,6 +239,15 @@ function createWindow() {
   });
 
   ipcMain.handle('install-requirements', async () => {
+    const requirementsHash = crypto.createHash('sha256')
+      .update(PYTHON_PATH)
+      .update(await fs.promises.readFile('requirements.txt').catch(() => ''))
+      .digest('hex');
+    const installedHash = await fs.promises.readFile(requirementsStampPath, 'utf-8').catch(() => undefined);
+    if (installedHash === requirementsHash) {
+      return true;
+    }
+
     const requirements = spawn(PYTHON_PATH, ["-m", "pip", "install", "-r", "requirements.txt"]);
 
     const result = await new Promise((resolve, reject) => {
@@ -143,88 +266,75 @@ function createWindow() {
       });
     });
 
+    await fs.promises.writeFile(requirementsStampPath, requirementsHash).catch((err) => console.error(err));
+    // The daemons imported the previous versions of the packages
+    renderQueue.restartIdleDaemons();
     return result;
   });
 
-  let pythonProcess: ChildProcessWithoutNullStreams | undefined;
-  ipcMain.handle('generate-video', (_, path) => {
-    const fullPath = path.replace(/\n$/, '') + '/video.py';
-    pythonProcess = spawn(PYTHON_PATH, [fullPath]);
-
-    // Setup data listeners
-    pythonProcess.stderr.on("data", (err) => {
-      const errorString = err.toString();
-      console.error('Python process error:', errorString);
-      // frame_index:  10%|▉         | 134/1354 [00:01<00:16, 73.30it/s, now=None]
-      // Extract progess, processed frame, total frame, elapsed time, eta time, its
-
-      // Regex to capture the desired components
-      const frameIndexRegex = /frame_index:\s+(\d+)%\|.*?\|\s+(\d+)\/(\d+)\s+\[(\d{2}:\d{2})<(\d{2}:\d{2}),\s+([\d.]+)it\/s/;
-      const chunkRegex = /chunk:\s+(\d+)%\|.*?\|\s+(\d+)\/(\d+)\s+\[(\d{2}:\d{2})<(\d{2}:\d{2}),\s+([\d.]+)it\/s/;
-
-      const frameIndexMatch = errorString.match(frameIndexRegex);
-      const chunkMatch = errorString.match(chunkRegex);
-
-      if (frameIndexMatch) {
-        const progress = parseInt(frameIndexMatch[1], 10);       // Progress in percentage
-        const processedFrames = parseInt(frameIndexMatch[2], 10); // Number of frames processed
-        const totalFrames = parseInt(frameIndexMatch[3], 10);    // Total number of frames
-        const elapsedTime = frameIndexMatch[4];                  // Elapsed time (hh:mm)
-        const etaTime = frameIndexMatch[5];                      // Estimated time remaining (hh:mm)
-        const itPerSecond = parseFloat(frameIndexMatch[6]);      // Iterations per second (it/s)
-
-        if (win) {
-            win.webContents.send('video-generation-progress', {
-              progress,
-              processedFrames,
-              totalFrames,
-              elapsedTime,
-              etaTime,
-              itPerSecond,
-              isFrameIndex: true,
-            });
-        }
-      } else if (chunkMatch) {
-        const progress = parseInt(chunkMatch[1], 10);       // Progress in percentage
-        const processedFrames = parseInt(chunkMatch[2], 10); // Number of frames processed
-        const totalFrames = parseInt(chunkMatch[3], 10);    // Total number of frames
-        const elapsedTime = chunkMatch[4];                  // Elapsed time (hh:mm)
-        const etaTime = chunkMatch[5];                      // Estimated time remaining (hh:mm)
-        const itPerSecond = parseFloat(chunkMatch[6]);      // Iterations per second (it/s)
-
-        if (win) {
-            win.webContents.send('video-generation-progress', {
-              progress,
-              processedFrames,
-              totalFrames,
-              elapsedTime,
-              etaTime,
-              itPerSecond,
-              isChunk: true,
-            });
-        }
-      } else {
-        // Send error to renderer process if it's not a progress update
-        const ignoreRegex = /chunk|frame_index/;
-        if (!ignoreRegex.test(errorString) && win) {
-          win.webContents.send('video-generation-error', errorString);
-        }
-      }
-    });
-
-    // Setup close listener
-    pythonProcess.on("close", (code) => {
-      if (win) {
-        win.webContents.send('video-generation-finished', code);
-      }
+  // `workers` is the number of processes rendering the timeline in parallel (defaults to the share
+  // of the CPU cores of the render), `programName` the generated program (video.py or preview.py)
+  ipcMain.handle('generate-video', async (_, path, { workers, programName = 'video.py' }: { workers?: number, programName?: string } = {}) => {
+    const dirPath = path.replace(/\n$/, '');
+    const fullPath = dirPath + '/' + programName;
+
+    // Rendered before the queued jobs, a previous render of the project is replaced
+    const previousJob = interactiveJob;
+    interactiveJob = undefined;
+    if (previousJob) {
+      renderQueue.cancel(previousJob.id);
+    }
+    interactiveJob = await renderQueue.add({
+      name: programName,
+      programPath: fullPath,
+      cwd: dirPath,
+      priority: INTERACTIVE_PRIORITY,
+      env: workers ? { VIDEOML_WORKERS: String(workers) } : undefined,
+      interactive: true,
     });
   });
 
   ipcMain.handle('cancel-video-generation', () => {
-    if (pythonProcess) {
-      pythonProcess.kill('SIGINT');
+    if (interactiveJob) {
+      renderQueue.cancel(interactiveJob.id);
     }
-  }); 
+  });
+
+  // START - HANDLERS FOR THE RENDER QUEUE
+  // Queues the render of `code`, its program is copied so that the project can be edited meanwhile
+  ipcMain.handle('render-queue-add', async (_, { code, dirPath, name, priority }: { code: string, dirPath: string, name: string, priority?: number }) => {
+    await fs.promises.mkdir(renderQueueProgramsPath, { recursive: true });
+    const programPath = path.join(renderQueueProgramsPath, `${crypto.randomUUID()}.py`);
+    await fs.promises.writeFile(programPath, code);
+    return await renderQueue.add({ name, programPath, cwd: dirPath.replace(/\n$/, ''), priority: priority ?? 0 });
+  });
+  ipcMain.handle('render-queue-list', () => {
+    return { jobs: renderQueue.getJobs(), concurrency: renderQueue.getConcurrency() };
+  });
+  ipcMain.handle('render-queue-cancel', (_, id: number) => {
+    renderQueue.cancel(id);
+  });
+  ipcMain.handle('render-queue-set-priority', (_, id: number, priority: number) => {
+    renderQueue.setPriority(id, priority);
+  });
+  ipcMain.handle('render-queue-set-concurrency', (_, concurrency: number) => {
+    renderQueue.setConcurrency(concurrency);
+  });
+  ipcMain.handle('render-queue-clear-finished', () => {
+    renderQueue.clearFinished();
+  });
+  // END - HANDLERS FOR THE RENDER QUEUE
+
+  // Loads the (preview) program `code` of the project in `dirPath` in the frame server, returns the URL
+  // of its frames with the infos of its final video
+  ipcMain.handle('frame-server-load', async (_, code: string, dirPath: string) => {
+    await fs.promises.mkdir(path.dirname(frameServerProgramPath), { recursive: true });
+    await fs.promises.writeFile(frameServerProgramPath, code);
+    return await frameServer.load(dirPath.replace(/\n$/, ''), frameServerProgramPath);
+  });
+
+  // Import the runtime while the project is edited, the first render starts without waiting for it
+  renderQueue.warmUp(process.cwd());
 
   if (VITE_DEV_SERVER_URL) {
     win.loadURL(VITE_DEV_SERVER_URL)
@@ -244,6 +354,13 @@ app.on('window-all-closed', () => {
   }
 })
 
+// The queued renders and the frame server keep running while the app stays active without a window,
+// they are stopped when it quits (on every platform, including Cmd + Q on macOS)
+app.on('before-quit', () => {
+  renderQueue.stop()
+  frameServer.stop()
+})
+
 app.on('activate', () => {
   // On OS X it's common to re-create a window in the app when the
   // dock icon is clicked and there are no other windows open.
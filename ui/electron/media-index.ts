@@ -0,0 +1,200 @@
+import { execFile } from 'node:child_process'
+import fs from 'node:fs'
+import os from 'node:os'
+import path from 'node:path'
+
+// Index of the metadata of the media files (duration, resolution, codecs...), persisted across sessions.
+// An entry is reused as long as the size and the modification time of its file don't change.
+// Files are probed by ffmpeg (the one moviepy uses), several at a time; their keyframes are listed
+// afterwards, one file at a time, as decoding every keyframe takes much longer than reading the header.
+// The renders read the metadata of the sources from the saved index instead of probing them again,
+// and their keyframes to copy the untouched spans of the sources.
+
+export interface MediaInfo {
+  duration: number; // In seconds
+  width?: number;
+  height?: number;
+  rotation?: number; // In degrees
+  fps?: number;
+  videoCodec?: string;
+  audioCodec?: string;
+  audioChannels?: number;
+  keyframes?: number[]; // In seconds, listed after the first probe
+}
+
+interface MediaIndexEntry {
+  size: number;
+  mtimeMs: number;
+  info: MediaInfo;
+}
+
+const SAVE_DELAY = 1000; // ms
+
+// Runs at most `size` tasks at the same time
+class TaskPool {
+  private running = 0
+  private queue: (() => void)[] = []
+
+  constructor(private size: number) {}
+
+  run<T>(task: () => Promise<T>): Promise<T> {
+    return new Promise<T>((resolve, reject) => {
+      const start = () => {
+        this.running++
+        task().then(resolve, reject).finally(() => {
+          this.running--
+          this.queue.shift()?.()
+        })
+      }
+      if (this.running < this.size) {
+        start()
+      } else {
+        this.queue.push(start)
+      }
+    })
+  }
+}
+
+export class MediaIndex {
+  private entries: Record<string, MediaIndexEntry> | undefined
+  private probes = new Map<string, Promise<MediaInfo | undefined>>()
+  private probePool = new TaskPool(os.cpus().length)
+  private keyframePool = new TaskPool(1)
+  private keyframeScans = new Set<string>()
+  private saveTimeout: NodeJS.Timeout | undefined
+
+  constructor(private indexPath: string, private getFfmpegPath: () => Promise<string>) {}
+
+  // Metadata of the file, undefined if it can't be read
+  async get(filePath: string): Promise<MediaInfo | undefined> {
+    const absolutePath = path.resolve(filePath)
+    let stat: fs.Stats
+    try {
+      stat = await fs.promises.stat(absolutePath)
+    } catch {
+      return undefined
+    }
+
+    const entry = this.getEntries()[absolutePath]
+    if (entry && entry.size === stat.size && entry.mtimeMs === stat.mtimeMs) {
+      if (entry.info.videoCodec && !entry.info.keyframes) {
+        // The previous session ended before listing them
+        this.getFfmpegPath().then((ffmpegPath) => this.listKeyframes(ffmpegPath, absolutePath, entry.info))
+      }
+      return entry.info
+    }
+
+    // Probe each version of the file once, even when it is requested several times meanwhile
+    const probeKey = `${absolutePath}:${stat.size}:${stat.mtimeMs}`
+    let probe = this.probes.get(probeKey)
+    if (!probe) {
+      probe = this.probe(absolutePath, stat).finally(() => this.probes.delete(probeKey))
+      this.probes.set(probeKey, probe)
+    }
+    return probe
+  }
+
+  // Metadata of several files, probed in parallel
+  getAll(filePaths: string[]): Promise<(MediaInfo | undefined)[]> {
+    return Promise.all(filePaths.map((filePath) => this.get(filePath)))
+  }
+
+  private async probe(absolutePath: string, stat: fs.Stats): Promise<MediaInfo | undefined> {
+    const ffmpegPath = await this.getFfmpegPath()
+    // ffmpeg exits with an error without an output file, after printing the streams of the input
+    const output = await this.probePool.run(() => runFfmpeg(ffmpegPath, ['-hide_banner', '-i', absolutePath]))
+    const info = parseMediaInfo(output)
+    if (!info) return undefined
+
+    this.getEntries()[absolutePath] = { size: stat.size, mtimeMs: stat.mtimeMs, info }
+    this.scheduleSave()
+    if (info.videoCodec) {
+      this.listKeyframes(ffmpegPath, absolutePath, info)
+    }
+    return info
+  }
+
+  private listKeyframes(ffmpegPath: string, absolutePath: string, info: MediaInfo) {
+    if (this.keyframeScans.has(absolutePath)) return
+    this.keyframeScans.add(absolutePath)
+
+    this.keyframePool.run(() => runFfmpeg(ffmpegPath, [
+      '-hide_banner', '-skip_frame', 'nokey', '-i', absolutePath,
+      '-map', '0:v:0', '-vf', 'showinfo', '-f', 'null', '-',
+    ])).then((output) => {
+      const keyframes = Array.from(output.matchAll(/pts_time:\s*([\d.]+)/g), (match) => parseFloat(match[1]))
+      if (keyframes.length > 0) {
+        info.keyframes = keyframes
+        this.scheduleSave()
+      }
+    }).finally(() => this.keyframeScans.delete(absolutePath))
+  }
+
+  private getEntries(): Record<string, MediaIndexEntry> {
+    if (!this.entries) {
+      try {
+        this.entries = JSON.parse(fs.readFileSync(this.indexPath, 'utf-8'))
+      } catch {
+        this.entries = {}
+      }
+    }
+    return this.entries as Record<string, MediaIndexEntry>
+  }
+
+  private scheduleSave() {
+    if (this.saveTimeout) return
+    this.saveTimeout = setTimeout(async () => {
+      this.saveTimeout = undefined
+      // Written next to the index then renamed, a crash never leaves half of it
+      const temporaryPath = `${this.indexPath}.tmp`
+      try {
+        await fs.promises.mkdir(path.dirname(this.indexPath), { recursive: true })
+        await fs.promises.writeFile(temporaryPath, JSON.stringify(this.getEntries()))
+        await fs.promises.rename(temporaryPath, this.indexPath)
+      } catch (err) {
+        console.error('Failed to save the media index:', err)
+      }
+    }, SAVE_DELAY)
+  }
+}
+
+// Resolves with the log of ffmpeg, whatever its exit code
+function runFfmpeg(ffmpegPath: string, args: string[]): Promise<string> {
+  return new Promise((resolve) => {
+    execFile(ffmpegPath, args, { maxBuffer: 64 * 1024 * 1024 }, (_, __, stderr) => {
+      resolve(stderr || '')
+    })
+  })
+}
+
+export function parseMediaInfo(output: string): MediaInfo | undefined {
+  const durationMatch = output.match(/Duration:\s+(\d+):(\d+):([\d.]+)/)
+  if (!durationMatch) return undefined
+
+  const info: MediaInfo = {
+    duration: parseInt(durationMatch[1], 10) * 3600 + parseInt(durationMatch[2], 10) * 60 + parseFloat(durationMatch[3]),
+  }
+
+  // Stream #0:0[0x1](und): Video: h264 (High) (avc1 / 0x31637661), yuv420p(progressive), 1920x1080 [SAR 1:1 DAR 16:9], 25 fps, ...
+  const videoMatch = output.match(/Stream #.*?: Video: (\w+).*?, (\d+)x(\d+)[^\n]*/)
+  if (videoMatch) {
+    info.videoCodec = videoMatch[1]
+    info.width = parseInt(videoMatch[2], 10)
+    info.height = parseInt(videoMatch[3], 10)
+    const fpsMatch = videoMatch[0].match(/, ([\d.]+) (?:fps|tbr)/)
+    if (fpsMatch) info.fps = parseFloat(fpsMatch[1])
+    const rotationMatch = output.match(/rotation of (-?[\d.]+) degrees/)
+    info.rotation = rotationMatch ? parseFloat(rotationMatch[1]) : 0
+  }
+
+  // Stream #0:1[0x2](und): Audio: aac (LC) (mp4a / 0x6134706D), 44100 Hz, stereo, fltp, 128 kb/s
+  const audioMatch = output.match(/Stream #.*?: Audio: (\w+)[^\n]*/)
+  if (audioMatch) {
+    info.audioCodec = audioMatch[1]
+    const layout = audioMatch[0].match(/Hz, ([^,]+)/)?.[1]
+    const channels: Record<string, number> = { mono: 1, stereo: 2, '2.1': 3, quad: 4, '5.0': 5, '5.1': 6, '7.1': 8 }
+    info.audioChannels = channels[layout?.replace(/\(.*\)/, '') || ''] || parseInt(layout || '', 10) || undefined
+  }
+
+  return info
+}
@@ -0,0 +1,156 @@
+import { spawn, ChildProcess } from 'node:child_process'
+import { Readable } from 'node:stream'
+
+// Long-lived Python process running the generated programs (see videoml_runtime/daemon.py).
+// It imports moviepy once and keeps the decoders of the sources open between renders, so a
+// render starts on its first frame instead of after the imports. It is started in the
+// directory of the program, next to its videoml_runtime package.
+// The events of the renders (see videoml_runtime/events.py) are read from its file descriptor 3.
+
+// Event of a render, one JSON line on the events descriptor
+export interface RenderEvent {
+  type: 'start' | 'progress' | 'done';
+  bar?: 'frame_index' | 'chunk';
+  index?: number;
+  total?: number;
+  elapsed?: number; // In seconds
+  frames?: number;
+  parts?: number;
+  workers?: number;
+  parts_done?: number;
+  parts_queued?: number;
+  stages?: Record<string, number>; // Seconds spent in each stage
+  peak_rss?: number | null; // In bytes
+}
+
+const EVENTS_FD = 3
+
+type RenderCallback = (code: number | null) => void
+
+interface RenderJob {
+  id: number;
+  onStderr: (data: string) => void;
+  onEvent: (event: RenderEvent) => void;
+  onFinished: RenderCallback;
+}
+
+export class RenderDaemon {
+  private process: ChildProcess | undefined
+  private cwd: string | undefined
+  private nextId = 1
+  private job: RenderJob | undefined
+  private stdout = ''
+  private events = ''
+
+  // `workers` is the number of worker processes started with the daemon, ready for the parts
+  // rendered in parallel
+  constructor(private pythonPath: string, private workers: number) {}
+
+  // Starts the daemon in `cwd`, unless it already runs there
+  start(cwd: string) {
+    if (this.process && this.cwd === cwd) return
+    this.stop()
+
+    const daemon = spawn(this.pythonPath, ['-m', 'videoml_runtime.daemon', '--workers', String(this.workers)], {
+      cwd,
+      env: { ...process.env, VIDEOML_EVENTS_FD: String(EVENTS_FD) },
+      stdio: ['pipe', 'pipe', 'pipe', 'pipe'],
+    })
+    this.process = daemon
+    this.cwd = cwd
+    this.stdout = ''
+    this.events = ''
+
+    daemon.stdout?.on('data', (data) => {
+      if (this.process !== daemon) return
+      // Messages are JSON lines, the other lines are printed by the programs
+      const lines = (this.stdout + data.toString()).split('\n')
+      this.stdout = lines.pop() || ''
+      lines.forEach((line) => this.handleMessage(line))
+    })
+    ;(daemon.stdio[EVENTS_FD] as Readable).on('data', (data) => {
+      if (this.process !== daemon) return
+      // An event can be split across two chunks, only whole lines are parsed
+      const lines = (this.events + data.toString()).split('\n')
+      this.events = lines.pop() || ''
+      lines.forEach((line) => this.handleEvent(line))
+    })
+    daemon.stderr?.on('data', (data) => {
+      if (this.process === daemon) {
+        this.job?.onStderr(data.toString())
+      }
+    })
+    daemon.on('error', (err) => {
+      console.error('Render daemon error:', err)
+    })
+    daemon.on('close', (code) => {
+      if (this.process !== daemon) return
+      // Stopped during a render (crashed, missing requirements...)
+      this.process = undefined
+      this.finishJob(code === 0 ? 1 : code)
+    })
+  }
+
+  // Runs the program `programPath` with the environment variables `env` added, resolves with its
+  // exit code (null when cancelled). One program runs at a time.
+  render(
+    cwd: string,
+    programPath: string,
+    env: Record<string, string>,
+    onStderr: (data: string) => void,
+    onEvent: (event: RenderEvent) => void,
+  ): Promise<number | null> {
+    return new Promise((resolve) => {
+      if (this.job) {
+        this.stop()
+      }
+      this.start(cwd)
+      const id = this.nextId++
+      this.job = { id, onStderr, onEvent, onFinished: resolve }
+      this.process?.stdin?.write(JSON.stringify({ type: 'render', id, program: programPath, env }) + '\n')
+    })
+  }
+
+  // Cancels the running program, the daemon keeps running. A message rather than SIGINT, which
+  // terminates the process on Windows
+  cancel() {
+    this.process?.stdin?.write(JSON.stringify({ type: 'cancel' }) + '\n')
+  }
+
+  stop() {
+    const daemon = this.process
+    this.process = undefined
+    this.cwd = undefined
+    if (daemon) {
+      daemon.stdin?.end()
+      daemon.kill()
+    }
+    this.finishJob(null)
+  }
+
+  private handleMessage(line: string) {
+    let message: { type?: string, id?: number, code?: number | null }
+    try {
+      message = JSON.parse(line)
+    } catch {
+      return
+    }
+    if (message?.type === 'done' && message.id === this.job?.id) {
+      this.finishJob(message.code ?? null)
+    }
+  }
+
+  private handleEvent(line: string) {
+    try {
+      this.job?.onEvent(JSON.parse(line))
+    } catch {
+      console.error('Invalid render event:', line)
+    }
+  }
+
+  private finishJob(code: number | null) {
+    const job = this.job
+    this.job = undefined
+    job?.onFinished(code)
+  }
+}
@@ -0,0 +1,261 @@
+import fs from 'node:fs'
+import path from 'node:path'
+
+import { RenderDaemon, RenderEvent } from './render-daemon'
+
+// Queue of the renders, run by a few render daemons at the same time. Every job renders one
+// generated program; its state is persisted, so a batch of renders left for the night goes on
+// after a restart of the application.
+// A free daemon takes the queued job of highest priority, and among them the one sharing the
+// most source files with the job it ran last: its decoders and probes of these files are reused.
+// The cores are shared between the running jobs: a job renders its parts with as many workers as
+// the cores divided by the jobs running or queued, so a job alone still gets all of them.
+
+export type RenderJobStatus = 'queued' | 'running' | 'done' | 'failed' | 'cancelled'
+
+export interface RenderJob {
+  id: number;
+  name: string;
+  programPath: string;
+  cwd: string; // Directory of the videoml_runtime package, the output is written there
+  priority: number; // Higher first
+  status: RenderJobStatus;
+  sources: string[]; // Files opened by the program
+  env?: Record<string, string>; // Environment variables added for the program
+  createdAt: number;
+  startedAt?: number;
+  finishedAt?: number;
+  exitCode?: number | null;
+  interactive?: boolean; // Started by the Generate button, not resumed after a restart
+}
+
+interface RenderQueueState {
+  concurrency: number;
+  nextId: number;
+  jobs: RenderJob[];
+}
+
+interface RenderSlot {
+  daemon: RenderDaemon;
+  job?: RenderJob;
+  lastSources: Set<string>;
+}
+
+export interface RenderQueueListener {
+  onChange: (jobs: RenderJob[], concurrency: number) => void;
+  onEvent: (job: RenderJob, event: RenderEvent) => void;
+  onStderr: (job: RenderJob, data: string) => void;
+  onFinished: (job: RenderJob) => void;
+}
+
+const SAVE_DELAY = 500 // ms
+// Finished jobs kept in the history
+const MAX_FINISHED_JOBS = 200
+
+export class RenderQueue {
+  private state: RenderQueueState
+  private slots: RenderSlot[] = []
+  private saveTimeout: NodeJS.Timeout | undefined
+  private stopped = false
+
+  constructor(
+    private statePath: string,
+    private pythonPath: string,
+    private cores: number,
+    private listener: RenderQueueListener,
+    defaultConcurrency: number,
+  ) {
+    this.state = this.load(defaultConcurrency)
+    this.resizeSlots()
+  }
+
+  getJobs(): RenderJob[] {
+    return this.state.jobs
+  }
+
+  getConcurrency(): number {
+    return this.state.concurrency
+  }
+
+  // Adds a job, the source files are read from the program
+  async add(job: Pick<RenderJob, 'name' | 'programPath' | 'cwd' | 'priority' | 'env' | 'interactive'>): Promise<RenderJob> {
+    const program = await fs.promises.readFile(job.programPath, 'utf-8').catch(() => '')
+    const newJob: RenderJob = {
+      ...job,
+      id: this.state.nextId++,
+      status: 'queued',
+      sources: getProgramSources(program, job.cwd),
+      createdAt: Date.now(),
+    }
+    this.state.jobs.push(newJob)
+    this.changed()
+    return newJob
+  }
+
+  // Removes a queued job, or stops a running one
+  cancel(id: number) {
+    const job = this.state.jobs.find((job) => job.id === id)
+    if (!job) return
+    if (job.status === 'queued') {
+      this.finish(job, 'cancelled', null)
+    } else if (job.status === 'running') {
+      this.slots.find((slot) => slot.job === job)?.daemon.cancel()
+    }
+  }
+
+  setPriority(id: number, priority: number) {
+    const job = this.state.jobs.find((job) => job.id === id)
+    if (!job) return
+    job.priority = priority
+    this.changed()
+  }
+
+  setConcurrency(concurrency: number) {
+    this.state.concurrency = Math.max(1, Math.round(concurrency))
+    this.resizeSlots()
+    this.changed()
+  }
+
+  // Removes the finished jobs from the history
+  clearFinished() {
+    this.state.jobs = this.state.jobs.filter((job) => job.status === 'queued' || job.status === 'running')
+    this.changed()
+  }
+
+  // Starts a daemon ahead of the first render
+  warmUp(cwd: string) {
+    this.slots[0]?.daemon.start(cwd)
+  }
+
+  // Stops the idle daemons, the next renders start new ones (after an update of the requirements)
+  restartIdleDaemons() {
+    this.slots.filter((slot) => !slot.job).forEach((slot) => slot.daemon.stop())
+  }
+
+  // Stops the daemons at the end of the session, the running jobs are started again by the next one
+  stop() {
+    this.stopped = true
+    clearTimeout(this.saveTimeout)
+    this.saveTimeout = undefined
+    try {
+      fs.mkdirSync(path.dirname(this.statePath), { recursive: true })
+      fs.writeFileSync(this.statePath, JSON.stringify(this.state))
+    } catch (err) {
+      console.error('Failed to save the render queue:', err)
+    }
+    this.slots.forEach((slot) => slot.daemon.stop())
+  }
+
+  private resizeSlots() {
+    // Each daemon starts with workers for its share of the cores, more are started when needed
+    const workers = Math.max(1, Math.floor(this.cores / this.state.concurrency))
+    while (this.slots.length < this.state.concurrency) {
+      this.slots.push({ daemon: new RenderDaemon(this.pythonPath, workers), lastSources: new Set() })
+    }
+    // Extra daemons stop once their job is done
+    this.slots.filter((slot, index) => index >= this.state.concurrency && !slot.job).forEach((slot) => slot.daemon.stop())
+    this.slots = this.slots.filter((slot, index) => index < this.state.concurrency || slot.job)
+  }
+
+  private schedule() {
+    const activeSlots = this.slots.slice(0, this.state.concurrency)
+    for (const slot of activeSlots) {
+      if (slot.job) continue
+      const queued = this.state.jobs.filter((job) => job.status === 'queued')
+      if (queued.length === 0) return
+
+      const sharedSources = (job: RenderJob) => job.sources.filter((source) => slot.lastSources.has(source)).length
+      queued.sort((a, b) => (b.priority - a.priority) || (sharedSources(b) - sharedSources(a)) || (a.createdAt - b.createdAt))
+      this.run(slot, queued[0])
+    }
+  }
+
+  private run(slot: RenderSlot, job: RenderJob) {
+    slot.job = job
+    slot.lastSources = new Set(job.sources)
+    job.status = 'running'
+    job.startedAt = Date.now()
+    this.changed(false)
+
+    const jobs = this.state.jobs.filter((job) => job.status === 'queued' || job.status === 'running').length
+    const workers = Math.max(1, Math.floor(this.cores / Math.min(jobs, this.state.concurrency)))
+    const env = { VIDEOML_WORKERS: String(workers), ...job.env }
+    slot.daemon.render(
+      job.cwd,
+      job.programPath,
+      env,
+      (data) => this.listener.onStderr(job, data),
+      (event) => this.listener.onEvent(job, event),
+    ).then((code) => {
+      if (this.stopped) return
+      slot.job = undefined
+      this.resizeSlots()
+      this.finish(job, code === 0 ? 'done' : code === null ? 'cancelled' : 'failed', code)
+    })
+  }
+
+  private finish(job: RenderJob, status: RenderJobStatus, code: number | null) {
+    job.status = status
+    job.exitCode = code
+    job.finishedAt = Date.now()
+    this.listener.onFinished(job)
+
+    const finished = this.state.jobs.filter((job) => job.status !== 'queued' && job.status !== 'running')
+    if (finished.length > MAX_FINISHED_JOBS) {
+      const removed = new Set(finished.slice(0, finished.length - MAX_FINISHED_JOBS))
+      this.state.jobs = this.state.jobs.filter((job) => !removed.has(job))
+    }
+    this.changed()
+  }
+
+  private changed(schedule = true) {
+    this.listener.onChange(this.state.jobs, this.state.concurrency)
+    this.scheduleSave()
+    if (schedule) {
+      this.schedule()
+    }
+  }
+
+  private load(defaultConcurrency: number): RenderQueueState {
+    let state: RenderQueueState
+    try {
+      state = JSON.parse(fs.readFileSync(this.statePath, 'utf-8'))
+    } catch {
+      return { concurrency: defaultConcurrency, nextId: 1, jobs: [] }
+    }
+    // The renders interrupted by the end of the previous session start again, except the ones
+    // of the Generate button whose program has been generated again since
+    state.jobs = state.jobs.filter((job) => !(job.interactive && (job.status === 'queued' || job.status === 'running')))
+    state.jobs.forEach((job) => {
+      if (job.status === 'running') {
+        job.status = 'queued'
+        job.startedAt = undefined
+      }
+    })
+    setTimeout(() => this.schedule())
+    return state
+  }
+
+  private scheduleSave() {
+    if (this.saveTimeout || this.stopped) return
+    this.saveTimeout = setTimeout(async () => {
+      this.saveTimeout = undefined
+      // Written next to the state then renamed, a crash never leaves half of it
+      const temporaryPath = `${this.statePath}.tmp`
+      try {
+        await fs.promises.mkdir(path.dirname(this.statePath), { recursive: true })
+        await fs.promises.writeFile(temporaryPath, JSON.stringify(this.state))
+        await fs.promises.rename(temporaryPath, this.statePath)
+      } catch (err) {
+        console.error('Failed to save the render queue:', err)
+      }
+    }, SAVE_DELAY)
+  }
+}
+
+// Files opened by a generated program (open_video("...") and open_audio("...")), relative paths
+// being resolved from `cwd`
+export function getProgramSources(program: string, cwd: string): string[] {
+  const sources = Array.from(program.matchAll(/open_(?:video|audio)\("((?:[^"\\]|\\.)*)"/g), (match) => path.resolve(cwd, match[1]))
+  return Array.from(new Set(sources))
+}
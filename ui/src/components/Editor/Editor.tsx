@@ -5,7 +5,6 @@ import { useEffect, useRef } from 'react';
 import { createUserConfig, getMainCode, getWorker, getMonarchGrammar } from '../../lib/video-ml';
 import { useTimeline } from '../Timeline/Context/Context';
 import { usePythonVisualizer } from '../PythonVisualizer/Context/Context';
-import { renderedValidationHandlers } from '../../lib/validators';
 
 const platform = await window.ipcRenderer.invoke('get-process-platform');
 
@@ -34,7 +33,7 @@ export const Editor = ({
     const wrapperRef = useRef<MonacoEditorLanguageClientWrapper | null>(null);
 
     const { handleNewTimelineElementInfos, setIsVideoMLProgramValid } = useTimeline();
-    const { setPythonCode, setIsPythonCodeLoaded } = usePythonVisualizer();
+    const { setPythonCode, setPreviewPythonCodeGetter, setIsPythonCodeLoaded } = usePythonVisualizer();
 
     useWorkerFactory({
         ignoreMapping: true,
@@ -64,22 +63,11 @@ export const Editor = ({
                 throw new Error('Unable to obtain worker for the VideoML!');
             }
 
-            worker.addEventListener('message', async (event) => {
+            worker.addEventListener('message', (event) => {
                 const { id, method, params } = event.data || {};
                 if (id && method && params && method.startsWith('custom/')) {
-                    if (params.executionParams.needNodeJs) {
-                        window.ipcRenderer.invoke(method.slice(7), { ...params.commandParams, indexName: params.indexName }).then((result) => {
-                            worker.postMessage({
-                                jsonrpc: "2.0",
-                                id,
-                                result: {
-                                    content: result,
-                                    indexName: params.indexName,
-                                }
-                            });
-                        });
-                    } else {
-                        const result = await renderedValidationHandlers[method.slice(7)](params.commandParams);
+                    // The commands are run by the main process, a failure is sent back instead of letting the request time out
+                    window.ipcRenderer.invoke(method.slice(7), { ...params.commandParams, indexName: params.indexName }).then((result) => {
                         worker.postMessage({
                             jsonrpc: "2.0",
                             id,
@@ -88,7 +76,17 @@ export const Editor = ({
                                 indexName: params.indexName,
                             }
                         });
-                    }
+                    }, (err) => {
+                        worker.postMessage({
+                            jsonrpc: "2.0",
+                            id,
+                            error: {
+                                code: -32603,
+                                message: err instanceof Error ? err.message : String(err),
+                                data: { indexName: params.indexName },
+                            }
+                        });
+                    });
                 }
             });
 
@@ -97,9 +95,15 @@ export const Editor = ({
                 throw new Error('Unable to obtain language client for the VideoML!');
             }
 
+            // The preview program is generated by the language server when asked for, from the last valid program
+            let documentUri: string | undefined = undefined;
+            setPreviewPythonCodeGetter(async () => documentUri ? client.sendRequest<string>('browser/PreviewPythonCode', { uri: documentUri }) : '');
+
             let running = false;
             let timeout: NodeJS.Timeout | null = null;
             client.onNotification('browser/DocumentChange', (resp) => {
+                documentUri = resp.uri;
+
                 // always store this new program in local storage
                 const value = wrapper.getModel()?.getValue();
                 if (window.localStorage && value) {
@@ -3,6 +3,8 @@ import { createContext, useContext } from 'react';
 interface PythonVisualizerContextProps {
     pythonCode: string;
     setPythonCode: React.Dispatch<React.SetStateAction<string>>;
+    getPreviewPythonCode: () => Promise<string>; // Program rendering a low resolution preview, generated on demand
+    setPreviewPythonCodeGetter: (getter: () => Promise<string>) => void;
     isPythonCodeLoaded: boolean;
     setIsPythonCodeLoaded: React.Dispatch<React.SetStateAction<boolean>>;
 }
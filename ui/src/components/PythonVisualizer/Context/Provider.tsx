@@ -1,4 +1,4 @@
-import React, { useState, ReactNode, useMemo } from 'react';
+import React, { useState, ReactNode, useMemo, useRef, useCallback } from 'react';
 import { PythonVisualizerContext } from './Context';
 
 interface PythonVisualizerProviderProps {
@@ -8,16 +8,27 @@ interface PythonVisualizerProviderProps {
 
 export const PythonVisualizerProvider: React.FC<PythonVisualizerProviderProps> = ({ children }) => {
     const [pythonCode, setPythonCode] = useState<string>('');
+    // Set by the editor, asks the language server for the program
+    const previewPythonCodeGetterRef = useRef<() => Promise<string>>(async () => '');
     const [isPythonCodeLoaded, setIsPythonCodeLoaded] = useState(false);
 
+    const getPreviewPythonCode = useCallback(() => previewPythonCodeGetterRef.current(), []);
+    const setPreviewPythonCodeGetter = useCallback((getter: () => Promise<string>) => {
+        previewPythonCodeGetterRef.current = getter;
+    }, []);
+
     const value = useMemo(() => ({
         pythonCode,
         setPythonCode,
+        getPreviewPythonCode,
+        setPreviewPythonCodeGetter,
         isPythonCodeLoaded,
         setIsPythonCodeLoaded,
     }), [
         pythonCode,
         isPythonCodeLoaded,
+        getPreviewPythonCode,
+        setPreviewPythonCodeGetter,
     ]);
 
     return (
@@ -16,6 +16,8 @@ interface TimelineContextProps {
     timelineZoom: number;
     setTimelineZoom: (zoom: number) => void;
     timelineScaleFactor: number;
+    playheadTime: number; // In seconds, time of the frame shown by the preview
+    setPlayheadTime: (time: number) => void;
 }
 
 export const TimelineContext = createContext<TimelineContextProps | undefined>(undefined);
@@ -1,8 +1,8 @@
 import React, { useState, ReactNode, useMemo, useCallback } from 'react';
 import { TimelineContext, PopulatedTimelineElementInfo } from './Context';
 import { TimelineElementInfo } from '../../../../lib/generated/generator/types';
-import { getCachedVideoDuration } from '../../../lib/video-duration-getter';
-import { getCachedAudioDuration } from '../../../lib/audio-duration-getter';
+import { getMediaDurations } from '../../../lib/media-duration-getter';
+import { solveTimeline } from '../../../../lib/generated/lib/timeline-solver';
 
 const TIMELINE_SCALE_FACTOR = 1;
 
@@ -10,93 +10,51 @@ interface TimelineProviderProps {
     children: ReactNode;
 }
 
-const getStartAtRecursively = (element: PopulatedTimelineElementInfo, timelineElementInfos: PopulatedTimelineElementInfo[]): number => {
-    if (!element.relativePlacement) return element.startAt || 0;
-
-    const relativeToElement = timelineElementInfos.find((e) => e.name === element.relativePlacement?.relativeTo);
-    if (!relativeToElement) return 0;
-
-    const relativeStartAt = getStartAtRecursively(relativeToElement, timelineElementInfos);
-
-    const offset = element.relativePlacement.offset || 0;
-    const placeAtEnd = element.relativePlacement.place === 'END';
-
-    return relativeStartAt + offset + (placeAtEnd ? (relativeToElement.duration || 0) : 0);
-}
-
-
 export const TimelineProvider: React.FC<TimelineProviderProps> = ({ children }) => {
 const [timelineElementInfos, setTimelineElementInfos] = useState<PopulatedTimelineElementInfo[]>([]);
 const [isVideoMLProgramValid, setIsVideoMLProgramValid] = useState(false);
 const [isTimelineLoaded, setIsTimelineLoaded] = useState(false);
 const [timelineZoom, setTimelineZoom] = useState(10);
+const [playheadTime, setPlayheadTime] = useState(0);
 
 const handleNewTimelineElementInfos = useCallback(async (newTimelineElementInfos: TimelineElementInfo[]) => {
     setIsTimelineLoaded(true);
 
-    // Populate video element with their duration
-    const populatedDurationElements = await Promise.all(newTimelineElementInfos.map(async (element: PopulatedTimelineElementInfo) => {
-        // Get duration for each element
-        if (element.videoOriginalElement) {
-
-            if (element.duration) {
-                return element;
-            }
-
-            if (!element['videoOriginalElement']['filePath']) {
-                element['error'] = 'NO_FILEPATH';
-                return element;
-            }
-
-            try {
-                element.duration = await getCachedVideoDuration(element.videoOriginalElement.filePath);
-            } catch (error) {
-                console.error('Error loading video:', error);
-                element.error = 'LOAD_VIDEO';
-            }
+    // Populate the originals with the duration of their file, all read in one request
+    const populatedDurationElements = newTimelineElementInfos.map((element: PopulatedTimelineElementInfo) => ({ ...element }));
+    const originals = populatedDurationElements.filter((element) => (element.videoOriginalElement || element.audioOriginalElement) && !element.duration);
+    originals.forEach((element) => {
+        if (!(element.videoOriginalElement || element.audioOriginalElement)?.filePath) {
+            element.error = 'NO_FILEPATH';
         }
-        else if (element.audioOriginalElement) {
+    });
 
-            if (element.duration) {
-                return element;
-            }
-
-            if (!element['audioOriginalElement']['filePath']) {
-                element['error'] = 'NO_FILEPATH';
-                return element;
-            }
-
-            try {
-                element.duration = await getCachedAudioDuration(element.audioOriginalElement.filePath);
-            } catch (error) {
-                console.error('Error loading audio:', error);
+    const loadedOriginals = originals.filter((element) => !element.error);
+    try {
+        const durations = await getMediaDurations(loadedOriginals.map((element) => (element.videoOriginalElement || element.audioOriginalElement)?.filePath || ''));
+        loadedOriginals.forEach((element, i) => {
+            if (durations[i] < 0) {
                 element.error = 'LOAD_VIDEO';
+            } else {
+                element.duration = durations[i];
             }
-        }
-
-
-        return element;
-    }));
-
-    // Resolve startAt and finishAt time for each relative element
-    const populatedElements = populatedDurationElements.reduce((acc, element, i) => {
+        });
+    } catch (error) {
+        console.error('Error loading media:', error);
+        loadedOriginals.forEach((element) => {
+            element.error = 'LOAD_VIDEO';
+        });
+    }
+
+    // Resolve startAt and finishAt time for each element, in one pass over the timeline
+    const placements = solveTimeline(populatedDurationElements);
+    const populatedElements = populatedDurationElements.map((element, i) => {
         if (!element.error) {
-
-            // Calculate startAt
-            if (element.relativePlacement) {
-                element.startAt = getStartAtRecursively(element, populatedDurationElements);
-            } else if (element.startAfterPrevious) {
-                const previousElement = acc[i - 1];
-                element.startAt = (previousElement?.finishAt || 0);
-            }
-
-            // Calculate finishAt
-            element.finishAt = (element.startAt || 0) + (element.duration || 0);
+            element.startAt = placements[i].startAt || 0;
+            element.finishAt = element.startAt + placements[i].duration;
         }
-
-        acc.push(element);
-        return acc;
-    }, [] as PopulatedTimelineElementInfo[]);
+        return element;
+    });
 
     setTimelineElementInfos(populatedElements);
 }, []);
@@ -110,12 +68,15 @@ const value = useMemo(() => ({
     timelineZoom,
     setTimelineZoom,
     timelineScaleFactor: timelineZoom * TIMELINE_SCALE_FACTOR,
+    playheadTime,
+    setPlayheadTime,
 }), [
     isVideoMLProgramValid,
     timelineElementInfos,
     handleNewTimelineElementInfos,
     isTimelineLoaded,
     timelineZoom,
+    playheadTime,
 ]);
 
 return (
@@ -0,0 +1,77 @@
+import { useEffect, useState } from 'react';
+import { Spinner } from 'reactstrap';
+
+import { useTimeline } from './Context/Context';
+import { usePythonVisualizer } from '../PythonVisualizer/Context/Context';
+import { formatTime } from './helper';
+
+// Program loaded in the frame server (see electron/frame-server.ts)
+type FrameServerProgram = {
+    url: string;
+    version: number;
+    duration: number;
+    fps: number;
+};
+
+// The program is loaded again once the code stopped changing for this long (in milliseconds)
+const LOAD_DELAY = 500;
+
+const PREVIEW_WIDTH = 320;
+
+// Frame of the preview program at the playhead, composited on demand by the frame server
+export const TimelineFramePreview: React.FC = () => {
+    const { playheadTime } = useTimeline();
+    const { pythonCode, getPreviewPythonCode } = usePythonVisualizer();
+    const [program, setProgram] = useState<FrameServerProgram | undefined>(undefined);
+    const [isLoading, setIsLoading] = useState(false);
+    const [error, setError] = useState<string | undefined>(undefined);
+
+    // Loaded again when the program changes, the preview program is only generated then
+    useEffect(() => {
+        if (!pythonCode) return;
+        let isCancelled = false;
+        const timeout = setTimeout(async () => {
+            setIsLoading(true);
+            try {
+                const previewPythonCode = await getPreviewPythonCode();
+                if (isCancelled || !previewPythonCode) return;
+                const pwd = await window.ipcRenderer.invoke('get-pwd');
+                const loadedProgram = await window.ipcRenderer.invoke('frame-server-load', previewPythonCode, pwd);
+                if (isCancelled) return;
+                setProgram(loadedProgram);
+                setError(undefined);
+            } catch (err) {
+                if (isCancelled) return;
+                // Last line of the traceback of the program
+                const message = err instanceof Error ? err.message : String(err);
+                setError(message.trim().split('\n').pop());
+            } finally {
+                if (!isCancelled) setIsLoading(false);
+            }
+        }, LOAD_DELAY);
+        return () => {
+            isCancelled = true;
+            clearTimeout(timeout);
+        };
+    }, [pythonCode, getPreviewPythonCode]);
+
+    const time = program ? Math.min(playheadTime, program.duration) : playheadTime;
+
+    return (
+        <div style={{ width: `${PREVIEW_WIDTH}px` }}>
+            <div className="d-flex flex-row align-items-center justify-content-between mb-1">
+                <span>{formatTime(Math.floor(time * 100) / 100)}</span>
+                {isLoading && <Spinner size="sm" />}
+            </div>
+            {program && (
+                <img
+                    className="w-100 bg-black"
+                    src={`${program.url}/frame?t=${time}&version=${program.version}`}
+                    alt={`Frame at ${formatTime(Math.floor(time))}`}
+                    draggable={false}
+                />
+            )}
+            {error && <div className="text-danger small text-break">{error}</div>}
+        </div>
+    );
+};
@@ -0,0 +1,16 @@
+import { useTimeline } from '../Context/Context';
+
+import './Playhead.css';
+
+// Time of the frame shown by the preview, over the layers
+export const TimelinePlayhead: React.FC = () => {
+    const { playheadTime, timelineScaleFactor } = useTimeline();
+    return (
+        <div
+            className="timeline-playhead position-absolute top-0 h-100"
+            style={{
+                left: `calc(1.5rem + ${playheadTime * timelineScaleFactor}px)`,
+            }}
+        />
+    );
+};
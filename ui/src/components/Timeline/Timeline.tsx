@@ -1,4 +1,4 @@
-import { useMemo } from 'react';
+import { useCallback, useMemo } from 'react';
 import { Spinner } from 'reactstrap';
 
 import { useTimeline } from './Context/Context';
@@ -7,13 +7,15 @@ import { TimelineLayoutTimecodes } from './Layout/Timecodes';
 import { TimelineElement } from './Element/Element';
 import { TimelineLayoutLayer } from './Layout/Layer';
 import { TimelineLayoutLayerNames } from './Layout/LayerNames';
+import { TimelinePlayhead } from './Layout/Playhead';
+import { TimelineFramePreview } from './FramePreview';
 
 type TimelineLayers = {
   [layer: string]: TimelineElementInfoFormatted[];
 }
 
 export const Timeline: React.FC = () => {
-  const { timelineElementInfos, isTimelineLoaded, timelineScaleFactor } = useTimeline();
+  const { timelineElementInfos, isTimelineLoaded, timelineScaleFactor, setPlayheadTime } = useTimeline();
 
   // Group elements by layers
 
@@ -61,6 +63,15 @@ export const Timeline: React.FC = () => {
     return { timelineStartTime: 0, timelineEndTime };
   }, [timelineElementInfos, timelineScaleFactor]);
 
+  // Clicking or dragging on the timeline moves the playhead under the mouse
+  const handleScrub = useCallback((event: React.MouseEvent<HTMLDivElement>) => {
+    if (event.type === 'mousemove' && !(event.buttons & 1)) return;
+    const container = event.currentTarget;
+    const paddingLeft = parseFloat(getComputedStyle(container).paddingLeft) || 0;
+    const x = event.clientX - container.getBoundingClientRect().left + container.scrollLeft - paddingLeft;
+    setPlayheadTime(Math.min(Math.max(x / timelineScaleFactor, 0), timelineBounds.timelineEndTime));
+  }, [timelineScaleFactor, timelineBounds, setPlayheadTime]);
+
   return (
     <div className="h-100 w-100">
       <div className="d-flex flex-row w-100">
@@ -69,7 +80,7 @@ export const Timeline: React.FC = () => {
               <TimelineLayoutLayerNames layers={Object.keys(layers)} />
           </div>
         )}
-        <div className="d-flex flex-column w-100 position-relative mb-3 overflow-auto ps-4">
+        <div className="d-flex flex-column w-100 position-relative mb-3 overflow-auto ps-4" onMouseDown={handleScrub} onMouseMove={handleScrub}>
           {!isTimelineLoaded && (
             <div><Spinner className="me-2" size="sm" />Loading timeline...</div>
           )}
@@ -81,7 +92,13 @@ export const Timeline: React.FC = () => {
               </TimelineLayoutLayer>
             ))}
           {isTimelineLoaded && <TimelineLayoutTimecodes startTime={timelineBounds.timelineStartTime} endTime={timelineBounds.timelineEndTime} />}
+          {isTimelineLoaded && <TimelinePlayhead />}
         </div>
+        {isTimelineLoaded && (
+          <div className="ps-2">
+            <TimelineFramePreview />
+          </div>
+        )}
       </div>
     </div>
   );
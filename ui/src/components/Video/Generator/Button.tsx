@@ -5,13 +5,14 @@ import { useVideoGenerator } from "../../Video/Generator/Context/Context"
 import { usePythonVisualizer } from "../../PythonVisualizer/Context/Context"
 import { useTimeline } from "../../Timeline/Context/Context"
 import { FaExternalLinkAlt } from "react-icons/fa"
+import { VideoGeneratorQueueButton } from "./Queue"
 
 type VideoGeneratorButtonProps = {
     onGenerated?: () => void
 }
 
 export const VideoGeneratorButton: React.FC<VideoGeneratorButtonProps> = ({ onGenerated }) => {
-    const { handleGenerateVideo, isGenerating, videoGeneratedPath } = useVideoGenerator();
+    const { handleGenerateVideo, handleQueueVideo, isGenerating, isPreview, videoGeneratedPath } = useVideoGenerator();
     const { isPythonCodeLoaded } = usePythonVisualizer();
     const { isVideoMLProgramValid } = useTimeline();
     
@@ -20,6 +21,11 @@ export const VideoGeneratorButton: React.FC<VideoGeneratorButtonProps> = ({ onGe
         if (onGenerated) onGenerated();
     }, [onGenerated, handleGenerateVideo]);
 
+    const handleClickPreview = useCallback(async () => {
+        await handleGenerateVideo({ preview: true });
+        if (onGenerated) onGenerated();
+    }, [onGenerated, handleGenerateVideo]);
+
     const handleClickOpenVideo = useCallback(() => {
         window.ipcRenderer.invoke('show-file-in-folder', videoGeneratedPath);
     }, [videoGeneratedPath]);
@@ -38,6 +44,25 @@ export const VideoGeneratorButton: React.FC<VideoGeneratorButtonProps> = ({ onGe
                 {isLoading && <Spinner className="me-2" size="sm" />}
                 Generate
             </Button>
+            <Button
+                color="primary"
+                outline
+                onClick={handleClickPreview}
+                className="ms-2"
+                disabled={isLoading || isError}
+            >
+                Preview
+            </Button>
+            <Button
+                color="primary"
+                outline
+                onClick={handleQueueVideo}
+                className="ms-2"
+                disabled={!isPythonCodeLoaded || isError}
+            >
+                Add to queue
+            </Button>
+            <VideoGeneratorQueueButton />
             {!isGenerating && videoGeneratedPath && (
             <Button
                 color="success"
@@ -45,7 +70,7 @@ export const VideoGeneratorButton: React.FC<VideoGeneratorButtonProps> = ({ onGe
                 className="ms-2 text-white"
             >
                 <FaExternalLinkAlt className="me-2" />
-                Open video
+                {isPreview ? 'Open preview' : 'Open video'}
             </Button>
             )}
         </div>
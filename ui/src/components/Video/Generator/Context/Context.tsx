@@ -12,13 +12,34 @@ export type VideoGenerationProgress = {
   elapsedTime: string,
   etaTime: string,
   itPerSecond: number,
+  stages?: Record<string, number>, // Seconds spent in each stage of the render
+  peakRss?: number, // In bytes
+  partsDone?: number,
+  partsQueued?: number,
   isChunk?: boolean,
   isFrameIndex?: boolean,
 };
 
+// Render of the queue, see electron/render-queue.ts
+export type RenderJob = {
+  id: number,
+  name: string,
+  priority: number,
+  status: 'queued' | 'running' | 'done' | 'failed' | 'cancelled',
+  createdAt: number,
+  startedAt?: number,
+  finishedAt?: number,
+  exitCode?: number | null,
+  interactive?: boolean,
+};
+
 interface VideoGeneratorContextProps {
     generationStatus: VideoGenerationStatus | undefined,
-    handleGenerateVideo: () => Promise<void>,
+    handleGenerateVideo: (options?: { preview?: boolean }) => Promise<void>,
+    isPreview: boolean, // The video generated (or being generated) is a low resolution preview
+    handleQueueVideo: () => Promise<void>,
+    renderJobs: RenderJob[],
+    renderConcurrency: number,
     videoGeneratedPath: string | undefined,
     isGenerating: boolean,
     errorTraceback: string | undefined,
@@ -1,32 +1,28 @@
 import React, { useState, ReactNode, useMemo, useCallback, useEffect } from 'react';
-import { VideoGeneratorContext, VideoGenerationStatus, VideoGenerationProgress } from './Context';
+import { VideoGeneratorContext, VideoGenerationStatus, VideoGenerationProgress, RenderJob } from './Context';
 import { usePythonVisualizer } from '../../../PythonVisualizer/Context/Context';
 import { VideoGeneratorModal } from '../Modal';
 
+// Export line of the generated programs, with the path of the output
+const EXPORT_LINE_REGEX = /render_(?:video|audio)\(final_(?:video|audio), "(.+?)"/;
+
 interface VideoGeneratorProviderProps {
     children: ReactNode;
 }
 
 export const VideoGeneratorProvider: React.FC<VideoGeneratorProviderProps> = ({ children }) => {
-    const { pythonCode } = usePythonVisualizer();
+    const { pythonCode, getPreviewPythonCode } = usePythonVisualizer();
     const [generationStatus, setGenerationStatus] = useState<VideoGenerationStatus | undefined>(undefined);
     const [isGenerating, setIsGenerating] = useState<boolean>(false);
+    const [isPreview, setIsPreview] = useState<boolean>(false);
     const [videoGeneratedPath, setVideoGeneratedPath] = useState<string | undefined>(undefined);
     const [errorTraceback, setErrorTraceback] = useState<string | undefined>(undefined);
     const [manualInstallationInstructions, setManualInstallationInstructions] = useState<string | undefined>(undefined);
+    const [renderJobs, setRenderJobs] = useState<RenderJob[]>([]);
+    const [renderConcurrency, setRenderConcurrency] = useState<number>(1);
 
-    const handleGenerateVideo = useCallback(async () => {
-        setIsGenerating(true);
-        setErrorTraceback(undefined);
-        setManualInstallationInstructions(undefined);
-
-        const pwd = await window.ipcRenderer.invoke('get-pwd');
-        // Extract the video filename, Export line is : 'final_video.write_videofile("XXX")', use regex
-        const videoName = pythonCode.match(/final_video\.write_videofile\("(.+)"\)/)?.[1];
-        setVideoGeneratedPath(`${pwd}/${videoName}`);
-
-        await window.ipcRenderer.invoke('generate-python-file', pythonCode, pwd);
-
+    // Checks the python binary and installs the requirements, returns false (with the error set) when the video can't be rendered
+    const preparePython = useCallback(async (pwd: string) => {
         // Check python binary
         const isPythonInstalled = await window.ipcRenderer.invoke('is-python-installed');
         if (!isPythonInstalled) {
@@ -36,21 +32,61 @@ export const VideoGeneratorProvider: React.FC<VideoGeneratorProviderProps> = ({
             setManualInstallationInstructions(
 `You can execute manually the video generation:<br>
 - Install the python requirements provided in this file <a href="#" onclick="window.ipcRenderer.invoke('show-file-in-folder', '${pwd}/requirements.txt')">requirements.txt</a> (${pwd}/requirements.txt)<br>
+- Keep the <a href="#" onclick="window.ipcRenderer.invoke('show-file-in-folder', '${pwd}/videoml_runtime')">videoml_runtime</a> folder next to the generated file, it contains the helpers imported by the program<br>
 - Launch this file with the python interpreter <a href="#" onclick="window.ipcRenderer.invoke('show-file-in-folder', '${pwd}/video.py')">video.py</a> (${pwd}/video.py)`);
-            setIsGenerating(false);
-            return;
+            return false;
         }
 
         // Install requirements
         const requirementsInstallResult = await window.ipcRenderer.invoke('install-requirements');
         if (!requirementsInstallResult) {
             setErrorTraceback('Failed to install requirements, please check Electron logs.');
+            return false;
+        }
+        return true;
+    }, []);
+
+    // A preview renders the program of the low resolution preview, written next to the final one
+    const handleGenerateVideo = useCallback(async ({ preview = false }: { preview?: boolean } = {}) => {
+        setIsGenerating(true);
+        setIsPreview(preview);
+        setErrorTraceback(undefined);
+        setManualInstallationInstructions(undefined);
+
+        const code = preview ? await getPreviewPythonCode() : pythonCode;
+        const programName = preview ? 'preview.py' : 'video.py';
+        const pwd = await window.ipcRenderer.invoke('get-pwd');
+        // Extract the video filename, Export line is : 'render_video(final_video, "XXX", ...)', or
+        // 'render_audio(final_audio, "XXX")' for the projects without visual elements, use regex
+        const videoName = code.match(EXPORT_LINE_REGEX)?.[1];
+        setVideoGeneratedPath(`${pwd}/${videoName}`);
+
+        await window.ipcRenderer.invoke('generate-python-file', code, pwd, programName);
+
+        if (!await preparePython(pwd)) {
             setIsGenerating(false);
             return;
         }
 
-        window.ipcRenderer.invoke('generate-video', pwd);
-    }, [pythonCode]);
+        window.ipcRenderer.invoke('generate-video', pwd, { programName });
+    }, [pythonCode, getPreviewPythonCode, preparePython]);
+
+    // Renders the current program in the background, after the renders queued before it
+    const handleQueueVideo = useCallback(async () => {
+        setErrorTraceback(undefined);
+        setManualInstallationInstructions(undefined);
+
+        const pwd = await window.ipcRenderer.invoke('get-pwd');
+        const videoName = pythonCode.match(EXPORT_LINE_REGEX)?.[1];
+        if (!videoName) {
+            // No output to name the render after, e.g. a project without any element
+            setErrorTraceback('Can\'t add the video to the queue: the program doesn\'t export any video or audio file.');
+            return;
+        }
+        if (!await preparePython(pwd)) return;
+
+        await window.ipcRenderer.invoke('render-queue-add', { code: pythonCode, dirPath: pwd, name: videoName });
+    }, [pythonCode, preparePython]);
 
     useEffect(() => {
         const handleProgress = (progress: VideoGenerationProgress) => {
@@ -76,10 +112,18 @@ export const VideoGeneratorProvider: React.FC<VideoGeneratorProviderProps> = ({
             }
         };
 
+        const handleQueueUpdated = ({ jobs, concurrency }: { jobs: RenderJob[], concurrency: number }) => {
+            setRenderJobs(jobs);
+            setRenderConcurrency(concurrency);
+        };
+        window.ipcRenderer.invoke('render-queue-list').then(handleQueueUpdated);
+
         const eventProgressRemoveListener = window.ipcRenderer.receive('video-generation-progress', handleProgress);
         const eventFinishedRemoveListener = window.ipcRenderer.receive('video-generation-finished', handleFinished);
         const eventErrorRemoveListener = window.ipcRenderer.receive('video-generation-error', handleError);
+        const eventQueueUpdatedRemoveListener = window.ipcRenderer.receive('render-queue-updated', handleQueueUpdated);
         return () => {
+            eventQueueUpdatedRemoveListener();
             eventProgressRemoveListener();
             eventFinishedRemoveListener();
             eventErrorRemoveListener();
@@ -89,6 +133,10 @@ export const VideoGeneratorProvider: React.FC<VideoGeneratorProviderProps> = ({
     const value = useMemo(() => ({
         generationStatus,
         handleGenerateVideo,
+        isPreview,
+        handleQueueVideo,
+        renderJobs,
+        renderConcurrency,
         isGenerating,
         videoGeneratedPath: isGenerating ? undefined : videoGeneratedPath,
         errorTraceback,
@@ -96,6 +144,10 @@ export const VideoGeneratorProvider: React.FC<VideoGeneratorProviderProps> = ({
     }), [
         generationStatus,
         handleGenerateVideo,
+        isPreview,
+        handleQueueVideo,
+        renderJobs,
+        renderConcurrency,
         isGenerating,
         videoGeneratedPath,
         errorTraceback,
@@ -105,7 +157,7 @@ export const VideoGeneratorProvider: React.FC<VideoGeneratorProviderProps> = ({
     return (
         <VideoGeneratorContext.Provider value={value}>
         {isGenerating && (
-            <VideoGeneratorModal generationStatus={generationStatus} />
+            <VideoGeneratorModal generationStatus={generationStatus} isPreview={isPreview} />
         )} 
         {children}
         </VideoGeneratorContext.Provider>
@@ -28,15 +28,32 @@ const GenerationProgress: React.FC<GenerationProgressProps> = ({ generationProgr
         <div>
             Remaining time: {generationProgress?.etaTime || 'Calculating...'}
         </div>
+        {generationProgress.stages && Object.keys(generationProgress.stages).length > 0 && (
+            <div className="mt-2 small text-muted">
+                <div>
+                    Time per stage: {Object.entries(generationProgress.stages)
+                        .map(([stage, seconds]) => `${stage} ${seconds.toFixed(1)}s`)
+                        .join(', ')}
+                </div>
+                {generationProgress.partsQueued !== undefined && (
+                    <div>Parts: {generationProgress.partsDone} done, {generationProgress.partsQueued} queued</div>
+                )}
+                {generationProgress.peakRss !== undefined && (
+                    <div>Peak memory: {Math.round(generationProgress.peakRss / (1024 * 1024))} MB</div>
+                )}
+            </div>
+        )}
     </>
 )
 
 type VideoGeneratorModalProps = {
     generationStatus?: VideoGenerationStatus;
+    isPreview?: boolean;
 }
 
 export const VideoGeneratorModal: React.FC<VideoGeneratorModalProps> = ({
     generationStatus,
+    isPreview,
 }) => {
     const handleCancelGeneration = useCallback(() => {
         window.ipcRenderer.invoke('cancel-video-generation');
@@ -47,7 +64,7 @@ export const VideoGeneratorModal: React.FC<VideoGeneratorModalProps> = ({
             isOpen
             backdrop="static"
         >
-            <ModalHeader>Video generation in progress...</ModalHeader>
+            <ModalHeader>{isPreview ? 'Video preview (640x360, 12 fps) in progress...' : 'Video generation in progress...'}</ModalHeader>
             <ModalBody>
                 {!generationStatus?.chunk && !generationStatus?.frameIndex && (
                     <span>Video generation starting, please wait... (this may take a while, it need to install some dependencies)</span>
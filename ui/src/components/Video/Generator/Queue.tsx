@@ -0,0 +1,115 @@
+import { useCallback, useState } from "react"
+import { Badge, Button, Input, InputGroup, InputGroupText, Modal, ModalBody, ModalFooter, ModalHeader, Table } from "reactstrap"
+import { FaArrowDown, FaArrowUp, FaTimes } from "react-icons/fa"
+
+import { RenderJob, useVideoGenerator } from "./Context/Context"
+
+const statusColors: Record<RenderJob['status'], string> = {
+    queued: 'secondary',
+    running: 'primary',
+    done: 'success',
+    failed: 'danger',
+    cancelled: 'warning',
+};
+
+const formatTime = (timestamp?: number) => timestamp ? new Date(timestamp).toLocaleTimeString() : '';
+
+export const VideoGeneratorQueueButton: React.FC = () => {
+    const { renderJobs } = useVideoGenerator();
+    const [isOpen, setIsOpen] = useState<boolean>(false);
+    const pendingJobs = renderJobs.filter((job) => job.status === 'queued' || job.status === 'running').length;
+
+    return (
+        <>
+            <Button color="secondary" onClick={() => setIsOpen(true)} className="ms-2 text-white">
+                Queue {pendingJobs > 0 && <Badge color="light" className="text-dark ms-1">{pendingJobs}</Badge>}
+            </Button>
+            {isOpen && <VideoGeneratorQueueModal onClose={() => setIsOpen(false)} />}
+        </>
+    )
+}
+
+type VideoGeneratorQueueModalProps = {
+    onClose: () => void,
+}
+
+export const VideoGeneratorQueueModal: React.FC<VideoGeneratorQueueModalProps> = ({ onClose }) => {
+    const { renderJobs, renderConcurrency } = useVideoGenerator();
+
+    const handleCancel = useCallback((job: RenderJob) => {
+        window.ipcRenderer.invoke('render-queue-cancel', job.id);
+    }, []);
+
+    const handleChangePriority = useCallback((job: RenderJob, delta: number) => {
+        window.ipcRenderer.invoke('render-queue-set-priority', job.id, job.priority + delta);
+    }, []);
+
+    const handleChangeConcurrency = useCallback((event: React.ChangeEvent<HTMLInputElement>) => {
+        const concurrency = parseInt(event.target.value);
+        if (concurrency > 0) {
+            window.ipcRenderer.invoke('render-queue-set-concurrency', concurrency);
+        }
+    }, []);
+
+    const handleClearFinished = useCallback(() => {
+        window.ipcRenderer.invoke('render-queue-clear-finished');
+    }, []);
+
+    return (
+        <Modal isOpen toggle={onClose} size="lg">
+            <ModalHeader toggle={onClose}>Render queue</ModalHeader>
+            <ModalBody>
+                <InputGroup size="sm" className="mb-3" style={{ maxWidth: '260px' }}>
+                    <InputGroupText>Renders at the same time</InputGroupText>
+                    <Input type="number" min={1} value={renderConcurrency} onChange={handleChangeConcurrency} />
+                </InputGroup>
+                {renderJobs.length === 0 ? (
+                    <span>No render queued, use "Add to queue" to render the current video in the background.</span>
+                ) : (
+                    <Table size="sm" responsive>
+                        <thead>
+                            <tr>
+                                <th>Video</th>
+                                <th>Status</th>
+                                <th>Priority</th>
+                                <th>Queued</th>
+                                <th>Started</th>
+                                <th>Finished</th>
+                                <th></th>
+                            </tr>
+                        </thead>
+                        <tbody>
+                            {[...renderJobs].reverse().map((job) => (
+                                <tr key={job.id}>
+                                    <td>{job.name}{job.interactive && ' (Generate)'}</td>
+                                    <td><Badge color={statusColors[job.status]}>{job.status}</Badge></td>
+                                    <td>
+                                        {job.priority}
+                                        {job.status === 'queued' && (
+                                            <>
+                                                <Button size="sm" color="link" className="p-0 ms-2" onClick={() => handleChangePriority(job, 1)}><FaArrowUp /></Button>
+                                                <Button size="sm" color="link" className="p-0 ms-1" onClick={() => handleChangePriority(job, -1)}><FaArrowDown /></Button>
+                                            </>
+                                        )}
+                                    </td>
+                                    <td>{formatTime(job.createdAt)}</td>
+                                    <td>{formatTime(job.startedAt)}</td>
+                                    <td>{formatTime(job.finishedAt)}</td>
+                                    <td>
+                                        {(job.status === 'queued' || job.status === 'running') && (
+                                            <Button size="sm" color="link" className="p-0 text-danger" onClick={() => handleCancel(job)}><FaTimes /></Button>
+                                        )}
+                                    </td>
+                                </tr>
+                            ))}
+                        </tbody>
+                    </Table>
+                )}
+            </ModalBody>
+            <ModalFooter>
+                <Button color="secondary" outline onClick={handleClearFinished}>Clear finished</Button>
+                <Button color="secondary" onClick={onClose}>Close</Button>
+            </ModalFooter>
+        </Modal>
+    )
+}
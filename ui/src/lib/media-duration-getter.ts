@@ -0,0 +1,5 @@
+// Durations come from the media index of the main process: kept across sessions, and read again when a file changes
+export const getMediaDurations = async (paths: string[]): Promise<number[]> => {
+    const infos: ({ duration: number } | undefined)[] = await window.ipcRenderer.invoke('get-media-infos', { paths });
+    return infos.map((info) => info ? info.duration : -1);
+};
@@ -61,7 +61,7 @@ export function createUserConfig(config: ClassicConfig): UserConfig {
 export function getMonarchGrammar() {
     return {
     keywords: [
-        'apply','as','at','audio','background','brightness','by','contrast','delay','delayed','extract','fadeIn','fadeOut','font','fontcolor','fontsize','for','from','left','load','normalize','of','opacity','options','position','project','repetitions','right','rotation','saturation','scale','size','stereo','subtitle','text','to','video','volume'
+        'animation','apply','as','at','audio','background','brightness','by','contrast','delay','delayed','extract','fadeIn','fadeOut','font','fontcolor','fontsize','for','from','gather','left','load','normalize','of','opacity','options','position','project','repetitions','right','rotation','saturation','scale','size','stereo','subtitle','text','to','video','volume'
     ],
     operators: [
         ',',':'
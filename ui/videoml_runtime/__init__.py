@@ -0,0 +1,16 @@
+"""Runtime helpers imported by the Python programs generated from VideoML projects."""
+from .analysis import audio_normalize
+from .audio_tracks import audio_delay, audio_extract, audio_fade_in, audio_fade_out, audio_volume
+from .compositor import TimelineCompositeVideoClip
+from .effects import ColorCorrection
+from .mixer import mix_audio
+from .render import render_audio, render_video
+from .sources import open_audio, open_video
+from .text import text_clip
+from .text_animation import animated_text_clip
+
+__all__ = [
+    "ColorCorrection", "TimelineCompositeVideoClip", "animated_text_clip", "audio_delay", "audio_extract",
+    "audio_fade_in", "audio_fade_out", "audio_normalize", "audio_volume", "mix_audio", "open_audio", "open_video",
+    "render_audio", "render_video", "text_clip",
+]
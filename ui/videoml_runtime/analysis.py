@@ -0,0 +1,138 @@
+"""Peak and loudness of the audio clips, measured once.
+
+``moviepy.audio.fx.AudioNormalize`` reads the whole clip to find its peak
+when the effect is applied, on every run of the program. ``audio_normalize``
+only measures the clip when its samples are first needed: the mixer measures
+all the normalized clips of a program in parallel before mixing (see
+``mixer``). The measures of a clip with a track (see ``audio_tracks``) are
+kept by what the track plays (its source files and their modification times,
+its extract of them and its gains), in memory and in
+``~/.cache/videoml/analysis`` (or the ``VIDEOML_ANALYSIS_DIR`` environment
+variable), so the next runs don't read the sources again. The measures of a
+clip without a track are not kept.
+
+Each measure is a JSON object:
+
+* ``peak``: largest absolute value of the samples, on both channels (moviepy
+  only looks at the left one);
+* ``loudness``: RMS level of the samples, in dBFS (None for silence).
+"""
+import hashlib
+import json
+import math
+import os
+import threading
+from dataclasses import replace
+
+import numpy as np
+
+from .audio_tracks import AudioTrack, get_track, set_track
+from .cache import RenderCache
+from .mixer import MixedAudioClip
+from .sources import file_signature
+
+ANALYSIS_DIR_ENV = "VIDEOML_ANALYSIS_DIR"
+
+DEFAULT_ANALYSIS_DIR = os.path.join(os.path.expanduser("~"), ".cache", "videoml", "analysis")
+# In megabytes, the measures are a few bytes each
+ANALYSIS_CACHE_SIZE = 16
+
+# Bump when a change of the runtime changes the measures
+ANALYSIS_VERSION = 1
+
+# Samples measured at once
+ANALYSIS_BLOCK_SIZE = 50000
+
+# Measures of this process, by key
+_MEASURES = {}
+_MEASURES_LOCK = threading.Lock()
+
+
+def audio_normalize(clip):
+    """``AudioNormalize()`` of ``clip``: its peak is brought to 1, the peak
+    being measured when the samples of the clip are first needed."""
+    volume = Normalization(clip)
+    normalized = clip.transform(lambda get_frame, t: volume.value * get_frame(t))
+    track = get_track(clip)
+    if track is None:
+        return set_track(normalized, None)
+    return set_track(normalized, AudioTrack(tuple(replace(tap, volumes=tap.volumes + (volume,)) for tap in track.taps)))
+
+
+class Normalization:
+    """Gain bringing the peak of ``clip`` to 1 (1 for a silent clip),
+    measured on the first access to ``value``."""
+
+    def __init__(self, clip):
+        self.clip = clip
+        self._lock = threading.Lock()
+        self._value = None
+
+    @property
+    def value(self):
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    peak = measure(self.clip)["peak"]
+                    self._value = 1.0 / peak if peak > 0 else 1.0
+        return self._value
+
+
+def measure(clip):
+    """Measures of the samples of ``clip`` (see the module)."""
+    track = get_track(clip)
+    if track is None:
+        return _measure(clip)
+    key = track_key(track, clip.fps, clip.duration)
+    with _MEASURES_LOCK:
+        measures = _MEASURES.get(key)
+    if measures is not None:
+        return measures
+
+    cache = RenderCache(os.environ.get(ANALYSIS_DIR_ENV) or DEFAULT_ANALYSIS_DIR, ANALYSIS_CACHE_SIZE * 1024 * 1024, extension=".json")
+    path = cache.get(key)
+    if path:
+        with open(path) as file:
+            measures = json.load(file)
+    else:
+        # The mix of the track alone, from its memory-mapped sources
+        measures = _measure(MixedAudioClip([clip.with_start(0)], fps=clip.fps))
+        temp_path = os.path.join(cache.directory, "%s.partial-%d-%d.json" % (key, os.getpid(), threading.get_ident()))
+        with open(temp_path, "w") as file:
+            json.dump(measures, file)
+        try:
+            cache.put(key, temp_path)
+        finally:
+            os.remove(temp_path)
+        cache.evict()
+    with _MEASURES_LOCK:
+        _MEASURES[key] = measures
+    return measures
+
+
+def track_key(track, fps, duration):
+    """Hash of everything the samples of ``track``, played for ``duration``,
+    depend on."""
+    taps = []
+    for tap in track.taps:
+        taps.append([
+            list(file_signature(tap.filename)), tap.shift, tap.start, tap.end,
+            [[times.tolist(), gains.tolist()] for times, gains in tap.envelopes],
+            tap.left, tap.right,
+            # Gains measured before, known by the track they measured
+            [track_key(get_track(volume.clip), fps, volume.clip.duration) for volume in tap.volumes],
+        ])
+    return hashlib.sha256(json.dumps([ANALYSIS_VERSION, fps, duration, taps]).encode()).hexdigest()
+
+
+def _measure(clip):
+    peak = 0.0
+    squares = 0.0
+    count = 0
+    for chunk in clip.iter_chunks(chunksize=ANALYSIS_BLOCK_SIZE, fps=clip.fps):
+        if len(chunk):
+            peak = max(peak, float(np.abs(chunk).max()))
+            squares += float(np.square(chunk).sum())
+            count += chunk.size
+    rms = math.sqrt(squares / count) if count else 0.0
+    return {"peak": peak, "loudness": 20 * math.log10(rms) if rms > 0 else None}
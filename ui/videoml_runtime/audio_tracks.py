@@ -0,0 +1,165 @@
+"""What the audio clips of a program play, for the mixer.
+
+Each audio clip of the generated programs keeps, next to its moviepy frame
+function, an ``AudioTrack``: the samples of which source file it plays, from
+when to when, and with which gains. ``open_audio`` (and the audio of
+``open_video``) start a track; ``audio_extract``, the extracts of the videos
+and the effects below update it. Moving a clip along the timeline
+(``with_start``, ``with_duration``...) keeps it, the track is in the time of
+the clip. Any other change of the frames of a clip drops its track, the
+mixer then asks the clip for its frames.
+
+The mixer (see ``mixer``) reads the tracks instead of asking every clip for
+its frames: the gains of a track are a few breakpoints, computed for a block
+of samples at once.
+"""
+from dataclasses import dataclass, replace
+
+import moviepy
+import numpy as np
+from moviepy.tools import convert_to_seconds
+
+
+@dataclass(frozen=True)
+class Tap:
+    """Samples of ``filename`` played by a track.
+
+    At the time ``t`` of the track, the sample of the source at ``t + shift``
+    is played between ``start`` and ``end`` (both included, as moviepy),
+    multiplied by the product of the ``envelopes`` (piecewise linear, as
+    ``(times, gains)`` breakpoints in the time of the track), by ``left``
+    and ``right`` on each channel, and by the ``value`` of the ``volumes``
+    measured before the mix (see ``analysis``).
+    """
+    filename: str
+    shift: float
+    start: float
+    end: float
+    envelopes: tuple = ()
+    left: float = 1.0
+    right: float = 1.0
+    volumes: tuple = ()
+
+    def moved(self, offset):
+        """The same samples played ``offset`` seconds later."""
+        return replace(
+            self, shift=self.shift - offset, start=self.start + offset, end=self.end + offset,
+            envelopes=tuple((times + offset, gains) for times, gains in self.envelopes),
+        )
+
+    def gain(self, times):
+        """Product of the envelopes at ``times`` (in the time of the track)."""
+        gain = np.ones(len(times))
+        for envelope_times, gains in self.envelopes:
+            gain *= np.interp(times, envelope_times, gains)
+        return gain
+
+
+@dataclass(frozen=True)
+class AudioTrack:
+    """Sum of the ``taps`` of a clip."""
+    taps: tuple
+
+    @classmethod
+    def of_file(cls, filename, duration):
+        return cls((Tap(filename, 0.0, 0.0, duration),))
+
+    def subclipped(self, start, end):
+        return AudioTrack(tuple(
+            _clamped(tap.moved(-start), 0.0, end - start) for tap in self.taps
+        ))
+
+    def with_envelope(self, times, gains):
+        envelope = (np.asarray(times, dtype=float), np.asarray(gains, dtype=float))
+        return AudioTrack(tuple(replace(tap, envelopes=tap.envelopes + (envelope,)) for tap in self.taps))
+
+    def with_volume(self, left, right):
+        return AudioTrack(tuple(replace(tap, left=tap.left * left, right=tap.right * right) for tap in self.taps))
+
+    def delayed(self, offset, repetitions, duration, decay=1):
+        # As moviepy's AudioDelay: the clip, then its repetitions every
+        # ``offset`` seconds, their volume going from 1 to ``decay``
+        volumes = np.linspace(1, max(0, decay), repetitions + 1)
+        taps = []
+        for repetition in range(repetitions + 1):
+            delay = repetition * offset
+            for tap in self.taps:
+                tap = _clamped(tap.moved(delay), delay, delay + duration)
+                if repetition:
+                    tap = replace(tap, left=tap.left * volumes[repetition], right=tap.right * volumes[repetition])
+                taps.append(tap)
+        return AudioTrack(tuple(taps))
+
+
+def get_track(clip):
+    """Track of ``clip``, or None when it has none or when its frames were
+    changed since (a time transform, an effect not listed here...)."""
+    track = getattr(clip, "track", None)
+    if track is None or getattr(clip, "_track_frame_function", None) != _frame_function_key(clip):
+        return None
+    return track
+
+
+def set_track(clip, track):
+    """Gives ``track`` to ``clip``, as it is now (see ``get_track``)."""
+    clip.track = track
+    clip._track_frame_function = _frame_function_key(clip) if track is not None else None
+    return clip
+
+
+def subclipped_track(clip, subclip, start_time):
+    """Gives ``subclip``, ``clip.subclipped(start_time, ...)``, the part of
+    the track of ``clip`` it plays."""
+    track = get_track(clip)
+    if track is None:
+        return set_track(subclip, None)
+    # Same conversion of the times as Clip.subclipped
+    start_time = convert_to_seconds(start_time)
+    if start_time < 0:
+        start_time = clip.duration + start_time
+    return set_track(subclip, track.subclipped(start_time, start_time + subclip.duration))
+
+
+def audio_extract(clip, start_time, end_time):
+    """``clip.subclipped(start_time, end_time)``."""
+    return subclipped_track(clip, clip.subclipped(start_time, end_time), start_time)
+
+
+def audio_volume(clip, left, right):
+    """``MultiplyStereoVolume(left, right)`` of ``clip``."""
+    return _tracked(moviepy.audio.fx.MultiplyStereoVolume(left=left, right=right).apply(clip), clip,
+                    lambda track: track.with_volume(left, right))
+
+
+def audio_fade_in(clip, duration):
+    """``AudioFadeIn(duration)`` of ``clip``."""
+    return _tracked(moviepy.audio.fx.AudioFadeIn(duration).apply(clip), clip,
+                    lambda track: track.with_envelope([0, duration], [0, 1]))
+
+
+def audio_fade_out(clip, duration):
+    """``AudioFadeOut(duration)`` of ``clip``."""
+    return _tracked(moviepy.audio.fx.AudioFadeOut(duration).apply(clip), clip,
+                    lambda track: track.with_envelope([clip.duration - duration, clip.duration], [1, 0]))
+
+
+def audio_delay(clip, offset, repetitions):
+    """``AudioDelay(offset, repetitions)`` of ``clip``."""
+    return _tracked(moviepy.audio.fx.AudioDelay(offset=offset, n_repeats=repetitions).apply(clip), clip,
+                    lambda track: track.delayed(offset, repetitions, clip.duration))
+
+
+def _tracked(result, clip, update):
+    # The effects copy the clip, its track is replaced by the updated one
+    track = get_track(clip)
+    return set_track(result, update(track) if track is not None else None)
+
+
+def _frame_function_key(clip):
+    # The copies of a clip (with_start...) share its frame function, or the
+    # function of its method
+    return getattr(clip.frame_function, "__func__", clip.frame_function)
+
+
+def _clamped(tap, start, end):
+    return replace(tap, start=max(tap.start, start), end=min(tap.end, end))
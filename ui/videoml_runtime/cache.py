@@ -0,0 +1,138 @@
+"""On-disk cache of the video parts rendered by previous runs.
+
+A part is identified by a hash of everything its frames depend on: the inputs
+of the clips playing in it (element, options, source files and their
+modification times, as listed by the generated program) and where those clips
+start and end relative to the part. A part whose clips were moved along the
+timeline without being changed is therefore still found in the cache.
+"""
+import hashlib
+import json
+import os
+import shutil
+
+CACHE_DIR_ENV = "VIDEOML_CACHE_DIR"
+CACHE_SIZE_ENV = "VIDEOML_CACHE_SIZE"
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "videoml", "parts")
+# In megabytes
+DEFAULT_CACHE_SIZE = 2048
+
+# Bump when a change of the runtime changes the rendered frames
+CACHE_VERSION = 2
+
+
+class RenderCache:
+    """Directory of rendered parts (files of ``extension``), evicted least
+    recently used first once it grows over ``max_bytes``."""
+
+    def __init__(self, directory=None, max_bytes=None, extension=".mkv"):
+        self.directory = directory or os.environ.get(CACHE_DIR_ENV) or DEFAULT_CACHE_DIR
+        if max_bytes is None:
+            max_bytes = int(os.environ.get(CACHE_SIZE_ENV, DEFAULT_CACHE_SIZE)) * 1024 * 1024
+        self.max_bytes = max_bytes
+        self.extension = extension
+        os.makedirs(self.directory, exist_ok=True)
+
+    def get(self, key):
+        """Path of the cached part for ``key``, or None."""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        # The modification time is the "last used" date of the LRU
+        os.utime(path)
+        return path
+
+    def put(self, key, part_path):
+        """Stores a copy of ``part_path`` under ``key``."""
+        path = self._path(key)
+        temp_path = path + ".tmp"
+        try:
+            os.link(part_path, temp_path)
+        except OSError:
+            shutil.copyfile(part_path, temp_path)
+        os.replace(temp_path, path)
+
+    def fetch(self, key, path):
+        """Hard-links (or copies) the cached part for ``key`` to ``path``, so
+        that another render evicting it doesn't remove it while it is used.
+        Returns False when the part is not in the cache."""
+        cached_path = self.get(key)
+        if not cached_path:
+            return False
+        try:
+            os.link(cached_path, path)
+        except FileNotFoundError:
+            return False
+        except OSError:
+            try:
+                shutil.copyfile(cached_path, path)
+            except FileNotFoundError:
+                return False
+        return True
+
+    def evict(self):
+        """Removes the least recently used parts until the cache fits in its size limit.
+
+        Only the stored parts (``<key><extension>``) are counted and removed:
+        the files being written in the directory (the ``.tmp`` copies of
+        ``put``, the ``<key>.partial-...`` files of the callers) belong to a
+        running process.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.extension) or "." in name[:-len(self.extension)]:
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.extension)
+
+
+def part_key(final_video, first, last, render_inputs, encoding):
+    """Cache key of the frames ``[first, last)`` of ``final_video``, or None
+    when one of the clips playing in it has no known inputs.
+
+    ``render_inputs`` maps ``id(clip)`` to the JSON description of its
+    inputs, ``encoding`` describes the settings of the encoder.
+    """
+    fps = final_video.fps
+    description = [CACHE_VERSION, encoding, list(final_video.size), fps, last - first]
+    for clip in final_video.clips:
+        clip_end = clip.end * fps if clip.end is not None else float("inf")
+        if clip.start * fps >= last or clip_end <= first:
+            continue
+        inputs = render_inputs.get(id(clip))
+        if inputs is None:
+            return None
+        description.append([
+            inputs,
+            [file_version(path) for path in json.loads(inputs).get("files", [])],
+            round(clip.start * fps - first, 6),
+            round(clip_end - first, 6) if clip.end is not None else None,
+        ])
+    return hashlib.sha256(json.dumps(description).encode()).hexdigest()
+
+
+def file_version(path):
+    """Modification time and size of ``path``, or None when it is missing."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
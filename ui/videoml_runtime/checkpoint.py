@@ -0,0 +1,105 @@
+"""Parts of an unfinished render, kept so that running it again resumes it.
+
+The parts of a render are written in a directory next to the output file
+(``.<name>.parts``), with a manifest giving the key of every part: the
+cache key of its frames (see ``cache``), or a hash of the program and of
+its source files when the part has none. A part is written under a
+temporary name and renamed once its encoder is closed, so a file with the
+final name is always whole.
+
+When the render is cancelled or fails, the directory stays. The next render
+of the same output only renders the parts missing from it, or whose key
+changed, then joins all of them; the directory is removed once the output
+is written. The audio track is always mixed again, it takes seconds.
+"""
+import hashlib
+import json
+import os
+import shutil
+
+from .cache import file_version
+
+MANIFEST_NAME = "manifest.json"
+
+# Bump when the layout of the directory changes
+CHECKPOINT_VERSION = 1
+
+
+class Checkpoint:
+    """Directory of the parts of the render of ``filename``."""
+
+    def __init__(self, filename):
+        output = os.path.abspath(filename)
+        self.directory = os.path.join(os.path.dirname(output), ".%s.parts" % os.path.basename(output))
+        self._manifest_path = os.path.join(self.directory, MANIFEST_NAME)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def resume(self, parts):
+        """Starts the render of ``parts``, a dict of part names to keys.
+
+        Returns the names of the parts already written by a previous render
+        with the same key (a part whose key is None is always rendered). The
+        other files of the directory are removed.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        previous = self._read_manifest()
+        done = {
+            name for name, key in parts.items()
+            if key is not None and previous.get(name) == key and os.path.exists(self.path(name))
+        }
+        for name in os.listdir(self.directory):
+            if name not in done and name != MANIFEST_NAME and ".partial-" not in name:
+                try:
+                    os.remove(self.path(name))
+                except OSError:
+                    pass
+
+        temp_path = self._manifest_path + ".tmp-%d" % os.getpid()
+        with open(temp_path, "w") as manifest:
+            json.dump({"version": CHECKPOINT_VERSION, "parts": parts}, manifest)
+        os.replace(temp_path, self._manifest_path)
+        return done
+
+    def remove(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _read_manifest(self):
+        try:
+            with open(self._manifest_path) as manifest:
+                content = json.load(manifest)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(content, dict) or content.get("version") != CHECKPOINT_VERSION:
+            return {}
+        return content.get("parts", {})
+
+
+def partial_path(path):
+    """Temporary path of the part ``path`` while it is written, renamed to
+    ``path`` once whole. The extension is kept for the muxer."""
+    root, extension = os.path.splitext(path)
+    # Two renders of the same output don't write the same file
+    return "%s.partial-%d%s" % (root, os.getpid(), extension)
+
+
+def program_key(program, render_inputs):
+    """Hash of the program and of the versions of the files it reads, for
+    the parts without a cache key."""
+    digest = hashlib.sha256()
+    if program:
+        try:
+            with open(program, "rb") as program_file:
+                digest.update(program_file.read())
+        except OSError:
+            pass
+    files = sorted({path for _, inputs in render_inputs for path in json.loads(inputs).get("files", [])})
+    digest.update(json.dumps([[path, file_version(path)] for path in files]).encode())
+    return digest.hexdigest()
+
+
+def copy_key(copy_range, fps):
+    """Key of a part copied from its source (see ``passthrough``)."""
+    description = ["copy", copy_range.path, file_version(copy_range.path), copy_range.source_start, copy_range.last - copy_range.first, fps]
+    return hashlib.sha256(json.dumps(description).encode()).hexdigest()
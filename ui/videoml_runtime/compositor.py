@@ -0,0 +1,131 @@
+"""Composition of the timeline elements into the final video.
+
+``moviepy.CompositeVideoClip`` checks every clip on every frame to find the
+ones playing. ``TimelineCompositeVideoClip`` cuts the timeline at every clip
+start and end once, and keeps the playing clips of each of these spans: a
+frame then only costs a binary search and the blit of its playing clips.
+
+Clips hidden by an opaque clip covering the whole frame above them (a video
+resized to the frame size, a text with a background...) are left out of the
+span, so their frames are neither decoded nor blitted.
+
+The audio of the video clips is mixed by ``mixer.MixedAudioClip``.
+
+The time spent getting the frames of the clips is counted as the ``effects``
+stage of the render, and the blits as the ``composite`` stage (see ``events``).
+"""
+import copy
+from bisect import bisect_right
+
+from moviepy.video.compositing.CompositeVideoClip import CompositeVideoClip
+from moviepy.video.VideoClip import ImageClip
+
+from .events import stage
+from .mixer import MixedAudioClip
+
+
+class TimelineCompositeVideoClip(CompositeVideoClip):
+    """``CompositeVideoClip`` finding the clips playing at ``t`` through an
+    index of the spans of the timeline.
+
+    The background is opaque black by default: the final video has no alpha
+    channel, and a transparent background would composite a mask of every
+    clip on each frame.
+    """
+
+    def __init__(self, clips, size=None, bg_color=(0, 0, 0), **kwargs):
+        super().__init__(clips, size=size, bg_color=bg_color, **kwargs)
+        if self.audio is not None:
+            # Audio of the video clips, mixed from their tracks (see mixer)
+            self.audio = MixedAudioClip(self.audio.clips)
+        self._index_spans()
+
+    def playing_clips(self, t=0):
+        if not isinstance(t, (int, float)):
+            return super().playing_clips(t)
+        span = bisect_right(self._span_starts, t) - 1
+        return self._span_clips[span] if span >= 0 else []
+
+    def _index_spans(self):
+        # self.clips is in layer order: a span lists its clips in that order
+        timed_clips = [_timed_clip(clip) for clip in self.clips]
+        events = {}
+        for order, clip in enumerate(self.clips):
+            events.setdefault(clip.start, ([], []))[0].append(order)
+            if clip.end is not None:
+                events.setdefault(clip.end, ([], []))[1].append(order)
+
+        self._span_starts = sorted(events)
+        self._span_clips = []
+        opaque = {}
+        playing = set()
+        for start in self._span_starts:
+            starting, ending = events[start]
+            playing.update(starting)
+            playing.difference_update(ending)
+            orders = sorted(playing)
+            # Only keep the clips from the top-most one covering the frame
+            for i in range(len(orders) - 1, -1, -1):
+                clip = self.clips[orders[i]]
+                if not covers_frame(clip, self.size, start):
+                    continue
+                if orders[i] not in opaque:
+                    opaque[orders[i]] = is_opaque(clip)
+                if opaque[orders[i]]:
+                    orders = orders[i:]
+                    break
+            self._span_clips.append([timed_clips[order] for order in orders])
+
+
+def _timed_clip(clip):
+    # Copy of the clip timing its frames, the clip itself is left untouched
+    # (its identity lists it in the inputs of the render)
+    timed = copy.copy(clip)
+    get_frame = clip.get_frame
+
+    def timed_get_frame(t):
+        with stage("effects"):
+            return get_frame(t)
+
+    timed.get_frame = timed_get_frame
+    return timed
+
+
+def covers_frame(clip, size, t):
+    """Whether ``clip`` has the size of the frame and is placed at its origin
+    at time ``t``.
+
+    Positions are taken as constant over a span, as in generated programs.
+    """
+    return tuple(clip.size) == tuple(size) and _blit_position(clip, t - clip.start, size) == (0, 0)
+
+
+def is_opaque(clip):
+    """Whether every pixel of ``clip`` is fully opaque."""
+    if clip.mask is None:
+        return True
+    # Masks of images (texts with a background) are constant
+    return isinstance(clip.mask, ImageClip) and clip.mask.img.min() >= 1
+
+
+def _blit_position(clip, clip_time, size):
+    # Same resolution of the position as VideoClip.blit_on
+    pos = clip.pos(clip_time)
+    if isinstance(pos, str):
+        pos = {
+            "center": ["center", "center"],
+            "left": ["left", "center"],
+            "right": ["right", "center"],
+            "top": ["center", "top"],
+            "bottom": ["center", "bottom"],
+        }[pos]
+    else:
+        pos = list(pos)
+    if clip.relative_pos:
+        pos = [value if isinstance(value, str) else dim * value for value, dim in zip(pos, size)]
+    pos = [
+        {"left": 0, "top": 0, "center": (dim - clip_dim) / 2, "right": dim - clip_dim, "bottom": dim - clip_dim}[value]
+        if isinstance(value, str) else value
+        for value, dim, clip_dim in zip(pos, size, clip.size)
+    ]
+    return tuple(int(value) for value in pos)
@@ -0,0 +1,237 @@
+"""Long-lived interpreter running the generated programs.
+
+Starting Python and importing moviepy, NumPy and PIL takes seconds, which a
+fresh ``python video.py`` pays before its first frame. The render daemon is
+started once by the UI (``python -m videoml_runtime.daemon``): it imports
+the runtime, then runs the programs it receives one after the other in the
+same interpreter. The decoders of the sources (see ``sources``), the probes
+of the files and the fonts of the texts (see ``text``) stay loaded from one
+program to the next.
+
+Messages are JSON objects, one per line. On stdin::
+
+    {"type": "render", "id": 1, "program": "/path/video.py", "env": {"VIDEOML_WORKERS": "8"}}
+    {"type": "cancel"}
+
+``env`` is added to the environment of the program, ``environ`` replaces it.
+On stdout::
+
+    {"type": "ready"}                       once the runtime is imported
+    {"type": "done", "id": 1, "code": 0}    code 1 on error, null when cancelled
+
+Other lines of stdout are printed by the programs. Progress bars and
+tracebacks go to stderr, as with a plain run. A ``cancel`` message (or
+SIGINT, where there is one) interrupts the running program, the daemon keeps
+running; it exits at the end of stdin.
+
+With ``--workers N``, N worker daemons (``--worker``) are started ahead of
+the first render: the parts rendered in parallel (see ``render``) are given
+to them instead of fresh interpreters. A worker prints a ``1`` line per
+frame it writes and a report per part, like the interpreters it replaces.
+
+The UI reads the events of the renders (see ``events``) from the descriptor
+given by ``VIDEOML_EVENTS_FD``.
+"""
+import _thread
+import argparse
+import gc
+import json
+import os
+import queue
+import runpy
+import subprocess
+import sys
+import threading
+import traceback
+
+import moviepy  # noqa: F401 (imported once for all the programs)
+
+from . import render, sources
+from .events import STAGES
+
+_output = sys.stdout
+_output_lock = threading.Lock()
+
+# Whether a program runs, a cancel message only interrupts a program
+_running = False
+_running_lock = threading.Lock()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m videoml_runtime.daemon")
+    parser.add_argument("--workers", type=int, default=0, help="worker daemons to start ahead of the renders")
+    parser.add_argument("--worker", action="store_true", help="render parts for another daemon")
+    args = parser.parse_args()
+
+    if not args.worker:
+        workers = WarmWorkers()
+        render.set_worker_launcher(workers.launch)
+        workers.prestart(args.workers)
+
+    try:
+        _serve()
+    except BrokenPipeError:
+        # The parent stopped while this daemon was starting, the output is
+        # redirected so that Python doesn't report the pipe again at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+
+
+def _serve():
+    jobs = queue.Queue()
+    threading.Thread(target=_read_jobs, args=(jobs,), daemon=True).start()
+    send({"type": "ready"})
+    while True:
+        try:
+            job = jobs.get()
+        except KeyboardInterrupt:
+            # Cancel of a program that ended meanwhile
+            continue
+        if job is None:
+            return
+        if job.get("type") == "render":
+            send({"type": "done", "id": job.get("id"), "code": run_program(job)})
+
+
+def send(message):
+    with _output_lock:
+        _output.write(json.dumps(message) + "\n")
+        _output.flush()
+
+
+def run_program(job):
+    """Runs the program of ``job`` as ``__main__``, returns its exit code
+    (None when cancelled)."""
+    program = job["program"]
+    saved_environ = dict(os.environ)
+    saved_argv = sys.argv
+    saved_path = list(sys.path)
+    if "environ" in job:
+        os.environ.clear()
+        os.environ.update(job["environ"])
+    os.environ.update(job.get("env", {}))
+    sys.argv = [program]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(program)))
+    STAGES.reset()
+
+    global _running
+    code = 0
+    try:
+        with _running_lock:
+            _running = True
+        runpy.run_path(program, run_name="__main__")
+    except KeyboardInterrupt:
+        code = None
+    except SystemExit as error:
+        code = error.code if isinstance(error.code, int) else int(error.code is not None)
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        with _running_lock:
+            _running = False
+        os.environ.clear()
+        os.environ.update(saved_environ)
+        sys.argv = saved_argv
+        sys.path[:] = saved_path
+        sys.stdout.flush()
+        sys.stderr.flush()
+        # Sources of this program stay open for the next one, the others are closed
+        sources.POOL.release_unused()
+        gc.collect()
+    return code
+
+
+def _read_jobs(jobs):
+    for line in sys.stdin:
+        message = _parse_message(line)
+        if message and message["type"] == "cancel":
+            # Same KeyboardInterrupt as SIGINT, which Windows doesn't have
+            with _running_lock:
+                if _running:
+                    _thread.interrupt_main()
+        elif message:
+            jobs.put(message)
+    jobs.put(None)
+
+
+def _parse_message(line):
+    try:
+        message = json.loads(line)
+    except ValueError:
+        return None
+    return message if isinstance(message, dict) and "type" in message else None
+
+
+class WarmWorkers:
+    """Worker daemons waiting for parts to render, started with the same
+    interpreter and working directory as this daemon."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle = []
+        self._max_idle = 0
+
+    def prestart(self, count):
+        with self._lock:
+            self._max_idle = max(self._max_idle, count)
+            self._idle += [self._start() for _ in range(count - len(self._idle))]
+
+    def launch(self, program, env):
+        """Runs ``program`` with the environment ``env`` in a worker, returns
+        a ``Popen``-like view of the run (see ``render._run_segment_worker``)."""
+        with self._lock:
+            idle = [process for process in self._idle if process.poll() is None]
+            process = idle.pop() if idle else self._start()
+            self._idle = idle
+        process.stdin.write(json.dumps({"type": "render", "program": program, "environ": env}) + "\n")
+        process.stdin.flush()
+        return _WorkerRun(self, process)
+
+    def _release(self, process):
+        with self._lock:
+            if len(self._idle) < self._max_idle:
+                self._idle.append(process)
+                return
+        process.stdin.close()
+
+    def _start(self):
+        return subprocess.Popen(
+            [sys.executable, "-m", "videoml_runtime.daemon", "--worker"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+        )
+
+
+class _WorkerRun:
+    """One program run by a worker daemon, seen as a process: ``stdout`` ends
+    with the program, and ``kill`` stops the worker."""
+
+    def __init__(self, workers, process):
+        self._workers = workers
+        self._process = process
+        self.returncode = None
+        self.stdout = self._lines()
+
+    def _lines(self):
+        for line in self._process.stdout:
+            message = _parse_message(line)
+            if message is None or message["type"] not in ("ready", "done"):
+                yield line
+            elif message["type"] == "done":
+                code = message["code"]
+                self.returncode = 1 if code is None else code
+                self._workers._release(self._process)
+                return
+        # The worker stopped (killed, or crashed)
+        self.returncode = self._process.wait() or 1
+
+    def wait(self):
+        for _ in self.stdout:
+            pass
+        return self.returncode
+
+    def kill(self):
+        self._process.kill()
+
+
+if __name__ == "__main__":
+    main()
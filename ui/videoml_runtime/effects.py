@@ -0,0 +1,84 @@
+"""Effects used by the generated programs in place of chains of moviepy effects."""
+from dataclasses import dataclass
+
+import numpy as np
+from moviepy.Clip import Clip
+from moviepy.Effect import Effect
+from PIL import Image, ImageFilter
+
+# Same parameters as the moviepy effects generated for these options
+CONTRAST_LUM = 20
+CONTRAST_THRESHOLD = 127.0
+
+
+@dataclass
+class ColorCorrection(Effect):
+    """Brightness, contrast and saturation options applied in one pass.
+
+    ``steps`` lists the options in the order they apply, as ``(name, value)``
+    with name ``"brightness"``, ``"contrast"`` or ``"saturation"``. The frames
+    are the ones of the ``MultiplyColor``, ``LumContrast`` and ``Painting``
+    effects, but consecutive per-pixel steps are merged into one 256-entry
+    lookup table: a frame costs one table lookup instead of a float copy per
+    option. ``Painting`` also sharpens the frame, which can't be a lookup and
+    stays a separate step.
+    """
+
+    steps: list
+
+    def apply(self, clip: Clip) -> Clip:
+        """Apply the effect to the clip."""
+        stages = _build_stages(self.steps)
+
+        def image_filter(frame):
+            if frame.dtype != np.uint8:
+                # Lookup tables only index 8-bit frames
+                return _apply_steps(self.steps, frame)
+            for stage in stages:
+                if stage is None:
+                    frame = np.asarray(Image.fromarray(frame).filter(ImageFilter.EDGE_ENHANCE_MORE))
+                else:
+                    frame = stage[frame]
+            return frame
+
+        return clip.image_transform(image_filter)
+
+
+def _build_stages(steps):
+    # Lookup tables, with None for the sharpening of a saturation step
+    stages = []
+    lut = None
+    for name, value in steps:
+        if name == "saturation":
+            if lut is not None:
+                stages.append(lut)
+            stages.append(None)
+            lut = None
+        # Tabulate the step by running it on every possible value
+        step_lut = _apply_step(name, value, np.arange(256, dtype=np.uint8), sharpen=False)
+        lut = step_lut if lut is None else step_lut[lut]
+    if lut is not None:
+        stages.append(lut)
+    return stages
+
+
+def _apply_steps(steps, frame):
+    for name, value in steps:
+        frame = _apply_step(name, value, frame)
+    return frame
+
+
+def _apply_step(name, value, frame, sharpen=True):
+    # Same computations as MultiplyColor, LumContrast and Painting (with no
+    # black lines)
+    if name == "brightness":
+        return np.minimum(255, value * frame).astype("uint8")
+    if name == "contrast":
+        frame = 1.0 * frame
+        corrected = frame + CONTRAST_LUM + value * (frame - CONTRAST_THRESHOLD)
+        return np.clip(corrected, 0, 255).astype("uint8")
+    if name == "saturation":
+        if sharpen:
+            frame = np.array(Image.fromarray(frame).filter(ImageFilter.EDGE_ENHANCE_MORE))
+        return np.maximum(0, np.minimum(255, value * frame)).astype("uint8")
+    raise ValueError("Unknown colour step: %s" % name)
@@ -0,0 +1,145 @@
+"""Machine-readable events of a render, for the UI.
+
+When the ``VIDEOML_EVENTS_FD`` environment variable holds the number of an
+open file descriptor, the render writes one JSON object per line to it:
+
+* ``{"type": "start", "frames": ..., "parts": ..., "workers": ...,
+  "resumed": ...}``, ``resumed`` being the frames kept from a previous run
+  of the render (see ``checkpoint``);
+* ``{"type": "progress", "bar": "frame_index", "index": ..., "total": ...,
+  "elapsed": ..., "parts_done": ..., "parts_queued": ..., "stages": {...},
+  "peak_rss": ...}``, at most every ``PROGRESS_INTERVAL`` seconds (``bar`` is
+  ``"chunk"`` for the audio chunks of a render without parts);
+* ``{"type": "done", "frames": ..., "elapsed": ..., "stages": {...},
+  "peak_rss": ...}``.
+
+``stages`` holds the seconds spent in each stage of the render (``decode``,
+``effects``, ``composite``, ``encode``, ``audio``, ``copy`` and ``join``
+for the parts copied from their source and joined, and ``proxy`` for the
+proxies made for a preview) summed over the
+processes, a stage not counting the stages it calls. ``peak_rss`` is the
+largest resident memory of the processes, in bytes (None where it can't be
+read).
+Without the variable, nothing is written and the progress bars are printed
+on stderr as usual.
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+EVENTS_FD_ENV = "VIDEOML_EVENTS_FD"
+
+# Seconds between two progress events
+PROGRESS_INTERVAL = 0.25
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class StageTimes:
+    """Time spent in each stage, by all the threads of the process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stages = {}
+        self.totals = {}
+
+    def stage(self, name):
+        """Context manager timing a stage (without the stages it calls)."""
+        if name not in self._stages:
+            self._stages[name] = _Stage(self, name)
+        return self._stages[name]
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.totals)
+
+    def merge(self, totals):
+        with self._lock:
+            for name, seconds in totals.items():
+                self.totals[name] = self.totals.get(name, 0.0) + seconds
+
+    def reset(self):
+        with self._lock:
+            self.totals = {}
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+
+class _Stage:
+    __slots__ = ("_times", "_name")
+
+    def __init__(self, times, name):
+        self._times = times
+        self._name = name
+
+    def __enter__(self):
+        # [start, time spent in the stages called]
+        self._times._stack().append([time.perf_counter(), 0.0])
+
+    def __exit__(self, *exc_info):
+        stack = self._times._stack()
+        start, inner = stack.pop()
+        elapsed = time.perf_counter() - start
+        if stack:
+            stack[-1][1] += elapsed
+        self._times.merge({self._name: elapsed - inner})
+
+
+STAGES = StageTimes()
+
+
+def stage(name):
+    """Times a stage of the render of this process, see ``StageTimes.stage``."""
+    return STAGES.stage(name)
+
+
+def peak_rss():
+    """Largest resident memory of this process so far, in bytes, or None."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+class EventWriter:
+    """Writes the events to the descriptor of ``VIDEOML_EVENTS_FD``, or
+    nothing when it isn't set (``enabled`` is then False)."""
+
+    def __init__(self, fd=None):
+        if fd is None and os.environ.get(EVENTS_FD_ENV):
+            fd = int(os.environ[EVENTS_FD_ENV])
+        self._lock = threading.Lock()
+        self._file = os.fdopen(fd, "w", closefd=False) if fd is not None else None
+        self._last_progress = 0.0
+
+    @property
+    def enabled(self):
+        return self._file is not None
+
+    def emit(self, event_type, **fields):
+        if self._file is None:
+            return
+        line = json.dumps(dict(type=event_type, **fields)) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def progress(self, force=False, **fields):
+        """Emits a progress event, unless one was emitted less than
+        ``PROGRESS_INTERVAL`` seconds ago (and ``force`` is False)."""
+        now = time.monotonic()
+        if not force and now - self._last_progress < PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        self.emit("progress", **fields)
@@ -0,0 +1,268 @@
+"""Composited frames of a program on demand, for the timeline of the UI.
+
+``python -m videoml_runtime.frame_server`` serves HTTP on a local port,
+printed on stdout as ``{"type": "ready", "port": ...}`` once the runtime is
+imported:
+
+* ``POST /load`` with ``{"program": "/path/preview.py"}`` runs the program
+  without rendering it (see ``render.set_render_handler``) and keeps its
+  final video. Answers ``{"version": ..., "duration": ..., "fps": ...,
+  "frames": ..., "size": [...]}``, or the traceback with a 400 status;
+* ``GET /frame?t=<seconds>&format=jpeg`` answers the frame of the final
+  video shown at ``t``, as a JPEG or, with ``format=raw``, as RGB bytes
+  (its size in the ``X-Frame-Width`` and ``X-Frame-Height`` headers).
+
+Frames are rendered by one thread, the requests first, then the frames just
+after the last one requested (the playhead) so that playing or scrubbing
+forward finds them ready. Rendered frames are kept in an LRU cache of
+``VIDEOML_FRAME_CACHE_SIZE`` megabytes, cleared when a program is loaded.
+The UI loads the preview program (see ``proxies``), whose frames are small
+and whose sources are read from their proxies.
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import queue
+import runpy
+import sys
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image
+
+from . import render, sources
+
+FRAME_CACHE_SIZE_ENV = "VIDEOML_FRAME_CACHE_SIZE"
+# In megabytes
+DEFAULT_FRAME_CACHE_SIZE = 256
+
+# Frames rendered ahead of the playhead
+PREFETCH_FRAMES = 24
+
+JPEG_QUALITY = 85
+
+# Priorities of the frames to render, lowest first
+REQUEST_PRIORITY = 0
+PREFETCH_PRIORITY = 1
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m videoml_runtime.frame_server")
+    parser.add_argument("--port", type=int, default=0, help="port to listen on (any free port by default)")
+    args = parser.parse_args()
+
+    frames = FrameServer()
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), _handler(frames))
+    server.daemon_threads = True
+    print(json.dumps({"type": "ready", "port": server.server_address[1]}), flush=True)
+    # Stops with its parent, at the end of stdin
+    threading.Thread(target=_stop_at_end_of_input, args=(server,), daemon=True).start()
+    server.serve_forever()
+
+
+def _stop_at_end_of_input(server):
+    for _ in sys.stdin:
+        pass
+    server.shutdown()
+
+
+class FrameCache:
+    """Encoded frames, by key, evicted least recently used first once they
+    use more than ``max_bytes``."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._frames = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key):
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is not None:
+                self._frames.move_to_end(key)
+            return frame
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._frames
+
+    def put(self, key, frame):
+        with self._lock:
+            if key in self._frames:
+                return
+            self._frames[key] = frame
+            self._bytes += len(frame[0])
+            while self._bytes > self.max_bytes and len(self._frames) > 1:
+                _, (data, _) = self._frames.popitem(last=False)
+                self._bytes -= len(data)
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._bytes = 0
+
+
+class FrameServer:
+    """Final video of the loaded program, and the thread rendering its frames."""
+
+    def __init__(self, cache_bytes=None):
+        if cache_bytes is None:
+            cache_bytes = int(os.environ.get(FRAME_CACHE_SIZE_ENV, DEFAULT_FRAME_CACHE_SIZE)) * 1024 * 1024
+        self.cache = FrameCache(cache_bytes)
+        self.version = 0
+        self._video = None
+        self._fps = None
+        self._total_frames = 0
+        self._playhead = 0
+        # The clips are used by one thread at a time
+        self._video_lock = threading.Lock()
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()
+        threading.Thread(target=self._render_frames, daemon=True).start()
+
+    def load(self, program):
+        """Runs ``program`` and keeps its final video, returns its infos."""
+        loaded = {}
+
+        def keep_final_video(final_video, filename, fps=None, **kwargs):
+            # No final video for the programs exporting only audio
+            loaded["video"] = final_video.with_fps(fps) if final_video is not None and fps else final_video
+
+        previous_handler = render.set_render_handler(keep_final_video)
+        saved_argv = sys.argv
+        sys.argv = [program]
+        try:
+            with self._video_lock:
+                runpy.run_path(program, run_name="__main__")
+                if "video" not in loaded:
+                    raise RuntimeError("The program doesn't call render_video")
+                if loaded["video"] is None:
+                    raise RuntimeError("The project has no visual element to show")
+                self._video = loaded["video"]
+                self._fps = self._video.fps
+                # Same frame count as the renders, see render.render_video
+                self._total_frames = max(1, int(self._video.duration * self._fps))
+                self.version += 1
+                self.cache.clear()
+                # The sources of the previous program are closed
+                sources.POOL.release_unused()
+        finally:
+            render.set_render_handler(previous_handler)
+            sys.argv = saved_argv
+        return {
+            "version": self.version, "duration": self._video.duration, "fps": self._fps,
+            "frames": self._total_frames, "size": list(self._video.size),
+        }
+
+    def frame(self, t, image_format="jpeg"):
+        """Encoded frame shown at ``t``, as ``(data, size)``."""
+        if self._video is None:
+            raise RuntimeError("No program loaded")
+        index = min(max(int(t * self._fps + 1e-6), 0), self._total_frames - 1)
+        self._playhead = index
+        key = (self.version, index, image_format)
+        frame = self.cache.get(key)
+        if frame is None:
+            future = Future()
+            self._queue.put((REQUEST_PRIORITY, next(self._order), key, future))
+            frame = future.result()
+        self._prefetch(index, image_format)
+        return frame
+
+    def _prefetch(self, index, image_format):
+        last = min(index + PREFETCH_FRAMES, self._total_frames - 1)
+        for ahead, prefetched in enumerate(range(index + 1, last + 1)):
+            key = (self.version, prefetched, image_format)
+            if key not in self.cache:
+                self._queue.put((PREFETCH_PRIORITY, ahead, key, None))
+
+    def _render_frames(self):
+        while True:
+            _, _, key, future = self._queue.get()
+            version, index, image_format = key
+            if future is None and (
+                version != self.version or not 0 < index - self._playhead <= PREFETCH_FRAMES or key in self.cache
+            ):
+                # Prefetch of a previous program, or far from the playhead now
+                continue
+            try:
+                frame = self.cache.get(key) or self._render(key)
+            except BaseException as error:
+                if future:
+                    future.set_exception(error)
+                continue
+            if future:
+                future.set_result(frame)
+
+    def _render(self, key):
+        version, index, image_format = key
+        with self._video_lock:
+            if version != self.version:
+                raise RuntimeError("The program was loaded again")
+            pixels = self._video.get_frame(index / self._fps).astype("uint8")
+        size = (pixels.shape[1], pixels.shape[0])
+        if image_format == "raw":
+            data = pixels.tobytes()
+        else:
+            buffer = io.BytesIO()
+            Image.fromarray(pixels).save(buffer, "JPEG", quality=JPEG_QUALITY)
+            data = buffer.getvalue()
+        frame = (data, size)
+        self.cache.put(key, frame)
+        return frame
+
+
+def _handler(frames):
+    class FrameRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != "/frame":
+                return self._send(404, b"Not found", "text/plain")
+            query = parse_qs(url.query)
+            image_format = query.get("format", ["jpeg"])[0]
+            try:
+                data, size = frames.frame(float(query.get("t", ["0"])[0]), image_format)
+            except Exception:
+                return self._send(400, traceback.format_exc().encode(), "text/plain")
+            content_type = "application/octet-stream" if image_format == "raw" else "image/jpeg"
+            self._send(200, data, content_type, {"X-Frame-Width": size[0], "X-Frame-Height": size[1]})
+
+        def do_POST(self):
+            if urlparse(self.path).path != "/load":
+                return self._send(404, b"Not found", "text/plain")
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                infos = frames.load(body["program"])
+            except Exception:
+                return self._send(400, traceback.format_exc().encode(), "text/plain")
+            self._send(200, json.dumps(infos).encode(), "application/json")
+
+        def _send(self, status, data, content_type, headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            # The frames are shown by the page of the UI
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.send_header("Access-Control-Expose-Headers", "X-Frame-Width, X-Frame-Height")
+            self.send_header("Cache-Control", "no-store")
+            for name, value in (headers or {}).items():
+                self.send_header(name, str(value))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            # One request per frame, not worth a line on stderr
+            pass
+
+    return FrameRequestHandler
+
+
+if __name__ == "__main__":
+    main()
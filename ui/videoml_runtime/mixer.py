@@ -0,0 +1,184 @@
+"""Mix of the audio of the timeline.
+
+``moviepy.CompositeAudioClip`` asks every clip for every chunk of samples,
+through the chain of functions of its effects, each source read by its own
+ffmpeg process. ``MixedAudioClip`` plays the tracks of the clips instead (see
+``audio_tracks``): each source is decoded once into a file of 16 bit PCM
+samples, read as a memory map, and a block of samples only adds the taps
+playing in it, multiplied by their gains, with a few NumPy operations each.
+Clips without a track are asked for their frames, as by moviepy.
+
+The PCM files are kept in ``~/.cache/videoml/pcm`` (or the ``VIDEOML_PCM_DIR``
+environment variable), by source file and modification time, and evicted
+least recently used first once they use more than ``VIDEOML_PCM_CACHE_SIZE``
+megabytes. The sources are decoded in parallel when the mix is written (the
+``audio`` stage of the render, see ``render``), then the volumes of the
+normalized clips are measured in parallel (see ``analysis``).
+"""
+import hashlib
+import json
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import proglog
+from moviepy.audio.AudioClip import AudioClip
+from moviepy.config import FFMPEG_BINARY
+
+from .audio_tracks import get_track
+from .cache import RenderCache
+from .sources import POOL, file_signature
+
+PCM_DIR_ENV = "VIDEOML_PCM_DIR"
+PCM_CACHE_SIZE_ENV = "VIDEOML_PCM_CACHE_SIZE"
+
+DEFAULT_PCM_DIR = os.path.join(os.path.expanduser("~"), ".cache", "videoml", "pcm")
+# In megabytes
+DEFAULT_PCM_CACHE_SIZE = 4096
+
+# Samples mixed at once when the mix is written, whatever the chunk size
+# asked by moviepy
+MIX_BLOCK_SIZE = 44100
+
+# Sources decoded at the same time
+DECODE_THREADS = 4
+
+# Bump when the decoding of the sources changes
+PCM_VERSION = 1
+
+NCHANNELS = 2
+
+
+def mix_audio(clips, fps=44100):
+    """Replaces ``moviepy.CompositeAudioClip(clips)`` in the generated programs."""
+    return MixedAudioClip(clips, fps)
+
+
+class MixedAudioClip(AudioClip):
+    """``CompositeAudioClip`` mixing the tracks of its clips, see the module."""
+
+    def __init__(self, clips, fps=44100):
+        self.clips = clips
+        duration = None
+        for clip in clips:
+            if clip.end is None:
+                duration = None
+                break
+            duration = max(clip.end, duration or 0)
+        super().__init__(duration=duration, fps=fps)
+        self.nchannels = NCHANNELS
+
+        # Taps of all the tracks, with their times on the timeline
+        self._taps = []
+        self._untracked = []
+        for clip in clips:
+            track = get_track(clip)
+            if track is None:
+                self._untracked.append(clip)
+                continue
+            for tap in track.taps:
+                # Played while the clip plays, ends included (Clip.is_playing)
+                start = max(clip.start + tap.start, clip.start)
+                end = clip.start + tap.end if clip.end is None else min(clip.start + tap.end, clip.end)
+                if start <= end:
+                    self._taps.append((clip.start, start, end, tap))
+        self._starts = np.array([start for _, start, _, _ in self._taps])
+        self._ends = np.array([end for _, _, end, _ in self._taps])
+        self._sources = {}
+        self._sources_lock = threading.Lock()
+
+    @property
+    def is_silent(self):
+        """Whether no clip plays any sample: the mix is not needed."""
+        return not self._untracked and all(tap.left == 0 and tap.right == 0 for _, _, _, tap in self._taps)
+
+    def frame_function(self, t):
+        if isinstance(t, np.ndarray):
+            return self._mix(t)
+        return self._mix(np.array([t]))[0]
+
+    def iter_chunks(self, chunksize=None, chunk_duration=None, fps=None, quantize=False, nbytes=2, logger=None):
+        # Same samples as AudioClip.iter_chunks, in larger blocks
+        fps = fps or self.fps
+        logger = proglog.default_bar_logger(logger)
+        self._prepare(fps)
+        total_size = int(fps * self.duration)
+        block_size = max(chunksize or 0, int((chunk_duration or 0) * fps), MIX_BLOCK_SIZE)
+        for first in logger.iter_bar(chunk=list(range(0, total_size, block_size))):
+            timings = (1.0 / fps) * np.arange(first, min(first + block_size, total_size))
+            yield self.to_soundarray(timings, nbytes=nbytes, quantize=quantize, fps=fps, buffersize=block_size)
+
+    def _mix(self, t):
+        sound = np.zeros((len(t), self.nchannels))
+        if len(t) == 0:
+            return sound
+        t_min, t_max = t.min(), t.max()
+        for index in np.flatnonzero((self._starts <= t_max) & (self._ends >= t_min)):
+            clip_start, start, end, tap = self._taps[index]
+            samples, duration = self._source(tap.filename, self.fps)
+            clip_time = t - clip_start
+            source_time = clip_time + tap.shift
+            frames = np.round(self.fps * source_time).astype(np.int64)
+            # Same range as FFMPEG_AudioReader.get_frame
+            playing = (t >= start) & (t <= end) & (source_time >= 0) & (source_time < duration) & (frames < len(samples))
+            if not playing.any():
+                continue
+            tap_sound = samples[frames[playing]] / 32768.0
+            if tap.envelopes:
+                tap_sound *= tap.gain(clip_time[playing])[:, None]
+            volume = np.prod([volume.value for volume in tap.volumes])
+            if tap.left != 1 or tap.right != 1 or volume != 1:
+                tap_sound *= (tap.left * volume, tap.right * volume)
+            sound[playing] += tap_sound
+        for clip in self._untracked:
+            part = clip.is_playing(t)
+            if part is not False:
+                sound += clip.get_frame(t - clip.start) * np.array([part]).T
+        return sound
+
+    def _prepare(self, fps):
+        # Sources decoded, then volumes measured, in parallel
+        filenames = {tap.filename for _, _, _, tap in self._taps}
+        volumes = {volume for _, _, _, tap in self._taps for volume in tap.volumes}
+        with ThreadPoolExecutor(max_workers=DECODE_THREADS) as executor:
+            list(executor.map(lambda filename: self._source(filename, fps), filenames))
+            list(executor.map(lambda volume: volume.value, volumes))
+
+    def _source(self, filename, fps):
+        with self._sources_lock:
+            source = self._sources.get((filename, fps))
+        if source is None:
+            source = (pcm_samples(filename, fps), POOL.infos(filename)["duration"])
+            with self._sources_lock:
+                self._sources[(filename, fps)] = source
+        return source
+
+
+def pcm_samples(filename, fps=44100):
+    """Samples of the audio of ``filename`` (stereo, 16 bit, at ``fps``), as a
+    memory map of its PCM file, decoded when missing."""
+    directory = os.environ.get(PCM_DIR_ENV) or DEFAULT_PCM_DIR
+    max_bytes = int(os.environ.get(PCM_CACHE_SIZE_ENV, DEFAULT_PCM_CACHE_SIZE)) * 1024 * 1024
+    cache = RenderCache(directory, max_bytes, extension=".pcm")
+
+    key = hashlib.sha256(json.dumps([PCM_VERSION, fps, list(file_signature(filename))]).encode()).hexdigest()
+    path = cache.get(key)
+    if not path:
+        temp_path = os.path.join(cache.directory, "%s.partial-%d-%d.pcm" % (key, os.getpid(), threading.get_ident()))
+        # Same decoding as FFMPEG_AudioReader, from the start of the file
+        subprocess.run([
+            FFMPEG_BINARY, "-y", "-loglevel", "error", "-i", filename, "-vn",
+            "-f", "s16le", "-acodec", "pcm_s16le", "-ar", str(fps), "-ac", str(NCHANNELS),
+            temp_path,
+        ], check=True)
+        try:
+            cache.put(key, temp_path)
+        finally:
+            os.remove(temp_path)
+        cache.evict()
+        path = cache.get(key) or temp_path
+    if os.path.getsize(path) == 0:
+        return np.zeros((0, NCHANNELS), dtype=np.int16)
+    return np.memmap(path, dtype=np.int16, mode="r").reshape(-1, NCHANNELS)
@@ -0,0 +1,184 @@
+"""Bitstream copy of the timeline spans that only show an untouched source video.
+
+The generator lists the timeline elements that are plain cuts of a source file
+(no option at all, on the element or on its sources). On the spans of the
+timeline where such an element is the only visible clip, the packets between
+two keyframes of the source can be copied as they are; only the frames before
+the first and after the last keyframe of the span go through the renderer.
+
+Only sources whose frames are decoded in the order they are shown are copied:
+with B-frames, or an open GOP whose first frames refer to the previous one, a
+cut at a keyframe doesn't hold the frames shown between the two keyframes.
+The number of frames of each copy is checked.
+
+The keyframes of a source are read from the media index of the UI (see
+``sources``) when it already lists them for this version of the file,
+otherwise they are listed here.
+"""
+import re
+import subprocess
+from collections import namedtuple
+from functools import lru_cache
+
+from moviepy.config import FFMPEG_BINARY
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+from .compositor import covers_frame, is_opaque
+from .sources import file_signature, indexed_media_info
+
+# The encoded parts are libx264/yuv420p, copied parts must use the same
+# codec and pixel format to be joined without re-encoding.
+COPYABLE_CODEC = "h264"
+COPYABLE_PIXEL_FORMAT = "yuv420p"
+
+# Shorter copies are not worth the extra ffmpeg processes.
+MIN_COPY_SECONDS = 2.0
+
+# Tolerance (in frames) when checking that a time falls on the frame grid.
+FRAME_EPSILON = 1e-3
+
+CopyRange = namedtuple("CopyRange", ["first", "last", "path", "source_start"])
+
+
+def plan_passthrough(final_video, passthrough, total_frames):
+    """Returns the ``CopyRange`` (in frames of the final video) that can be
+    copied from their source file, sorted by position in the timeline.
+
+    ``passthrough`` is a list of ``(clip, path, offset)``: a clip of
+    ``final_video`` playing ``path`` from ``offset`` seconds, untouched.
+    """
+    fps = final_video.fps
+    copy_ranges = []
+    for clip, path, offset in passthrough:
+        if not is_copyable(path, fps, tuple(final_video.size)):
+            continue
+
+        # Frame index in the source of the frame shown at timeline frame 0
+        source_shift = (offset - clip.start) * fps
+        if not _on_frame_grid(source_shift):
+            continue
+
+        for first, last in _uncovered_spans(final_video, clip, total_frames):
+            keyframes = [
+                round(t * fps - source_shift)
+                for t in keyframe_times(path)
+                if _on_frame_grid(t * fps) and first <= t * fps - source_shift + FRAME_EPSILON
+                and t * fps - source_shift - FRAME_EPSILON <= last
+            ]
+            if len(keyframes) < 2 or (keyframes[-1] - keyframes[0]) < MIN_COPY_SECONDS * fps:
+                continue
+            copy_ranges.append(CopyRange(keyframes[0], keyframes[-1], path, (keyframes[0] + source_shift) / fps))
+
+    return sorted(copy_ranges)
+
+
+def copy_part(copy_range, fps, part_path):
+    """Copies the packets of ``copy_range`` from its source into ``part_path``,
+    with the h264 parameter sets repeated in-band."""
+    cmd = [
+        FFMPEG_BINARY, "-y", "-loglevel", "error",
+        # Seek a quarter of a frame after the keyframe: with stream copy
+        # ffmpeg starts at the last keyframe before the requested time.
+        "-ss", "%.06f" % (copy_range.source_start + 0.25 / fps),
+        "-i", copy_range.path,
+        "-map", "0:v:0", "-frames:v", str(copy_range.last - copy_range.first),
+        "-c", "copy", "-bsf:v", "h264_mp4toannexb",
+        part_path,
+    ]
+    subprocess.run(cmd, check=True)
+    frames = len(_packet_times(part_path))
+    if frames != copy_range.last - copy_range.first:
+        raise RuntimeError("Copy of %s from %.3fs holds %d frames instead of %d" % (
+            copy_range.path, copy_range.source_start, frames, copy_range.last - copy_range.first))
+
+
+def is_copyable(path, fps, size):
+    """Checks that the frames of ``path`` can be used as they are in a video
+    of the given ``fps`` and ``size``."""
+    return _is_copyable(file_signature(path), fps, size)
+
+
+def keyframe_times(path):
+    """Presentation times (in seconds) of the keyframes of ``path``."""
+    signature = file_signature(path)
+    return _indexed_keyframe_times(signature) or _keyframe_times(signature)
+
+
+def _indexed_keyframe_times(signature):
+    keyframes = (indexed_media_info(signature) or {}).get("keyframes")
+    return tuple(keyframes) if keyframes else None
+
+
+# Cached by file signature: a file modified between two runs of the render
+# daemon is read again.
+@lru_cache(maxsize=None)
+def _is_copyable(signature, fps, size):
+    path = signature[0]
+    infos = ffmpeg_parse_infos(path)
+    if infos.get("video_rotation", 0) or abs(infos.get("video_fps", 0) - fps) > 1e-6:
+        return False
+    if tuple(infos.get("video_size") or ()) != size:
+        return False
+    codec, pixel_format = _video_stream_format(path)
+    if codec != COPYABLE_CODEC or pixel_format != COPYABLE_PIXEL_FORMAT:
+        return False
+    # A frame decoded after another one but shown before it (B-frames, open
+    # GOP): the packets between two keyframes are not the frames between them
+    times = _packet_times(path)
+    return all(earlier <= later for earlier, later in zip(times, times[1:]))
+
+
+@lru_cache(maxsize=None)
+def _keyframe_times(signature):
+    path = signature[0]
+    # Only keyframes are decoded, which is much faster than a full decode
+    cmd = [
+        FFMPEG_BINARY, "-hide_banner", "-skip_frame", "nokey", "-i", path,
+        "-map", "0:v:0", "-vf", "showinfo", "-f", "null", "-",
+    ]
+    output = subprocess.run(cmd, capture_output=True, text=True).stderr
+    return tuple(float(t) for t in re.findall(r"pts_time:\s*([\d.]+)", output))
+
+
+def _packet_times(path):
+    # Presentation times of the video packets, in decoding order, read
+    # without decoding them
+    cmd = [
+        FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-i", path,
+        "-map", "0:v:0", "-c", "copy", "-f", "framecrc", "-",
+    ]
+    output = subprocess.run(cmd, capture_output=True, text=True).stdout
+    return [int(line.split(",")[2]) for line in output.splitlines() if line and not line.startswith("#")]
+
+
+def _video_stream_format(path):
+    output = subprocess.run([FFMPEG_BINARY, "-hide_banner", "-i", path], capture_output=True, text=True).stderr
+    match = re.search(r"Stream #.*?Video: (\w+)[^,]*, (\w+)", output)
+    return match.groups() if match else (None, None)
+
+
+def _on_frame_grid(frames):
+    return abs(frames - round(frames)) < FRAME_EPSILON
+
+
+def _uncovered_spans(final_video, clip, total_frames):
+    """Frame spans where ``clip`` plays and no other clip is visible."""
+    fps = final_video.fps
+    spans = [(round(clip.start * fps), min(round(clip.end * fps), total_frames))]
+    # The clips below one covering the whole frame are hidden
+    below = covers_frame(clip, final_video.size, clip.start) and is_opaque(clip)
+    for other in final_video.clips:
+        if other is clip:
+            below = False
+            continue
+        if below:
+            continue
+        other_first = round(other.start * fps)
+        other_last = round(other.end * fps) if other.end is not None else total_frames
+        spans = [
+            piece
+            for first, last in spans
+            for piece in ((first, min(last, other_first)), (max(first, other_last), last))
+            if piece[1] > piece[0]
+        ]
+    return spans
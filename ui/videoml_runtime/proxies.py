@@ -0,0 +1,67 @@
+"""Low resolution copies of the source videos, read by the previews.
+
+Decoding a 1080p (or 4K) source costs the same whatever the size of the
+preview. The preview programs open their sources with ``proxy=True`` (see
+``sources.open_video``): their frames are read from a copy of the source
+fitting in ``PROXY_MAX_SIZE``, with a keyframe every second, made by the
+first preview that needs it. The audio is still read from the source.
+
+Proxies are kept in ``~/.cache/videoml/proxies`` (or the ``VIDEOML_PROXY_DIR``
+environment variable), by source file and modification time, and evicted
+least recently used first once they use more than ``VIDEOML_PROXY_CACHE_SIZE``
+megabytes.
+"""
+import hashlib
+import json
+import os
+import subprocess
+
+from moviepy.config import FFMPEG_BINARY
+
+from .cache import RenderCache
+from .events import stage
+from .sources import file_signature
+
+PROXY_DIR_ENV = "VIDEOML_PROXY_DIR"
+PROXY_CACHE_SIZE_ENV = "VIDEOML_PROXY_CACHE_SIZE"
+
+DEFAULT_PROXY_DIR = os.path.join(os.path.expanduser("~"), ".cache", "videoml", "proxies")
+# In megabytes
+DEFAULT_PROXY_CACHE_SIZE = 4096
+
+# Largest width and height of a proxy, the frame of a preview
+PROXY_MAX_SIZE = 640
+# Keyframes of the proxies, extracts are read from close to their start
+PROXY_KEYFRAME_SECONDS = 1
+
+# Bump when the settings of the proxies change
+PROXY_VERSION = 1
+
+
+def proxy_path(filename):
+    """Path of the proxy of ``filename``, made when missing."""
+    directory = os.environ.get(PROXY_DIR_ENV) or DEFAULT_PROXY_DIR
+    max_bytes = int(os.environ.get(PROXY_CACHE_SIZE_ENV, DEFAULT_PROXY_CACHE_SIZE)) * 1024 * 1024
+    cache = RenderCache(directory, max_bytes)
+
+    key = hashlib.sha256(json.dumps([PROXY_VERSION, PROXY_MAX_SIZE, list(file_signature(filename))]).encode()).hexdigest()
+    path = cache.get(key)
+    if path:
+        return path
+
+    temp_path = os.path.join(cache.directory, "%s.partial-%d.mkv" % (key, os.getpid()))
+    with stage("proxy"):
+        subprocess.run([
+            FFMPEG_BINARY, "-y", "-loglevel", "error", "-i", filename,
+            "-map", "0:v:0", "-an", "-sn", "-fps_mode", "passthrough",
+            "-vf", "scale=w=%d:h=%d:force_original_aspect_ratio=decrease:force_divisible_by=2" % (PROXY_MAX_SIZE, PROXY_MAX_SIZE),
+            "-c:v", "libx264", "-preset", "ultrafast", "-crf", "26", "-pix_fmt", "yuv420p",
+            "-force_key_frames", "expr:gte(t,n_forced*%d)" % PROXY_KEYFRAME_SECONDS,
+            temp_path,
+        ], check=True)
+    try:
+        cache.put(key, temp_path)
+    finally:
+        os.remove(temp_path)
+    cache.evict()
+    return cache.get(key) or filename
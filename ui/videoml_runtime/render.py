@@ -0,0 +1,481 @@
+"""Export of the final composition, optionally split across worker processes.
+
+The generated program ends with ``render_video(final_video, ...)``, or
+``render_audio(final_audio, ...)`` when it has no visual element. The timeline is cut into parts at clip boundaries (short spans are merged,
+long spans without any boundary are cut in chunks), and every part is
+written to its own file:
+
+* parts showing an untouched source video are copied from the source file
+  instead of being rendered (see ``passthrough``);
+* parts whose inputs did not change since a previous run are taken from the
+  render cache (see ``cache``);
+* the other parts are rendered in this process or, with more workers, by
+  fresh interpreters running the same program (or the warm workers of the
+  render daemon, see ``daemon``).
+
+The parts are written next to the output and kept when the render is
+cancelled or fails: running the program again only renders the missing
+parts (see ``checkpoint``).
+
+The parts are then joined with ffmpeg's concat demuxer, copying the streams
+without re-encoding.
+
+The progress and the time spent in each stage are reported as events for
+the UI when it asks for them (see ``events``).
+"""
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import proglog
+from moviepy.config import FFMPEG_BINARY
+from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+
+from .cache import RenderCache, part_key
+from .checkpoint import Checkpoint, copy_key, partial_path, program_key
+from .events import EVENTS_FD_ENV, STAGES, EventWriter, peak_rss, stage
+from .mixer import MixedAudioClip
+from .passthrough import copy_part, plan_passthrough
+
+WORKERS_ENV = "VIDEOML_WORKERS"
+SEGMENT_ENV = "VIDEOML_RENDER_SEGMENT"
+
+# Every part must be encoded with the same settings, otherwise the
+# concat demuxer can't join them without re-encoding.
+VIDEO_CODEC = "libx264"
+AUDIO_CODEC = "libmp3lame"
+# Copied and encoded parts have different h264 parameter sets: every part
+# repeats them in-band so that they can be joined without re-encoding.
+VIDEO_PARAMS = ["-bsf:v", "h264_mp4toannexb"]
+
+# x264 preset of the final videos, previews use a faster one
+DEFAULT_PRESET = "medium"
+
+# Spans of the timeline without any clip boundary are cut in parts of this
+# length, so that they can be shared between workers and cached separately.
+PART_SECONDS = 10
+
+# Shorter spans between clip boundaries are merged with the next ones: each
+# part opens its own encoder and starts with a keyframe.
+MIN_PART_SECONDS = 3
+
+
+def render_video(final_video, filename, program=None, workers=None, passthrough=(), render_inputs=(), fps=None, preset=None):
+    """Writes ``final_video`` to ``filename``.
+
+    ``program`` is the path of the generated program, needed to start the
+    worker processes. ``workers`` defaults to the ``VIDEOML_WORKERS``
+    environment variable, or 1. ``passthrough`` lists the clips that can be
+    copied from their source file, as ``(clip, path, offset)``, and
+    ``render_inputs`` the description of the inputs of the clips, as
+    ``(clip, inputs)``, used to find parts in the render cache. ``fps``
+    replaces the frame rate of ``final_video``, and ``preset`` the x264
+    preset (both are given by the preview programs).
+    """
+    if _render_handler is not None:
+        return _render_handler(
+            final_video, filename, program=program, workers=workers, passthrough=passthrough,
+            render_inputs=render_inputs, fps=fps, preset=preset,
+        )
+
+    preset = preset or DEFAULT_PRESET
+    segment = os.environ.get(SEGMENT_ENV)
+    if segment:
+        segment = json.loads(segment)
+        STAGES.reset()
+        _render_parts(final_video, segment["fps"], segment["preset"], segment["parts"], lambda: print(1, flush=True), _report_part)
+        return
+
+    if workers is None:
+        workers = int(os.environ.get(WORKERS_ENV, "1"))
+    if program is None:
+        workers = 1
+
+    # The stages of the program before the render (proxies made for a
+    # preview) are counted too, the render daemon resets them between runs
+    events = EventWriter()
+    started = time.monotonic()
+
+    if fps:
+        final_video = final_video.with_fps(fps)
+    if is_silent(final_video.audio):
+        # Nothing to hear, the video is written without audio
+        final_video = final_video.without_audio()
+    fps = final_video.fps
+    # Same frame count as moviepy's iter_frames, so that the parts hold
+    # exactly the frames of a plain write_videofile.
+    total_frames = int(final_video.duration * fps)
+    copy_ranges = plan_passthrough(final_video, passthrough, total_frames)
+
+    if program is None and not copy_ranges and not render_inputs:
+        events.emit("start", frames=total_frames, parts=1, workers=1)
+        final_video.write_videofile(filename, preset=preset, logger=_EventsBarLogger(events, started) if events.enabled else "bar")
+        events.emit("done", frames=total_frames, elapsed=time.monotonic() - started, stages=STAGES.snapshot(), peak_rss=peak_rss())
+        return
+
+    cache = RenderCache() if render_inputs else None
+    inputs_by_clip = {id(clip): inputs for clip, inputs in render_inputs}
+    encoding = [VIDEO_CODEC] + VIDEO_PARAMS + ([] if preset == DEFAULT_PRESET else ["-preset", preset])
+    copies = {copy_range.first: copy_range for copy_range in copy_ranges}
+
+    checkpoint = Checkpoint(filename)
+    fallback_key = program_key(program, render_inputs) if program else None
+    planned = []
+    for first, last in split_timeline(final_video, total_frames, copy_ranges):
+        if first in copies:
+            planned.append((first, last, None, copy_key(copies[first], fps)))
+            continue
+        key = part_key(final_video, first, last, inputs_by_clip, encoding) if cache else None
+        checkpoint_key = key or (fallback_key and "%s:%d:%d" % (fallback_key, first, last))
+        planned.append((first, last, key, checkpoint_key))
+
+    # Parts written by a previous run of the same render are kept
+    resumed = checkpoint.resume({_part_name(first): checkpoint_key for first, _, _, checkpoint_key in planned})
+
+    parts = []
+    rendered = []
+    copied = []
+    cached = set()
+    for first, last, key, _ in planned:
+        name = _part_name(first)
+        path = checkpoint.path(name)
+        parts.append((first, last, path))
+        if name in resumed:
+            continue
+        # Linked next to the other parts: the cache file can be evicted by
+        # another render before this one joins the parts
+        if key and cache.fetch(key, path):
+            cached.add(first)
+            continue
+        if first in copies:
+            copied.append((copies[first], path))
+        else:
+            rendered.append((first, last, path, key))
+
+    audio_path = checkpoint.path("audio.mp3") if final_video.audio is not None else None
+
+    resumed_frames = sum(last - first for first, last, _, _ in planned if _part_name(first) in resumed)
+    events.emit("start", frames=total_frames, parts=len(parts), workers=workers, resumed=resumed_frames)
+    progress = _ProgressAggregator(total_frames, len(rendered) + len(copied), events, started)
+    # Parts found in the cache or kept from a previous run are already done
+    progress.add(total_frames - sum(last - first for first, last, _, _ in rendered) - sum(r.last - r.first for r, _ in copied))
+    processes = []
+    jobs = _assign_jobs(rendered, workers)
+    with ThreadPoolExecutor(max_workers=len(jobs) + len(copied) + 1) as executor:
+        futures = [executor.submit(_copy_segment, copy_range, fps, path, progress) for copy_range, path in copied]
+        # The audio track is rendered once, in this process, while the
+        # video parts are encoded.
+        if audio_path:
+            futures.append(executor.submit(_write_audio, final_video.audio, audio_path))
+        try:
+            if workers > 1:
+                futures += [executor.submit(_run_segment_worker, program, job, fps, preset, progress, processes) for job in jobs]
+            else:
+                _render_parts(final_video, fps, preset, [part[:3] for part in rendered], lambda: progress.add(1), progress.add_part)
+            for future in futures:
+                future.result()
+        except BaseException:
+            # Cancelled (KeyboardInterrupt) or one part failed: stop the workers, the
+            # parts already written stay for the next run
+            for process in processes:
+                process.kill()
+            raise
+
+    durations = [(last - first) / fps for first, last, _ in parts]
+    with stage("join"):
+        concat_parts([path for _, _, path in parts], filename, audio_path, durations, checkpoint.directory)
+
+    if cache:
+        # Parts rendered by this run or by the previous ones
+        for (first, _, key, _), (_, _, path) in zip(planned, parts):
+            if key and first not in cached:
+                cache.put(key, path)
+        cache.evict()
+    checkpoint.remove()
+    progress.done()
+
+
+def render_audio(final_audio, filename):
+    """Writes ``final_audio`` to ``filename``: the export of the programs
+    without visual elements, which have no frame to render."""
+    if _render_handler is not None:
+        return _render_handler(None, filename, audio=final_audio)
+
+    events = EventWriter()
+    started = time.monotonic()
+    events.emit("start", frames=0, parts=1, workers=1)
+    with stage("audio"):
+        final_audio.write_audiofile(filename, codec=AUDIO_CODEC, logger=_EventsBarLogger(events, started) if events.enabled else "bar")
+    events.emit("done", frames=0, elapsed=time.monotonic() - started, stages=STAGES.snapshot(), peak_rss=peak_rss())
+
+
+def is_silent(audio):
+    """Whether ``audio`` is missing or plays nothing (see ``mixer``)."""
+    return audio is None or (isinstance(audio, MixedAudioClip) and audio.is_silent)
+
+
+def set_worker_launcher(launcher):
+    """Replaces the interpreters started for the parts rendered in parallel.
+
+    ``launcher(program, env)`` runs ``program`` with the environment ``env``
+    and returns a ``Popen``-like object (``stdout``, ``wait``, ``kill``).
+    """
+    global _launch_worker
+    _launch_worker = launcher
+
+
+def set_render_handler(handler):
+    """Replaces the render of ``render_video`` by ``handler``, called with
+    its arguments (None renders again). Returns the previous handler.
+    ``render_audio`` calls it with no final video and ``audio``.
+
+    Used to get the final video of a program without rendering it (see
+    ``frame_server``).
+    """
+    global _render_handler
+    previous = _render_handler
+    _render_handler = handler
+    return previous
+
+
+def split_timeline(final_video, total_frames, copy_ranges=()):
+    """Splits ``[0, total_frames)`` into parts.
+
+    Parts are cut around ``copy_ranges`` and at the clip starts and ends, so
+    that a change to one clip only invalidates the parts it plays in. Spans
+    between clip boundaries shorter than ``MIN_PART_SECONDS`` are merged with
+    the next ones, longer spans are cut every ``PART_SECONDS``.
+    """
+    fps = final_video.fps
+    boundaries = {0, total_frames}
+    for clip in final_video.clips:
+        for t in (clip.start, clip.end):
+            if t is not None:
+                boundaries.add(round(t * fps))
+    for copy_range in copy_ranges:
+        boundaries.update((copy_range.first, copy_range.last))
+    boundaries = sorted(
+        frame for frame in boundaries
+        if 0 <= frame <= total_frames and not any(r.first < frame < r.last for r in copy_ranges)
+    )
+
+    copy_firsts = {copy_range.first for copy_range in copy_ranges}
+    part_frames = max(1, round(PART_SECONDS * fps))
+    min_frames = min(part_frames, max(1, round(MIN_PART_SECONDS * fps)))
+    parts = []
+    cuts = []
+    for first, last in zip(boundaries, boundaries[1:]):
+        if first in copy_firsts:
+            parts.append((first, last))
+            continue
+        if not cuts:
+            cuts = [first]
+        while last - cuts[-1] > part_frames:
+            # The rest of the span stays at least min_frames long
+            cuts.append(cuts[-1] + min(part_frames, last - cuts[-1] - min_frames))
+        # The rendered spans end at a copy range or at the end of the timeline
+        is_end = last in copy_firsts or last == total_frames
+        if last - cuts[-1] >= min_frames:
+            cuts.append(last)
+        elif is_end:
+            # Too short: joined to the previous part when it stays short enough
+            if len(cuts) > 1 and last - cuts[-2] <= part_frames:
+                cuts[-1] = last
+            else:
+                cuts.append(last)
+        if is_end:
+            parts += list(zip(cuts, cuts[1:]))
+            cuts = []
+    return sorted(parts)
+
+
+def concat_parts(part_paths, filename, audio_path=None, durations=None, work_dir=None):
+    """Joins the video parts (and the audio track) by copying the streams.
+
+    ``durations`` (in seconds) are written in the concat list so that every
+    part starts exactly where the previous one ends. The list is written in
+    ``work_dir``, by default the directory of the first part.
+    """
+    list_path = os.path.join(work_dir or os.path.dirname(part_paths[0]), "parts.txt")
+    with open(list_path, "w") as list_file:
+        for i, path in enumerate(part_paths):
+            list_file.write("file '%s'\n" % path.replace("'", "'\\''"))
+            if durations:
+                list_file.write("duration %.06f\n" % durations[i])
+
+    cmd = [FFMPEG_BINARY, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_path]
+    if audio_path:
+        cmd += ["-i", audio_path, "-map", "0:v", "-map", "1:a"]
+    cmd += ["-c", "copy", filename]
+    subprocess.run(cmd, check=True)
+
+
+class _ProgressAggregator:
+    """Sums the frames written by every worker into one ``frame_index`` bar,
+    or into progress events when the UI asks for them."""
+
+    def __init__(self, total_frames, total_parts, events, started):
+        self._lock = threading.Lock()
+        self._done = 0
+        self._total_frames = total_frames
+        self._parts_done = 0
+        self._total_parts = total_parts
+        # Largest memory of the workers, reported with their parts
+        self._peak_rss = None
+        self._events = events
+        self._started = started
+        self._logger = None if events.enabled else proglog.default_bar_logger("bar")
+        if self._logger:
+            self._logger(frame_index__total=total_frames)
+
+    def add(self, frames):
+        if frames <= 0:
+            return
+        with self._lock:
+            self._done += frames
+            if self._logger:
+                self._logger(frame_index__index=self._done - 1)
+        self._emit(force=False)
+
+    def add_part(self, stages=None, rss=None):
+        """Counts a rendered or copied part, with the stage times and the
+        memory of the worker that rendered it."""
+        with self._lock:
+            self._parts_done += 1
+            if rss is not None:
+                self._peak_rss = max(self._peak_rss or 0, rss)
+        if stages:
+            STAGES.merge(stages)
+        self._emit(force=False)
+
+    def done(self):
+        self._emit(force=True)
+        self._events.emit(
+            "done", frames=self._total_frames, elapsed=time.monotonic() - self._started,
+            stages=STAGES.snapshot(), peak_rss=self._get_peak_rss(),
+        )
+
+    def _emit(self, force):
+        if not self._events.enabled:
+            return
+        with self._lock:
+            done, parts_done = self._done, self._parts_done
+        self._events.progress(
+            force=force, bar="frame_index", index=done, total=self._total_frames,
+            elapsed=time.monotonic() - self._started,
+            parts_done=parts_done, parts_queued=self._total_parts - parts_done,
+            stages=STAGES.snapshot(), peak_rss=self._get_peak_rss(),
+        )
+
+    def _get_peak_rss(self):
+        own = peak_rss()
+        if own is None or self._peak_rss is None:
+            return own if self._peak_rss is None else self._peak_rss
+        return max(own, self._peak_rss)
+
+
+class _EventsBarLogger(proglog.ProgressBarLogger):
+    """Progress bars of ``write_videofile`` (audio ``chunk`` then video
+    ``frame_index``) sent as progress events instead of being printed."""
+
+    def __init__(self, events, started):
+        super().__init__()
+        self._events = events
+        self._started = started
+
+    def bars_callback(self, bar, attr, value, old_value=None):
+        if attr != "index":
+            return
+        total = self.bars[bar].get("total")
+        if not total:
+            return
+        index = min(value + 1, total)
+        self._events.progress(
+            force=index >= total, bar=bar, index=index, total=total,
+            elapsed=time.monotonic() - self._started, stages=STAGES.snapshot(), peak_rss=peak_rss(),
+        )
+
+
+def _part_name(first):
+    return "part_%06d.mkv" % first
+
+
+def _assign_jobs(rendered, workers):
+    """Groups consecutive parts to render into at most ``workers`` jobs of
+    about the same number of frames."""
+    total = sum(last - first for first, last, _, _ in rendered)
+    jobs = []
+    done = 0
+    for first, last, path, _ in rendered:
+        if not jobs or (len(jobs) < workers and done >= total * len(jobs) / workers):
+            jobs.append([])
+        jobs[-1].append((first, last, path))
+        done += last - first
+    return jobs
+
+
+def _copy_segment(copy_range, fps, part_path, progress):
+    with stage("copy"):
+        copy_part(copy_range, fps, partial_path(part_path))
+        os.replace(partial_path(part_path), part_path)
+    progress.add(copy_range.last - copy_range.first)
+    progress.add_part()
+
+
+def _write_audio(audio, audio_path):
+    with stage("audio"):
+        audio.write_audiofile(audio_path, codec=AUDIO_CODEC, logger=None)
+
+
+def _report_part():
+    # Written by a worker after each part, next to the lines of its frames
+    print(json.dumps({"type": "part", "stages": STAGES.snapshot(), "peak_rss": peak_rss()}), flush=True)
+    STAGES.reset()
+
+
+def _run_segment_worker(program, parts, fps, preset, progress, processes):
+    env = dict(os.environ)
+    env[SEGMENT_ENV] = json.dumps({"fps": fps, "preset": preset, "parts": parts})
+    env.pop(WORKERS_ENV, None)
+    # The worker reports its stage times with its parts, on its output
+    env.pop(EVENTS_FD_ENV, None)
+
+    # The worker prints a line for every frame it has written, and one for every part
+    process = _launch_worker(program, env)
+    processes.append(process)
+    for line in process.stdout:
+        if line.strip() == "1":
+            progress.add(1)
+        elif line.startswith("{"):
+            report = json.loads(line)
+            progress.add_part(report.get("stages"), report.get("peak_rss"))
+    if process.wait() != 0:
+        raise RuntimeError("Rendering of frames %d to %d failed (exit code %d)" % (parts[0][0], parts[-1][1], process.returncode))
+
+
+def _spawn_worker(program, env):
+    return subprocess.Popen([sys.executable, program], env=env, stdout=subprocess.PIPE, text=True)
+
+
+_launch_worker = _spawn_worker
+_render_handler = None
+
+
+def _render_parts(final_video, fps, preset, parts, on_frame, on_part):
+    # Frames are requested by index rather than through subclipped(), so the
+    # parts line up exactly on the frame grid of the whole video.
+    # A part gets its name once whole, see ``checkpoint``
+    for first, last, part_path in parts:
+        with FFMPEG_VideoWriter(partial_path(part_path), final_video.size, fps, codec=VIDEO_CODEC, preset=preset, ffmpeg_params=VIDEO_PARAMS) as writer:
+            for index in range(first, last):
+                with stage("composite"):
+                    frame = final_video.get_frame(index / fps).astype("uint8")
+                with stage("encode"):
+                    writer.write_frame(frame)
+                on_frame()
+        os.replace(partial_path(part_path), part_path)
+        on_part()
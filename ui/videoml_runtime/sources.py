@@ -0,0 +1,421 @@
+"""Pool of the decoders of the source files.
+
+``open_video`` replaces ``moviepy.VideoFileClip`` in the generated programs.
+All the clips of one source file (at one resolution) share a single pooled
+reader: the file is probed once, and its frames are read by a few ffmpeg
+processes ("cursors") instead of one per clip. Each request is served by the
+cursor just behind the requested frame, so extracts playing at the same time
+from different positions of a source don't make a single process seek back
+and forth.
+
+Sources are decoded at the size they have in the final video: ffmpeg scales
+the frames while decoding, instead of a resize per frame in Python.
+
+Opening a source only probes it: the ffmpeg processes reading its frames and
+its audio are started by the first frame requested. The probe itself is
+skipped when the media index of the UI (the file named by the
+``VIDEOML_MEDIA_INDEX`` environment variable) lists this version of the file:
+its metadata are read from the index.
+
+The pool outlives a program run by the render daemon: the readers used by a
+run are kept open for the next one, as long as their file doesn't change.
+"""
+import copy
+import json
+import os
+from functools import lru_cache
+
+from moviepy.audio.AudioClip import AudioClip
+from moviepy.audio.io.AudioFileClip import AudioFileClip
+from moviepy.audio.io.readers import FFMPEG_AudioReader
+from moviepy.video.io.ffmpeg_reader import FFMPEG_VideoReader, ffmpeg_parse_infos
+from moviepy.video.io.VideoFileClip import VideoFileClip
+from moviepy.video.VideoClip import VideoClip
+
+from .audio_tracks import AudioTrack, set_track, subclipped_track
+from .events import stage
+
+# Number of ffmpeg processes reading one source at most
+MAX_CURSORS = 4
+
+# Same as FFMPEG_VideoReader: reading up to this many frames is cheaper
+# than seeking.
+MAX_SKIPPED_FRAMES = 100
+
+# Closest ffmpeg scaling to the one of moviepy's Resize (PIL's LANCZOS on
+# RGB frames): full chroma resolution and accurate rounding.
+RESIZE_ALGORITHM = "lanczos+accurate_rnd+full_chroma_int"
+
+# Index of the media files kept by the UI, see the module
+MEDIA_INDEX_ENV = "VIDEOML_MEDIA_INDEX"
+
+# Frame rates written rounded by ffmpeg (23.98 for 24000/1001...), corrected
+# like ffmpeg_parse_infos does
+NTSC_RATES = [23, 24, 25, 30, 50]
+
+
+class _Cursor(FFMPEG_VideoReader):
+    """``FFMPEG_VideoReader`` built from the infos of an earlier probe, whose
+    ffmpeg process is started by the first ``initialize``."""
+
+    def __init__(self, filename, infos, target_resolution=None, pixel_format="rgb24"):
+        # Same attributes as FFMPEG_VideoReader.__init__, without probing the
+        # file again nor starting the process
+        self.filename = filename
+        self.proc = None
+        self.infos = infos
+        self.fps = infos.get("video_fps", 1.0)
+        self.size = infos.get("video_size", (1, 1))
+        self.rotation = abs(infos.get("video_rotation", 0))
+        if self.rotation in [90, 270]:
+            self.size = [self.size[1], self.size[0]]
+        if target_resolution:
+            self.size = tuple(target_resolution)
+        self.resize_algo = RESIZE_ALGORITHM
+        self.duration = infos.get("video_duration", 0.0)
+        self.ffmpeg_duration = infos.get("duration", 0.0)
+        self.n_frames = infos.get("video_n_frames", 0)
+        self.bitrate = infos.get("video_bitrate", 0)
+        self.pixel_format = pixel_format
+        self.depth = 4 if pixel_format[-1] == "a" else 3
+        self.bufsize = self.depth * self.size[0] * self.size[1] + 100
+
+
+class PooledReader:
+    """Drop-in replacement for ``FFMPEG_VideoReader`` reading one source with
+    up to ``max_cursors`` ffmpeg processes, started when needed."""
+
+    def __init__(self, filename, infos, target_resolution=None, max_cursors=MAX_CURSORS):
+        self._template = _Cursor(filename, infos, target_resolution)
+        self.filename = filename
+        self.fps = self._template.fps
+        self.size = self._template.size
+        self.rotation = self._template.rotation
+        self.duration = self._template.duration
+        self.n_frames = self._template.n_frames
+        self.infos = infos
+        self.max_cursors = max_cursors
+        # Least recently used first
+        self._cursors = []
+
+    def get_frame(self, t):
+        with stage("decode"):
+            return self._get_frame(t)
+
+    def _get_frame(self, t):
+        # Frame position of a cursor after reading the frame at t, see
+        # FFMPEG_VideoReader.get_frame
+        pos = self.get_frame_number(t) + 1
+        candidates = [
+            cursor for cursor in self._cursors
+            if cursor.proc and cursor.pos <= pos <= cursor.pos + MAX_SKIPPED_FRAMES
+        ]
+        if candidates:
+            cursor = max(candidates, key=lambda candidate: candidate.pos)
+            self._cursors.remove(cursor)
+        elif len(self._cursors) < self.max_cursors:
+            cursor = copy.copy(self._template)
+        else:
+            cursor = self._cursors.pop(0)
+
+        self._cursors.append(cursor)
+        if not candidates:
+            cursor.initialize(t)
+            return cursor.last_read
+        return cursor.get_frame(t)
+
+    def get_frame_number(self, t):
+        return self._template.get_frame_number(t)
+
+    def close(self):
+        for cursor in self._cursors:
+            cursor.close()
+        self._cursors = []
+
+
+class _LazyAudioReader:
+    """Creates the ``FFMPEG_AudioReader`` of a file on the first frame
+    requested. Shared by the copies of a clip, like a reader."""
+
+    def __init__(self, filename, fps, nbytes, buffersize):
+        self.filename = filename
+        self.fps = fps
+        self.nbytes = nbytes
+        self.buffersize = buffersize
+        self._reader = None
+
+    def get_frame(self, t):
+        if self._reader is None:
+            self._reader = FFMPEG_AudioReader(self.filename, self.buffersize, fps=self.fps, nbytes=self.nbytes)
+        return self._reader.get_frame(t)
+
+    def close(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+
+class PooledAudioFileClip(AudioFileClip):
+    """``AudioFileClip`` from the infos of an earlier probe, whose ffmpeg
+    process is started by the first frame requested."""
+
+    def __init__(self, filename, infos, buffersize=200000, nbytes=2, fps=44100):
+        AudioClip.__init__(self)
+        self.filename = filename
+        self.fps = fps
+        self.duration = infos["duration"]
+        self.end = self.duration
+        # FFMPEG_AudioReader always reads stereo
+        self.nchannels = 2
+        self.buffersize = min(int(fps * self.duration) + 1, buffersize)
+        self.reader = _LazyAudioReader(filename, fps, nbytes, self.buffersize)
+        self.frame_function = lambda t: self.reader.get_frame(t)
+        set_track(self, AudioTrack.of_file(filename, self.duration))
+
+    def close(self):
+        # The readers belong to the pool, which outlives the clip
+        pass
+
+
+class SourcePool:
+    """Pooled readers, by file and resolution, and audio clips, by file.
+
+    Entries are keyed by the path and the signature of the file, a file
+    modified between two runs is probed and opened again.
+    """
+
+    def __init__(self):
+        self._readers = {}
+        self._audios = {}
+        self._infos = {}
+        # Keys of the readers and audio clips, and signatures of their files,
+        # used since the last release_unused()
+        self._used = set()
+        self._used_files = set()
+
+    def infos(self, filename):
+        """Result of ``ffmpeg_parse_infos`` for the file, read from the media
+        index when it lists the file, otherwise probed once."""
+        key = file_signature(filename)
+        if key not in self._infos:
+            self._infos[key] = _indexed_infos(key) or ffmpeg_parse_infos(filename, decode_file=False)
+        return self._infos[key]
+
+    def source_size(self, filename):
+        """Size of the frames of the source, once rotated."""
+        return tuple(_Cursor(filename, self.infos(filename)).size)
+
+    def reader(self, filename, target_resolution=None):
+        signature = file_signature(filename)
+        key = (signature, tuple(target_resolution) if target_resolution else None)
+        if key not in self._readers:
+            self._readers[key] = PooledReader(filename, self.infos(filename), target_resolution)
+        self._used.add(key)
+        self._used_files.add(signature)
+        return self._readers[key]
+
+    def audio(self, filename):
+        key = file_signature(filename)
+        if key not in self._audios:
+            self._audios[key] = PooledAudioFileClip(filename, self.infos(filename))
+        self._used.add(key)
+        self._used_files.add(key)
+        return self._audios[key]
+
+    def release_unused(self):
+        """Closes the readers and audio clips that were not used since the
+        previous call, the others stay open for the next run."""
+        for key in [key for key in self._readers if key not in self._used]:
+            self._readers.pop(key).close()
+        for key in [key for key in self._audios if key not in self._used]:
+            self._audios.pop(key).reader.close()
+        self._infos = {key: infos for key, infos in self._infos.items() if key in self._used_files}
+        self._used = set()
+        self._used_files = set()
+
+    def close(self):
+        for reader in self._readers.values():
+            reader.close()
+        for audio in self._audios.values():
+            audio.reader.close()
+        self._readers.clear()
+        self._audios.clear()
+        self._infos.clear()
+        self._used.clear()
+        self._used_files.clear()
+
+
+POOL = SourcePool()
+
+
+class PooledVideoFileClip(VideoFileClip):
+    """``VideoFileClip`` reading its frames and its audio from the pool.
+
+    The frames are read from ``frames_filename`` when given (a proxy of the
+    file, see ``proxies``).
+    """
+
+    def __init__(self, filename, audio=True, target_resolution=None, pool=POOL, frames_filename=None):
+        VideoClip.__init__(self)
+        self.reader = pool.reader(frames_filename or filename, target_resolution)
+        self.duration = self.reader.duration
+        self.end = self.reader.duration
+        self.fps = self.reader.fps
+        self.size = self.reader.size
+        self.rotation = self.reader.rotation
+        self.filename = filename
+        self.frame_function = lambda t: self.reader.get_frame(t)
+        if audio and pool.infos(filename)["audio_found"]:
+            self.audio = pool.audio(filename)
+
+    def time_transform(self, time_func, apply_to=None, keep_duration=False):
+        # Same as Clip.transform, without VideoClip.with_updated_frame_function
+        # decoding a frame to measure a size that a time change keeps
+        new_clip = self.copy()
+        new_clip.frame_function = lambda t: self.get_frame(time_func(t))
+        if not keep_duration:
+            new_clip.duration = None
+            new_clip.end = None
+        for attribute in [apply_to] if isinstance(apply_to, str) else apply_to or []:
+            attribute_value = getattr(new_clip, attribute, None)
+            if attribute_value is not None:
+                setattr(new_clip, attribute, attribute_value.time_transform(time_func, keep_duration=keep_duration))
+        return new_clip
+
+    def subclipped(self, start_time=0, end_time=None):
+        # The extract of the audio keeps the part of the track it plays, for
+        # the mixer (see audio_tracks)
+        clip = super().subclipped(start_time, end_time)
+        if self.audio is not None and clip.audio is not None:
+            subclipped_track(self.audio, clip.audio, start_time)
+        return clip
+
+    def close(self):
+        # The readers belong to the pool, which outlives the clip
+        pass
+
+
+def open_video(filename, audio=True, target_resolution=None, fit=None, size=None, proxy=False):
+    """Opens a source video through the pool of decoders.
+
+    With ``fit`` (a frame size), the video is decoded at the size the
+    generated programs give it: the frame size for a source of the same
+    aspect ratio, otherwise the width of the frame (landscape) or its height
+    (portrait), and centred. ``size`` forces the decoded size, the video is
+    still centred when its aspect ratio differs from the one of ``fit``.
+
+    With ``proxy``, the frames are read from a low resolution copy of the
+    file (see ``proxies``), scaled to the same size.
+    """
+    centered = False
+    source_size = None
+    if fit or size:
+        source_size = POOL.source_size(filename)
+        if fit:
+            centered = source_size[0] / source_size[1] != fit[0] / fit[1]
+        target_resolution = tuple(size) if size else fit_size(source_size, fit)
+        if target_resolution == source_size and not proxy:
+            target_resolution = None
+
+    frames_filename = None
+    if proxy:
+        # Imported here, proxies imports this module
+        from .proxies import proxy_path
+        frames_filename = proxy_path(filename)
+        target_resolution = target_resolution or source_size or POOL.source_size(filename)
+
+    clip = PooledVideoFileClip(filename, audio=audio, target_resolution=target_resolution, frames_filename=frames_filename)
+    if centered:
+        clip = clip.with_position("center", "center")
+    return clip
+
+
+def file_signature(filename):
+    """Absolute path, size and modification time of a file, which change
+    when the file is replaced."""
+    path = os.path.abspath(filename)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        # Reported by ffmpeg when the file is opened
+        return (path, None, None)
+    return (path, stat.st_size, stat.st_mtime_ns)
+
+
+def indexed_media_info(signature):
+    """Metadata of a file in the media index of the UI (see
+    ``electron/media-index.ts``), None when the index doesn't list this
+    version of the file."""
+    index_path = os.environ.get(MEDIA_INDEX_ENV)
+    if not index_path:
+        return None
+    try:
+        index_mtime = os.stat(index_path).st_mtime_ns
+    except OSError:
+        return None
+    path, size, mtime_ns = signature
+    entry = _media_index(index_path, index_mtime).get(path)
+    # Same version of the file: the index keeps the modification time in
+    # milliseconds, as a float
+    if not entry or entry.get("size") != size or mtime_ns is None or abs(entry.get("mtimeMs", 0) - mtime_ns / 1e6) > 1e-2:
+        return None
+    return entry.get("info")
+
+
+@lru_cache(maxsize=1)
+def _media_index(index_path, index_mtime):
+    # Read again when the UI saves it
+    try:
+        with open(index_path) as index_file:
+            return json.load(index_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _indexed_infos(signature):
+    # The keys of ffmpeg_parse_infos used by the runtime, from the media
+    # index. Rotated sources are still probed: ffmpeg_parse_infos only reads
+    # the rotation from the metadata of the stream, the index from its
+    # display matrix too.
+    info = indexed_media_info(signature)
+    if not info or info.get("duration") is None or info.get("rotation"):
+        return None
+    duration = info["duration"]
+    infos = {
+        "duration": duration,
+        "video_found": bool(info.get("videoCodec")),
+        "audio_found": bool(info.get("audioCodec")),
+        "video_n_frames": 0,
+        "video_duration": 0.0,
+    }
+    if infos["video_found"]:
+        fps = info.get("fps")
+        if not fps or not info.get("width") or not info.get("height"):
+            return None
+        for rate in NTSC_RATES:
+            if fps != rate and abs(fps - rate * 1000.0 / 1001.0) < 0.01:
+                fps = rate * 1000.0 / 1001.0
+        infos.update({
+            "video_fps": fps,
+            "video_size": [info["width"], info["height"]],
+            "video_bitrate": None,
+            "video_duration": duration,
+            "video_n_frames": int(duration * fps),
+        })
+    return infos
+
+
+def fit_size(source_size, frame_size):
+    """Size of a source resized like the generated programs do, see ``open_video``."""
+    width, height = source_size
+    if width / height == frame_size[0] / frame_size[1]:
+        return tuple(frame_size)
+    # Same rounding as moviepy's Resize
+    if width / height > 1:
+        return (frame_size[0], int(height * frame_size[0] / width))
+    return (int(width * frame_size[1] / height), frame_size[1])
+
+
+def open_audio(filename):
+    """Opens a source audio file through the pool of decoders."""
+    return POOL.audio(filename)
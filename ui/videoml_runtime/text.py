@@ -0,0 +1,156 @@
+"""Text and subtitle clips, rasterized once.
+
+A ``moviepy.TextClip`` of the frame size holds a full frame of pixels and a
+mask for a line of text, blended over the whole frame at every frame. The
+clips of ``text_clip`` only hold the pixels drawn by the text (the whole box
+with a background color), placed where ``TextClip`` draws them: the frames
+are the same, for a fraction of the memory and of the blending.
+
+Clips are kept by text, font, size, colors and box, so that the subtitles
+sharing a style and the texts of the previous renders of the daemon are not
+drawn again, in a cache of ``VIDEOML_TEXT_CACHE_SIZE`` megabytes. Fonts are
+loaded once per size.
+"""
+import functools
+import math
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from moviepy.video.VideoClip import ImageClip
+from PIL import Image, ImageDraw, ImageFont
+
+TEXT_CACHE_SIZE_ENV = "VIDEOML_TEXT_CACHE_SIZE"
+# In megabytes
+DEFAULT_TEXT_CACHE_SIZE = 128
+
+# Fonts kept loaded, by file and size
+FONT_CACHE_SIZE = 64
+
+# Defaults of moviepy.TextClip, the layout of its labels is reproduced
+INTERLINE = 4
+TEXT_ALIGN = "left"
+
+
+def text_clip(text, font, font_size, color, size, bg_color=None, position=("center", "center"), frame_size=None):
+    """Clip of ``text`` drawn as ``TextClip(text=..., font=..., font_size=...,
+    color=..., bg_color=..., size=size).with_position(position)`` on a frame
+    of ``frame_size`` (needed for the positions other than pixels)."""
+    clip, (left, top) = _CACHE.get((text, font, font_size, color, tuple(size), bg_color))
+    box_x, box_y = box_position(position, size, frame_size)
+    return clip.with_position((box_x + left, box_y + top))
+
+
+@functools.lru_cache(maxsize=FONT_CACHE_SIZE)
+def load_font(font, font_size):
+    """Font ``font`` at ``font_size``, loaded by the first text using it."""
+    try:
+        return ImageFont.truetype(font, font_size)
+    except Exception as error:
+        raise ValueError("Invalid font {}, pillow failed to use it with error {}".format(font, error)) from error
+
+
+def rasterize(text, font, font_size, color, size, bg_color=None):
+    """``ImageClip`` of the pixels drawn by a ``TextClip`` label of ``size``,
+    with their offset in its box."""
+    width, height = size
+    pil_font = load_font(font, font_size)
+    draw = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+
+    # Position of the text in the box, as in TextClip
+    left, top, right, bottom = draw.multiline_textbbox(
+        (0, 0), text, font=pil_font, spacing=INTERLINE, align=TEXT_ALIGN, anchor="lm",
+    )
+    text_width, text_height = int(right - left), int(bottom - top)
+    x = (width - text_width) / 2
+    y = (height - text_height) / 2 + text_height / 2
+
+    if bg_color is None:
+        # Only the pixels around the text, moved by whole pixels so that the
+        # glyphs are drawn with the same subpixel offsets
+        left, top, right, bottom = draw.multiline_textbbox(
+            (x, y), text, font=pil_font, spacing=INTERLINE, align=TEXT_ALIGN, anchor="lm",
+        )
+        box_left = min(max(math.floor(min(left, x)), 0), width)
+        box_top = min(max(math.floor(min(top, y)), 0), height)
+        box_right = max(min(math.ceil(right), width), box_left + 1)
+        box_bottom = max(min(math.ceil(bottom), height), box_top + 1)
+    else:
+        box_left, box_top, box_right, box_bottom = 0, 0, width, height
+
+    img = Image.new("RGBA", (box_right - box_left, box_bottom - box_top), color=bg_color or (0, 0, 0, 0))
+    ImageDraw.Draw(img).multiline_text(
+        xy=(x - box_left, y - box_top), text=text, fill=color, font=pil_font,
+        spacing=INTERLINE, align=TEXT_ALIGN, anchor="lm",
+    )
+
+    if bg_color is None:
+        # Down to the pixels the glyphs actually cover
+        bbox = img.getchannel("A").getbbox()
+        if bbox:
+            img = img.crop(bbox)
+            box_left += bbox[0]
+            box_top += bbox[1]
+    pixels = np.array(img)
+    if pixels[:, :, 3].min() == 255:
+        # Opaque background, no mask to blend (see compositor.is_opaque)
+        return ImageClip(pixels[:, :, :3]), (box_left, box_top)
+    return ImageClip(pixels), (box_left, box_top)
+
+
+class TextCache:
+    """Values of ``build`` (rasterized texts), by their arguments, evicted
+    least recently used first once their ``sizeof`` is more than ``max_bytes``."""
+
+    def __init__(self, max_bytes, build, sizeof):
+        self.max_bytes = max_bytes
+        self.build = build
+        self.sizeof = sizeof
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+        entry = self.build(*key)
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = entry
+                self._bytes += self.sizeof(entry)
+                while self._bytes > self.max_bytes and len(self._entries) > 1:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._bytes -= self.sizeof(evicted)
+        return entry
+
+
+def text_cache(build, sizeof):
+    """``TextCache`` of ``build``, sized by the ``VIDEOML_TEXT_CACHE_SIZE``
+    environment variable."""
+    return TextCache(int(os.environ.get(TEXT_CACHE_SIZE_ENV, DEFAULT_TEXT_CACHE_SIZE)) * 1024 * 1024, build, sizeof)
+
+
+def _clip_bytes(entry):
+    clip, _ = entry
+    return clip.img.nbytes + (clip.mask.img.nbytes if clip.mask is not None else 0)
+
+
+def box_position(position, size, frame_size):
+    """Pixel position of a box of ``size`` placed at ``position`` (pixels or
+    alignments) on a frame of ``frame_size``."""
+    # Same resolution of the position as compositor._blit_position
+    values = []
+    for value, dim, box_dim in zip(position, frame_size or (None, None), size):
+        if isinstance(value, str):
+            if dim is None:
+                raise ValueError("frame_size is needed to place a text at %r" % value)
+            value = {"left": 0, "top": 0, "center": (dim - box_dim) / 2, "right": dim - box_dim, "bottom": dim - box_dim}[value]
+        values.append(int(value))
+    return tuple(values)
+
+
+_CACHE = text_cache(rasterize, _clip_bytes)